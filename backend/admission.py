@@ -0,0 +1,248 @@
+"""Admission control in front of the LLM provider.
+
+Upstream calls draw from a token bucket refilled at ``rate`` calls per
+second. Callers wait in one queue ordered by priority class (tribunal
+turns, then Baize, then NPC chat) and arrival. A call is rejected at once
+with ``Overloaded`` when its class queue is full or its estimated wait is
+longer than the class allows, so the server can answer 429 with
+``Retry-After`` instead of timing out.
+
+The rate adapts AIMD-style to upstream throttling: a throttling error
+(429 / resource exhausted) halves it, at most once per ``cooldown``, and
+every success adds ``increase / rate``, so the rate climbs back by about
+``increase`` calls/s for each second of traffic.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from metrics import METRICS
+
+
+TRIBUNAL = 'tribunal'
+BAIZE = 'baize'
+NPC = 'npc'
+PRIORITY = {TRIBUNAL: 0, BAIZE: 1, NPC: 2}
+
+SITE_CLASSES = {
+    'pick_next_speaker': TRIBUNAL,
+    'generate_trial_line': TRIBUNAL,
+    'BaizeAgent': BAIZE,
+}
+
+DEFAULT_QUEUE_LIMITS = {TRIBUNAL: 64, BAIZE: 32, NPC: 16}
+DEFAULT_MAX_WAIT = {TRIBUNAL: 10.0, BAIZE: 5.0, NPC: 3.0}
+
+THROTTLE_MARKERS = ('429', 'resourceexhausted', 'resource exhausted', 'quota', 'rate limit',
+                    'too many requests')
+
+
+class Overloaded(Exception):
+    """Raised when a call is refused admission; retry_after is in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def site_class(site):
+    return SITE_CLASSES.get(site, NPC)
+
+
+def is_throttle(error):
+    """Whether an upstream error means we are being rate limited"""
+    text = f"{type(error).__name__} {error}".casefold()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+
+def parse_class_map(value, cast=float):
+    """'tribunal:64,npc:8' -> {'tribunal': 64, 'npc': 8}"""
+    result = {}
+    for part in (value or '').split(','):
+        if ':' in part:
+            name, number = part.split(':', 1)
+            if name.strip() in PRIORITY:
+                result[name.strip()] = cast(number)
+    return result
+
+
+class _Waiter:
+    def __init__(self, klass, future=None):
+        self.klass = klass
+        self.future = future
+        self.event = threading.Event() if future is None else None
+        self.granted = False
+        self.cancelled = False
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.future.get_loop().call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class QuotaScheduler:
+    """Priority token bucket with queue limits and AIMD rate control"""
+
+    def __init__(self, rate, burst=None, min_rate=0.1, queue_limits=None, max_wait=None,
+                 increase=1.0, decrease=0.5, cooldown=1.0):
+        self.rate = float(rate)
+        self.max_rate = float(rate)
+        self.min_rate = min(min_rate, self.rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.queue_limits = dict(DEFAULT_QUEUE_LIMITS, **(queue_limits or {}))
+        self.max_wait = dict(DEFAULT_MAX_WAIT, **(max_wait or {}))
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.tokens = self.burst
+        self.throttled = 0
+        self.rejected = {klass: 0 for klass in PRIORITY}
+        self._queued = {klass: 0 for klass in PRIORITY}
+        self._heap = []
+        self._seq = itertools.count()
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        """Grant queued waiters, best priority first, while tokens last"""
+        self._refill(time.monotonic())
+        while self._heap:
+            waiter = self._heap[0][2]
+            if not waiter.cancelled and self.tokens < 1:
+                return
+            heapq.heappop(self._heap)
+            if not waiter.cancelled:
+                self._queued[waiter.klass] -= 1
+                self.tokens -= 1
+                waiter.grant()
+
+    def _cancel(self, waiter):
+        if not waiter.granted and not waiter.cancelled:
+            waiter.cancelled = True
+            self._queued[waiter.klass] -= 1
+
+    def _next_token_delay(self):
+        return min(0.5, max(0.001, (1 - self.tokens) / self.rate))
+
+    def _reject(self, klass, reason, wait):
+        self.rejected[klass] += 1
+        METRICS.inc('moonlit_admission_rejected_total', {'class': klass, 'reason': reason})
+        retry_after = max(1, math.ceil(wait))
+        return Overloaded(f"LLM upstream overloaded ({klass} {reason}), retry in {retry_after}s", retry_after)
+
+    def _enqueue(self, waiter):
+        """Queue waiter and try to grant it; raises Overloaded instead of queueing too long"""
+        klass = waiter.klass
+        self._refill(time.monotonic())
+        ahead = sum(count for name, count in self._queued.items() if PRIORITY[name] <= PRIORITY[klass])
+        wait = max(0.0, (ahead + 1 - self.tokens) / self.rate)
+        if self._queued[klass] >= self.queue_limits[klass]:
+            raise self._reject(klass, 'queue_full', wait)
+        if wait > self.max_wait[klass]:
+            raise self._reject(klass, 'wait', wait)
+        heapq.heappush(self._heap, (PRIORITY[klass], next(self._seq), waiter))
+        self._queued[klass] += 1
+        self._dispatch()
+
+    def _expire(self, waiter, started):
+        """Give up on a waiter still queued past its class limit (priority starvation)"""
+        limit = self.max_wait[waiter.klass]
+        if waiter.granted or time.monotonic() - started <= limit:
+            return None
+        self._cancel(waiter)
+        return self._reject(waiter.klass, 'timeout', limit)
+
+    def acquire(self, klass, cancel=None):
+        """Block until a call of this class may go upstream.
+
+        Returns False if the cancel event is set while still queued; the
+        waiter gives up its place.
+        """
+        started = time.monotonic()
+        waiter = _Waiter(klass)
+        with self._lock:
+            self._enqueue(waiter)
+        while not waiter.event.wait(self._next_token_delay()):
+            with self._lock:
+                if cancel is not None and cancel.is_set() and not waiter.granted:
+                    self._cancel(waiter)
+                    self._dispatch()
+                    return False
+                self._dispatch()
+                error = self._expire(waiter, started)
+            if error:
+                raise error
+        METRICS.observe('moonlit_admission_wait_seconds', time.monotonic() - started, {'class': klass})
+        return True
+
+    def refund(self):
+        """Give back the token of an admitted call that never went upstream"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+            self._dispatch()
+
+    async def aacquire(self, klass):
+        """Async acquire; a cancelled caller gives its place (or token) back"""
+        started = time.monotonic()
+        waiter = _Waiter(klass, asyncio.get_running_loop().create_future())
+        with self._lock:
+            self._enqueue(waiter)
+        try:
+            while not waiter.future.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self._next_token_delay())
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._dispatch()
+                        error = self._expire(waiter, started)
+                    if error:
+                        raise error
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self.tokens = min(self.burst, self.tokens + 1)
+                self._cancel(waiter)
+                self._dispatch()
+            raise
+        METRICS.observe('moonlit_admission_wait_seconds', time.monotonic() - started, {'class': klass})
+
+    def record(self, error=None):
+        """Feed one upstream attempt's outcome into the AIMD rate"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if error is None:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            elif is_throttle(error):
+                self.throttled += 1
+                if now - self._last_decrease >= self.cooldown:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.tokens = min(self.tokens, 0.0)
+                    self._last_decrease = now
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate': round(self.rate, 3),
+                'max_rate': self.max_rate,
+                'tokens': round(self.tokens, 2),
+                'queued': dict(self._queued),
+                'rejected': dict(self.rejected),
+                'throttled': self.throttled
+            }
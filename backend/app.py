@@ -1,36 +1,289 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import asyncio
+import contextvars
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from copy import deepcopy
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dotenv import load_dotenv
+from llm import get_client, next_chunk, LLMCancelled, LLMError
+from admission import Overloaded
+from speakers import rank_speakers, schedule_speaker, SpeculationStats
+from store import EventStore
+from cluelog import ClueLog
+from sessions import SessionStore, valid_session_id
+from cache import CompletionCache
+from prompts import PromptBuilder, BuiltPrompt, BAIZE_PERSONA
+from lookup import CharacterIndex
+from retrieval import build_knowledge_index, discovered_doc, snippet_line, MEMORY, CLUE, DISCOVERED, EVENT
+from singleflight import SingleFlight, flight_key
+from fallback import FallbackBank, classify_situation, DEFAULT_BANK_PATH
+from summary import TranscriptSummarizer, parse_contradictions
+from verdict import trial_verdict
+from trials import TrialLog, turn_records, valid_trial_id
+import wire
+from httpcache import DocumentCache, cache_control, etag_matches
+from cluepool import CluePool
+from metrics import (METRICS, start_request_timing, stop_request_timing, record_request,
+                     server_timing_header, configure_timing_log)
 
 load_dotenv()
 
+class WireJSONProvider(DefaultJSONProvider):
+    """jsonify and request bodies through wire.py: orjson when installed, compact either way"""
+
+    def dumps(self, obj, **kwargs):
+        return wire.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return wire.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(wire.dumps(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = WireJSONProvider(app)
 CORS(app)  # Enable CORS for frontend requests
 
-# Initialize Gemini
-genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+
+configure_timing_log(os.environ.get('MOONLIT_TIMING_LOG', '').lower() in ('1', 'true', 'yes'))
+
+
+@app.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    g.llm_timings = start_request_timing()
+
+
+@app.after_request
+def finish_timing(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    timings = g.llm_timings
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method, status = request.method, response.status_code
+
+    def record():
+        record_request(route, method, status, time.perf_counter() - started, timings)
+        stop_request_timing()
+
+    if response.is_streamed:
+        # Streamed bodies are produced after this hook; record once the response is closed.
+        response.call_on_close(record)
+    else:
+        response.headers['Server-Timing'] = server_timing_header(timings, time.perf_counter() - started)
+        record()
+    return response
+
+
+COMPRESS_MIN_BYTES = int(os.environ.get('MOONLIT_COMPRESS_MIN_BYTES', '1024'))
+
+
+@app.after_request
+def compress_response(response):
+    """Gzip (or brotli) large JSON replies; streams are sent as they are"""
+    if (response.direct_passthrough or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    body, encoding = wire.compress(response.get_data(), request.headers.get('Accept-Encoding'),
+                                   COMPRESS_MIN_BYTES)
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def prompt_parts(prompt):
+    """(prefix, suffix) of a BuiltPrompt; plain strings have no prefix"""
+    if isinstance(prompt, BuiltPrompt):
+        return prompt.prefix, prompt.suffix
+    return '', prompt
+
+
+# Call sites whose identical concurrent prompts share one upstream call.
+# Chat is left out by default so simultaneous players can get varied replies.
+COALESCE_SITES = {
+    site.strip()
+    for site in os.environ.get('MOONLIT_COALESCE_SITES', 'pick_next_speaker,generate_trial_line').split(',')
+    if site.strip()
+}
+IN_FLIGHT = SingleFlight()
+
+
+def coalesce_key(client, site, prefix, suffix, coalesce):
+    """Single-flight key for the call, or None when it should go upstream alone"""
+    if not (site in COALESCE_SITES if coalesce is None else coalesce):
+        return None
+    return flight_key(client.name, client.model, prefix, suffix)
+
+
+def count_shared(site, shared):
+    if shared:
+        METRICS.inc('moonlit_llm_coalesced_total', {'site': site})
+
+
+def call_gemini(prompt, site='unknown', coalesce=None, cancel=None):
+    """Call the configured LLM provider with prompt.
+
+    site labels the call in metrics and decides whether identical
+    in-flight prompts are coalesced; coalesce=True/False overrides that.
+    A call with a cancel event goes upstream alone, so cancelling it
+    cannot fail callers sharing it; LLMCancelled is raised.
+    """
+    prefix, suffix = prompt_parts(prompt)
+    try:
+        client = get_client()
+        key = None if cancel is not None else coalesce_key(client, site, prefix, suffix, coalesce)
+        if key is None:
+            return client.generate(suffix, prefix=prefix, site=site, cancel=cancel).strip()
+        text, shared = IN_FLIGHT.do(key, lambda: client.generate(suffix, prefix=prefix, site=site))
+        count_shared(site, shared)
+        return text.strip()
+    except (Overloaded, LLMCancelled):
+        raise
+    except Exception as e:
+        return f"Error: {str(e)}"
 
 
-def call_gemini(prompt):
-    """Call Gemini API with prompt"""
+async def acall_gemini(prompt, site='unknown', coalesce=None):
+    """Async call to the configured LLM provider"""
+    prefix, suffix = prompt_parts(prompt)
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        client = get_client()
+        key = coalesce_key(client, site, prefix, suffix, coalesce)
+        if key is None:
+            return (await client.agenerate(suffix, prefix=prefix, site=site)).strip()
+        text, shared = await IN_FLIGHT.ado(key, lambda: client.agenerate(suffix, prefix=prefix, site=site))
+        count_shared(site, shared)
+        return text.strip()
+    except Overloaded:
+        raise
     except Exception as e:
         return f"Error: {str(e)}"
 
+
+async def astream_gemini(prompt, site='unknown'):
+    """Async stream of text chunks from the configured LLM provider; Overloaded is raised"""
+    prefix, suffix = prompt_parts(prompt)
+    try:
+        async for chunk in get_client().astream(suffix, prefix=prefix, site=site):
+            yield chunk
+    except LLMError as e:
+        yield f"Error: {str(e)}"
+
+
+def stream_gemini(prompt, site='unknown', cancel=None):
+    """Stream text chunks from the configured LLM provider; Overloaded is raised.
+
+    Stops, closing the upstream stream, at the first chunk after the
+    optional cancel event is set.
+    """
+    prefix, suffix = prompt_parts(prompt)
+    chunks = get_client().stream(suffix, prefix=prefix, site=site)
+    try:
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                return
+            yield chunk
+    except LLMError as e:
+        yield f"Error: {str(e)}"
+    finally:
+        chunks.close()
+
+
+# Admission happens before a stream's first chunk (retries re-admit only while
+# nothing has been yielded), so pulling that chunk inside the view turns a
+# refusal into a 429 before the 200 event stream opens.
+def prime_stream(chunks):
+    """Pull the first item of chunks now; returns an iterator over all of them"""
+    first = next(chunks, None)
+
+    def primed():
+        if first is not None:
+            yield first
+        yield from chunks
+    return primed()
+
+
+async def aprime_stream(chunks):
+    """Async prime_stream"""
+    first = await next_chunk(chunks)
+
+    async def primed():
+        try:
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+    return primed()
+
+
+RESPONSE_CACHE = CompletionCache(
+    max_entries=int(os.environ.get('MOONLIT_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('MOONLIT_CACHE_TTL', '3600')),
+    disk_dir=os.environ.get('MOONLIT_CACHE_DIR') or None
+)
+
+
+def completion_cache_key(prompt):
+    client = get_client()
+    return RESPONSE_CACHE.key(client.name, client.model, prompt)
+
+
+def is_error_reply(text):
+    return not text or text.startswith('Error:')
+
+
+def sse_event(name, payload):
+    """Format one Server-Sent Events frame"""
+    return f"event: {name}\ndata: {wire.dumps(payload).decode('utf-8')}\n\n"
+
+
+def overloaded_payload(e):
+    return {'error': str(e), 'success': False, 'retry_after': e.retry_after}
+
+
+def error_response(e):
+    """JSON error reply; admission rejections become 429 with Retry-After"""
+    if isinstance(e, Overloaded):
+        return jsonify(overloaded_payload(e)), 429, {'Retry-After': str(e.retry_after)}
+    return jsonify({'error': str(e), 'success': False}), 500
+
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 # Load characters data
 CHARACTERS_PATH = os.path.join(os.path.dirname(__file__), 'characters.json')
 with open(CHARACTERS_PATH, 'r', encoding='utf-8') as f:
     CHARACTERS = json.load(f)
 
+CHARACTER_INDEX = CharacterIndex(CHARACTERS)
+BAIZE_MAX_RECORDS = 3
+
+PROMPTS = PromptBuilder(CHARACTERS, budgets={
+    'persona': int(os.environ.get('MOONLIT_PROMPT_PERSONA_TOKENS', '400')),
+    'clues': int(os.environ.get('MOONLIT_PROMPT_CLUE_TOKENS', '600')),
+    'transcript': int(os.environ.get('MOONLIT_PROMPT_TRANSCRIPT_TOKENS', '800')),
+    'context': int(os.environ.get('MOONLIT_PROMPT_CONTEXT_TOKENS', '300')),
+    'summary': int(os.environ.get('MOONLIT_PROMPT_SUMMARY_TOKENS', '250'))
+})
+
 DISCOVERED_CLUES_PATH = os.path.join(os.path.dirname(__file__), 'discovered_clues.json')
+CLUE_LOG_PATH = os.path.join(os.path.dirname(__file__), 'discovered_clues.jsonl')
 EVENTS_PATH = os.path.join(os.path.dirname(__file__), 'events.json')
 
 NPC_PORTRAITS = {
@@ -50,68 +303,125 @@ def get_character_meta(npc_id):
     return CHARACTERS.get(npc_id, {})
 
 
-def append_discovered_clue(entry):
-    """Persist discovered clue to JSON log"""
-    log = []
-    if os.path.exists(DISCOVERED_CLUES_PATH):
-        try:
-            with open(DISCOVERED_CLUES_PATH, 'r', encoding='utf-8') as f:
-                log = json.load(f)
-        except json.JSONDecodeError:
-            log = []
+def append_discovered_clue(entry, session_id=None):
+    """Persist discovered clue to the session or the append-only clue log"""
+    if session_id:
+        SESSIONS.append_clue(session_id, entry)
+    else:
+        EVENT_STORE.append_clue(entry)
+        KNOWLEDGE.add(entry['text'], DISCOVERED, source=entry.get('area'))
 
-    log.append(entry)
-    with open(DISCOVERED_CLUES_PATH, 'w', encoding='utf-8') as f:
-        json.dump(log, f, ensure_ascii=False, indent=2)
 
+def reset_discovered_clues(session_id=None):
+    if session_id:
+        SESSIONS.reset_clues(session_id)
+    else:
+        EVENT_STORE.reset_clues()
+        KNOWLEDGE.remove_kind(DISCOVERED)
 
-def reset_discovered_clues():
-    with open(DISCOVERED_CLUES_PATH, 'w', encoding='utf-8') as f:
-        json.dump([], f, ensure_ascii=False, indent=2)
 
+CLUE_LOG = ClueLog(CLUE_LOG_PATH, export_path=DISCOVERED_CLUES_PATH)
+EVENT_STORE = EventStore(EVENTS_PATH, CLUE_LOG)
 
-def load_discovered_clues():
-    if os.path.exists(DISCOVERED_CLUES_PATH):
-        try:
-            with open(DISCOVERED_CLUES_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return []
-    return []
+CLUE_POOL_PATHS = [
+    os.path.join(os.path.dirname(__file__), '..', 'clues.json'),
+    os.path.join(os.path.dirname(__file__), '..', 'crime_clues.json')
+]
+KNOWLEDGE = build_knowledge_index(CHARACTERS, EVENT_STORE.events(), CLUE_POOL_PATHS, CLUE_LOG.read())
+CLUE_POOL = CluePool(*CLUE_POOL_PATHS)
 
+# Serialized characters, event lists and the clue pool, revalidated by ETag (httpcache.py).
+DOCUMENTS = DocumentCache()
+HTTP_MAX_AGE = int(os.environ.get('MOONLIT_HTTP_MAX_AGE', '0'))
+RETRIEVAL_K = int(os.environ.get('MOONLIT_RETRIEVAL_K', '4'))
 
-def load_events_data():
-    if not os.path.exists(EVENTS_PATH):
+# Pre-generated lines (fallback.py) served when a trial line misses its deadline.
+FALLBACK = FallbackBank.load(os.environ.get('MOONLIT_FALLBACK_BANK', DEFAULT_BANK_PATH))
+FALLBACK_DEADLINE = float(os.environ.get('MOONLIT_FALLBACK_DEADLINE', '6'))
+_deadline_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='deadline')
+
+
+SESSIONS = SessionStore(
+    max_sessions=int(os.environ.get('MOONLIT_SESSION_MAX', '1000')),
+    idle_ttl=float(os.environ.get('MOONLIT_SESSION_TTL', '3600')),
+    spill_dir=os.environ.get('MOONLIT_SESSION_SPILL_DIR') or None
+)
+
+
+def find_contradictions(memory, turns):
+    """Contradictions among turns (or with memory); none when the upstream is busy"""
+    try:
+        reply = call_gemini(PROMPTS.contradictions(memory, turns), site='summarize_transcript')
+    except Overloaded:
         return []
+    return parse_contradictions(reply)
 
-    with open(EVENTS_PATH, 'r', encoding='utf-8') as f:
-        raw_events = json.load(f)
-
-    discovered = load_discovered_clues()
-    events = []
-    for event in raw_events:
-        event_copy = deepcopy(event)
-        raw_clues = event_copy.get('p_clues', [])
-        resolved_clues = []
-        placeholder_found = False
-        for entry in raw_clues:
-            if isinstance(entry, str) and entry == 'discovered_clues.json':
-                placeholder_found = True
-            else:
-                resolved_clues.append(entry)
-        if placeholder_found:
-            resolved_clues = discovered
-        event_copy['p_clues'] = resolved_clues
-        event_copy['game_logs'] = event_copy.get('game_logs', [])
-        events.append(event_copy)
-    return events
-
-
-def get_event_by_id(event_id):
-    for event in load_events_data():
-        if event.get('id') == event_id:
-            return event
-    return None
+
+# Rolling memory of session trials longer than the prompt's transcript window.
+SUMMARIES = TranscriptSummarizer(
+    CHARACTER_INDEX.find,
+    contradict=find_contradictions if os.environ.get('MOONLIT_SUMMARY_CONTRADICTIONS', '1').lower()
+    in ('1', 'true', 'yes') else None,
+    every=int(os.environ.get('MOONLIT_SUMMARY_EVERY', '4')),
+    max_trials=int(os.environ.get('MOONLIT_SESSION_MAX', '1000'))
+)
+
+
+# Event-sourced log of every trial opened through /api/tribunal/trial (see trials.py).
+TRIALS = TrialLog(
+    os.environ.get('MOONLIT_TRIAL_DIR') or os.path.join(os.path.dirname(__file__), 'trials'),
+    snapshot_every=int(os.environ.get('MOONLIT_TRIAL_SNAPSHOT_EVERY', '50')),
+    fsync=os.environ.get('MOONLIT_TRIAL_FSYNC', '1').lower() in ('1', 'true', 'yes')
+)
+
+
+def extend_session_transcript(session_id, event_id, entries):
+    """Append lines to a session transcript and feed them to its rolling memory"""
+    SESSIONS.extend_transcript(session_id, event_id, entries)
+    SUMMARIES.observe((session_id, event_id), entries)
+
+
+def with_trial_memory(event, history, memory_key=None):
+    """Per-request copy of event carrying the memory of turns before the prompt window"""
+    memory = SUMMARIES.memory_lines(memory_key, event, history)
+    return dict(event, trial_memory=memory) if memory else event
+
+
+def get_session_id(data=None):
+    """Session id from the X-Session-Id header, query string or JSON body"""
+    session_id = (
+        request.headers.get('X-Session-Id')
+        or request.args.get('session_id')
+        or (data or {}).get('session_id')
+    )
+    return session_id if valid_session_id(session_id) else None
+
+
+def retrieve_snippets(query, kinds, owner=None, session_id=None, exclude=None):
+    """Top-k knowledge lines for query; a session's clues stand in for the shared log"""
+    extra = None
+    if session_id and DISCOVERED in kinds:
+        kinds = kinds - {DISCOVERED}
+        extra = [discovered_doc(entry) for entry in SESSIONS.clues(session_id)]
+    docs = KNOWLEDGE.search(query, k=RETRIEVAL_K, kinds=kinds, owner=owner, extra=extra, exclude=exclude)
+    return [snippet_line(doc) for doc in docs]
+
+
+def load_discovered_clues(session_id=None):
+    if session_id:
+        return SESSIONS.clues(session_id)
+    return EVENT_STORE.clues()
+
+
+def load_events_data():
+    """Resolved events from the shared store; treat as read-only"""
+    return EVENT_STORE.events()
+
+
+def get_event_by_id(event_id, session_id=None):
+    if session_id:
+        return EVENT_STORE.get_with_clues(event_id, SESSIONS.clues(session_id))
+    return EVENT_STORE.get(event_id)
 
 
 def sanitize_history(history):
@@ -130,140 +440,311 @@ def history_to_text(history):
     return "\n".join(f"{item['speaker']}: {item['text']}" for item in history)
 
 
-def pick_next_speaker(event, history):
-    transcript = history_to_text(history[-8:])
+def parse_speaker_choice(response, event, history):
+    """Map a moderator reply to a roster id, falling back to the rule scheduler"""
     npc_list = event.get('npcs', [])
-    roster = ", ".join(npc_list)
     last_speaker = history[-1]['speaker'] if history else None
-    prompt = f"""
-You are Monokuma-style moderator of the Moonlit Tribunal "{event['name']}".
-Recent dialogue:
-{transcript or 'No dialogue yet.'}
-
-Available speakers (mythic suspects): {roster}.
-
-Rules:
-- Rotate speakers dramatically; avoid the same NPC twice.
-- Prioritize characters recently accused or mentioned.
-- If the Judge just spoke, pick the NPC they pressured.
-
-Respond ONLY with the id of your selection.
-"""
-    response = call_gemini(prompt).lower()
+    response = response.lower()
     last_idx = -1
-    choice = npc_list[0] if npc_list else None
+    choice = None
     for npc in npc_list:
         idx = response.rfind(npc.lower())
         if idx > last_idx:
             last_idx = idx
             choice = npc
+    if choice is None:
+        return schedule_speaker(event, history, CHARACTERS)
     if choice == last_speaker and len(npc_list) > 1:
         choice = npc_list[(npc_list.index(choice) + 1) % len(npc_list)]
     return choice
 
 
-def generate_trial_line(event, speaker, history):
-    transcript = history_to_text(history[-10:])
-    clues_text = "\n".join(f"- {clue.get('text')}" for clue in event.get('p_clues', []) if clue.get('text'))
-    meta = get_character_meta(speaker)
-    persona = meta.get('system_prompt', '')
-    emotion = meta.get('emotion_state', 'neutral')
-    abilities = ", ".join(meta.get('abilities', []))
-
-    prompt = f"""
-You are {speaker}, a Shan Hai Jing entity in a Danganronpa-style showdown.
-Persona: {persona}
-Emotion cue: {emotion}
-Signature abilities: {abilities or 'unknown'}
-
-Case: {event['name']}
-Description: {event['description']}
-Unlocked clues:
-{clues_text or '- (none)'}
-
-Last exchanges:
-{transcript or 'No conversation yet.'}
-
-Speak in 1-3 short sentences (≤80 words). Reference a clue or emotion when possible.
-If accused, defend; if another NPC was mentioned, react sharply. End with tension.
-"""
-    response = call_gemini(prompt).strip()
-    if not response:
-        response = "..."
-    return response
+def uses_rule_scheduler(event):
+    return event.get('scheduler', 'llm') == 'rules'
+
+
+def build_moderator_prompt(event, history):
+    return PROMPTS.moderator(event, history)
+
+
+def call_with_deadline(prompt, site, cancel=None):
+    """call_gemini bounded by FALLBACK_DEADLINE; None if the deadline passes first.
+
+    The upstream call is left to finish in the background.
+    """
+    if FALLBACK_DEADLINE <= 0:
+        return call_gemini(prompt, site=site, cancel=cancel)
+    future = submit_in_context(_deadline_pool, call_gemini, prompt, site, None, cancel)
+    try:
+        return future.result(timeout=FALLBACK_DEADLINE)
+    except FutureTimeout:
+        return None
+
+
+async def acall_with_deadline(prompt, site):
+    task = asyncio.ensure_future(acall_gemini(prompt, site=site))
+    if FALLBACK_DEADLINE <= 0:
+        return await task
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), FALLBACK_DEADLINE)
+    except asyncio.TimeoutError:
+        return None
+
+
+def count_fallback(kind, reason):
+    METRICS.inc('moonlit_fallback_total', {'kind': kind, 'reason': reason})
+
+
+def moderator_choice(response, event, history):
+    """Speaker for a moderator reply; None (missed deadline) falls back to the rules"""
+    if response is None:
+        count_fallback('speaker', 'deadline')
+        return schedule_speaker(event, history, CHARACTERS)
+    return parse_speaker_choice(response, event, history)
+
+
+def pick_next_speaker(event, history):
+    if uses_rule_scheduler(event):
+        return schedule_speaker(event, history, CHARACTERS)
+    try:
+        response = call_with_deadline(build_moderator_prompt(event, history), 'pick_next_speaker')
+    except Overloaded:
+        count_fallback('speaker', 'overloaded')
+        return schedule_speaker(event, history, CHARACTERS)
+    return moderator_choice(response, event, history)
+
+
+async def apick_next_speaker(event, history):
+    if uses_rule_scheduler(event):
+        return schedule_speaker(event, history, CHARACTERS)
+    try:
+        response = await acall_with_deadline(build_moderator_prompt(event, history), 'pick_next_speaker')
+    except Overloaded:
+        count_fallback('speaker', 'overloaded')
+        return schedule_speaker(event, history, CHARACTERS)
+    return moderator_choice(response, event, history)
+
+
+def build_trial_line_prompt(event, speaker, history):
+    """Budgeted trial prompt; ``.text`` is sent, ``.usage`` holds token counts"""
+    query = " ".join(item['text'] for item in history[-3:]) or event.get('name', '')
+    unlocked = {clue.get('text') for clue in event.get('p_clues', []) if isinstance(clue, dict)}
+    snippets = retrieve_snippets(query, {MEMORY, CLUE}, owner=speaker, exclude=unlocked)
+    return PROMPTS.trial_line(event, speaker, history, snippets)
+
+
+def fallback_line(speaker, history, reason):
+    """Bank line for speaker's situation, or None when the bank has none"""
+    situation = classify_situation(speaker, history, CHARACTER_INDEX.find)
+    line = FALLBACK.pick(speaker, situation, history)
+    if line:
+        count_fallback('line', reason)
+    return line
+
+
+def settle_trial_line(speaker, history, response, reason=None):
+    """Final line text: missed, failed or refused calls are replaced from the bank"""
+    if response is None or is_error_reply(response.strip()):
+        line = fallback_line(speaker, history, reason or ('deadline' if response is None else 'error'))
+        if line:
+            return line
+    return (response or '').strip() or "..."
+
+
+def generate_trial_line(event, speaker, history, cancel=None):
+    """Return (line, prompt_tokens) for speaker's next tribunal line.
+
+    LLMCancelled is raised if cancel is set before the call goes upstream.
+    """
+    prompt = build_trial_line_prompt(event, speaker, history)
+    if not FALLBACK.has(speaker):
+        response = call_gemini(prompt, site='generate_trial_line', cancel=cancel)
+        return settle_trial_line(speaker, history, response), prompt.usage
+    try:
+        response = call_with_deadline(prompt, 'generate_trial_line', cancel)
+    except Overloaded:
+        return settle_trial_line(speaker, history, None, 'overloaded'), prompt.usage
+    return settle_trial_line(speaker, history, response), prompt.usage
+
+
+async def agenerate_trial_line(event, speaker, history):
+    prompt = build_trial_line_prompt(event, speaker, history)
+    if not FALLBACK.has(speaker):
+        response = await acall_gemini(prompt, site='generate_trial_line')
+        return settle_trial_line(speaker, history, response), prompt.usage
+    try:
+        response = await acall_with_deadline(prompt, 'generate_trial_line')
+    except Overloaded:
+        return settle_trial_line(speaker, history, None, 'overloaded'), prompt.usage
+    return settle_trial_line(speaker, history, response), prompt.usage
+
+
+def stream_trial_line(prompt, speaker, history):
+    """Trial line chunks; a bank line stands in if the first chunk misses the deadline or fails.
+
+    A stream that misses the deadline is cancelled and closed on the pool
+    thread as soon as its first chunk arrives, freeing its LLM slot.
+    """
+    cancel = threading.Event()
+    chunks = stream_gemini(prompt, site='generate_trial_line', cancel=cancel)
+    if not FALLBACK.has(speaker) or FALLBACK_DEADLINE <= 0:
+        yield from chunks
+        return
+    first = submit_in_context(_deadline_pool, next, chunks, None)
+    try:
+        chunk = first.result(timeout=FALLBACK_DEADLINE)
+    except FutureTimeout:
+        cancel.set()
+        first.add_done_callback(lambda _: chunks.close())  # runs at once if next already returned
+        yield settle_trial_line(speaker, history, None)
+        return
+    except Overloaded:
+        yield settle_trial_line(speaker, history, None, 'overloaded')
+        return
+    if chunk is None or is_error_reply(chunk.strip()):
+        yield settle_trial_line(speaker, history, chunk)
+        return
+    yield chunk
+    yield from chunks
+
+
+async def astream_trial_line(prompt, speaker, history):
+    chunks = astream_gemini(prompt, site='generate_trial_line')
+    if not FALLBACK.has(speaker) or FALLBACK_DEADLINE <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+    try:
+        chunk = await asyncio.wait_for(next_chunk(chunks), FALLBACK_DEADLINE)
+    except asyncio.TimeoutError:
+        yield settle_trial_line(speaker, history, None)
+        return
+    except Overloaded:
+        yield settle_trial_line(speaker, history, None, 'overloaded')
+        return
+    if chunk is None or is_error_reply(chunk.strip()):
+        yield settle_trial_line(speaker, history, chunk)
+        return
+    yield chunk
+    async for chunk in chunks:
+        yield chunk
 
 
 def get_npc_portrait(npc_id):
     return NPC_PORTRAITS.get(npc_id, f'images/{npc_id}.png')
 
-class BaizeAgent:
+class ChatAgent:
+    """Shared respond/stream behaviour; subclasses implement build_prompt.
+
+    Replies go through RESPONSE_CACHE, and ``cache_hit`` records whether
+    the last reply was served from it. ``prompt_tokens`` holds the section
+    token estimates of the last prompt built. Prompts are grounded with
+    KNOWLEDGE snippets of ``knowledge_kinds``; the agent's own memories
+    are only visible to an agent with a matching ``npc_id``.
+    """
+    cache_hit = False
+    prompt_tokens = None
+    npc_id = None
+    session_id = None
+    knowledge_kinds = frozenset({CLUE, DISCOVERED, EVENT})
+
+    def retrieve(self, player_input, conversation_history=None):
+        """Knowledge lines relevant to the message and the last exchange"""
+        recent = conversation_history[-1:] if isinstance(conversation_history, list) else []
+        query = " ".join([player_input] + [msg.get('text', '') for msg in recent if isinstance(msg, dict)])
+        return retrieve_snippets(query, self.knowledge_kinds, self.npc_id, self.session_id)
+
+    def prepare_prompt(self, player_input, conversation_history=None):
+        prompt = self.build_prompt(player_input, conversation_history)
+        self.prompt_tokens = prompt.usage
+        return prompt
+
+    def respond(self, player_input, conversation_history=None):
+        """Generate response to player input"""
+        prompt = self.prepare_prompt(player_input, conversation_history)
+        key = completion_cache_key(prompt.text)
+        cached = RESPONSE_CACHE.get(key)
+        self.cache_hit = cached is not None
+        if cached is not None:
+            return cached
+        response = call_gemini(prompt, site=type(self).__name__)
+        if not is_error_reply(response):
+            RESPONSE_CACHE.set(key, response)
+        return response
+
+    def stream(self, player_input, conversation_history=None):
+        """Stream response chunks to player input"""
+        prompt = self.prepare_prompt(player_input, conversation_history)
+        key = completion_cache_key(prompt.text)
+        cached = RESPONSE_CACHE.get(key)
+        self.cache_hit = cached is not None
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in stream_gemini(prompt, site=type(self).__name__):
+            chunks.append(chunk)
+            yield chunk
+        response = "".join(chunks).strip()
+        if not is_error_reply(response):
+            RESPONSE_CACHE.set(key, response)
+
+    async def arespond(self, player_input, conversation_history=None):
+        """Async respond for the ASGI server"""
+        prompt = self.prepare_prompt(player_input, conversation_history)
+        key = completion_cache_key(prompt.text)
+        cached = RESPONSE_CACHE.get(key)
+        self.cache_hit = cached is not None
+        if cached is not None:
+            return cached
+        response = await acall_gemini(prompt, site=type(self).__name__)
+        if not is_error_reply(response):
+            RESPONSE_CACHE.set(key, response)
+        return response
+
+    async def astream(self, player_input, conversation_history=None):
+        """Async stream for the ASGI server"""
+        prompt = self.prepare_prompt(player_input, conversation_history)
+        key = completion_cache_key(prompt.text)
+        cached = RESPONSE_CACHE.get(key)
+        self.cache_hit = cached is not None
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in astream_gemini(prompt, site=type(self).__name__):
+            chunks.append(chunk)
+            yield chunk
+        response = "".join(chunks).strip()
+        if not is_error_reply(response):
+            RESPONSE_CACHE.set(key, response)
+
+    def cache_info(self):
+        info = {'hit': self.cache_hit}
+        info.update(RESPONSE_CACHE.stats())
+        return info
+
+
+class BaizeAgent(ChatAgent):
     """Baize (cat companion) agent"""
     def __init__(self):
         self.name = "baize"
-        self.persona = (
-            "You are Baize, a mythical beast from the Classic of Mountains and Seas.\n"
-            "You are calm, wise, and kind. You serve as a mentor and pet companion to the player, "
-            "offering guidance, small talk, and insights about the world and its creatures.\n"
-            "You never lie. If you don't know something, say so honestly but comfortingly.\n"
-            "Keep responses brief and conversational (2-4 sentences)."
-        )
+        self.persona = BAIZE_PERSONA
 
     def retrieve_character_info(self, query):
-        """Retrieve character info from database"""
-        match_name = None
-        for char_id, data in CHARACTERS.items():
-            if char_id.lower() in query.lower() or data["name"].lower() in query.lower():
-                match_name = char_id
-                break
-
-        if not match_name:
-            return None, None
-
-        char = CHARACTERS[match_name]
-        info = f"""
-        **{char['name']}**
-        Appearance: {char.get('appearance')}
-        Abilities: {', '.join(char.get('abilities', []))}
-        Emotion: {char.get('emotion_state')}
-        Description: {char.get('system_prompt')}
-        """
-        return match_name, info.strip()
-
-    def respond(self, player_input, conversation_history=None):
-        """Generate response to player input"""
-        match_name, info = self.retrieve_character_info(player_input)
-
-        # Build context from conversation history
-        history_context = ""
-        if conversation_history and len(conversation_history) > 0:
-            recent = conversation_history[-3:]  # Last 3 exchanges
-            history_context = "Recent conversation:\n"
-            for msg in recent:
-                role = msg.get('role', 'unknown')
-                text = msg.get('text', '')
-                history_context += f"{role}: {text}\n"
-
-        if match_name and info:
-            prompt = (
-                f"{self.persona}\n\n"
-                f"{history_context}\n"
-                f"The player just asked about '{match_name}'. "
-                f"Here is the factual record from the ancient book:\n{info}\n\n"
-                f"Player's message: {player_input}\n\n"
-                f"Please explain this to the player in your own gentle, wise tone."
-            )
-        else:
-            prompt = (
-                f"{self.persona}\n\n"
-                f"{history_context}\n"
-                f"Player says: {player_input}\n\n"
-                f"Respond as Baize — friendly, reflective, and concise (2–4 sentences)."
-            )
+        """(npc_id, info_block) for each character mentioned in query, first mention first"""
+        return CHARACTER_INDEX.lookup(query)[:BAIZE_MAX_RECORDS]
 
-        return call_gemini(prompt)
+    def build_prompt(self, player_input, conversation_history=None):
+        """Assemble the Baize prompt for a player message"""
+        records = self.retrieve_character_info(player_input)
+        snippets = self.retrieve(player_input, conversation_history)
+        return PROMPTS.baize_chat(player_input, conversation_history, records, snippets)
 
-class NPCAgent:
+class NPCAgent(ChatAgent):
     """Generic NPC agent for monsters"""
+    knowledge_kinds = frozenset({MEMORY, CLUE, DISCOVERED, EVENT})
+
     def __init__(self, npc_id):
         if npc_id not in CHARACTERS:
             raise ValueError(f"NPC '{npc_id}' not found in characters database")
@@ -273,44 +754,22 @@ class NPCAgent:
         self.persona = self.data["system_prompt"]
         self.name = self.data["name"]
 
-        self.prompt_template = (
-            "You are {persona}\n"
-            "You are in a mystical world based on the Classic of Mountains and Seas.\n\n"
-            "### Context ###\n"
-            "{context}\n\n"
-            "### Player's message ###\n"
-            "{input}\n\n"
-            "### Speaking Rules ###\n"
-            "1. Speak **briefly and to the point**. Keep replies within 2–4 sentences.\n"
-            "2. Stay **in character** using your mythological traits and personality.\n"
-            "3. If asked about facts, answer clearly and concisely.\n"
-            "4. Express emotions that match your character's emotion_state: {emotion}\n"
-            "5. Avoid repeating information unless context changes.\n\n"
-            "### Output ###\n"
-            "Respond as {name} in under 80 words.\n"
-        )
+    def build_prompt(self, player_input, conversation_history=None):
+        """Assemble the NPC prompt for a player message"""
+        snippets = self.retrieve(player_input, conversation_history)
+        return PROMPTS.npc_chat(self.npc_id, player_input, conversation_history, snippets)
 
-    def respond(self, player_input, conversation_history=None):
-        """Generate NPC response"""
-        # Build context from conversation history
-        context = ""
-        if conversation_history and len(conversation_history) > 0:
-            recent = conversation_history[-3:]  # Last 3 exchanges
-            context = "Recent conversation:\n"
-            for msg in recent:
-                role = msg.get('role', 'unknown')
-                text = msg.get('text', '')
-                context += f"{role}: {text}\n"
-
-        prompt = self.prompt_template.format(
-            persona=self.persona,
-            context=context,
-            input=player_input,
-            emotion=self.data.get('emotion_state', 'neutral'),
-            name=self.name
-        )
-
-        return call_gemini(prompt)
+
+def get_chat_agent(npc_id, session_id=None):
+    """Return the agent for npc_id, or None if the NPC is unknown"""
+    if npc_id == 'baize':
+        agent = BaizeAgent()
+    elif npc_id in CHARACTERS:
+        agent = NPCAgent(npc_id)
+    else:
+        return None
+    agent.session_id = session_id
+    return agent
 
 # API Endpoints
 
@@ -326,34 +785,80 @@ def chat():
         if not npc_id or not message:
             return jsonify({'error': 'Missing npc_id or message'}), 400
 
-        # Handle Baize (cat) separately
-        if npc_id == 'baize':
-            agent = BaizeAgent()
-        else:
-            # Handle other NPCs
-            if npc_id not in CHARACTERS:
-                return jsonify({'error': f'Unknown NPC: {npc_id}'}), 404
-            agent = NPCAgent(npc_id)
+        agent = get_chat_agent(npc_id, get_session_id(data))
+        if agent is None:
+            return jsonify({'error': f'Unknown NPC: {npc_id}'}), 404
 
         response = agent.respond(message, conversation_history)
 
         return jsonify({
             'npc_id': npc_id,
             'response': response,
+            'cache': agent.cache_info(),
+            'prompt_tokens': agent.prompt_tokens,
             'success': True
         })
 
     except Exception as e:
-        return jsonify({
-            'error': str(e),
-            'success': False
-        }), 500
+        return error_response(e)
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming chat endpoint: token events followed by a done event"""
+    try:
+        data = request.get_json() or {}
+        npc_id = data.get('npc_id')
+        message = data.get('message')
+        conversation_history = data.get('history', [])
+
+        if not npc_id or not message:
+            return jsonify({'error': 'Missing npc_id or message'}), 400
+
+        agent = get_chat_agent(npc_id, get_session_id(data))
+        if agent is None:
+            return jsonify({'error': f'Unknown NPC: {npc_id}'}), 404
+        stream = prime_stream(agent.stream(message, conversation_history))
+    except Exception as e:
+        return error_response(e)
+
+    def events():
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield sse_event('token', {'text': chunk})
+        yield sse_event('done', {
+            'npc_id': npc_id,
+            'response': "".join(chunks).strip(),
+            'cache': agent.cache_info(),
+            'prompt_tokens': agent.prompt_tokens,
+            'success': True
+        })
+
+    return sse_response(events())
+
+def document_reply(name, version, build, if_none_match=None, accept_encoding=None):
+    """(status, body, headers) for a cached JSON document; 304 when the client's copy is current"""
+    document = DOCUMENTS.get(name, version, build)
+    headers = {'ETag': document.etag, 'Cache-Control': cache_control(HTTP_MAX_AGE), 'Vary': 'Accept-Encoding'}
+    if etag_matches(if_none_match, document.etag):
+        return 304, b'', headers
+    body, encoding = document.encoded(accept_encoding, COMPRESS_MIN_BYTES)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return 200, body, headers
+
+
+def document_response(name, version, build):
+    status, body, headers = document_reply(name, version, build, request.headers.get('If-None-Match'),
+                                           request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
 
 @app.route('/api/characters', methods=['GET'])
 def get_characters():
     """Get all character information"""
     try:
-        return jsonify({
+        return document_response('characters', None, lambda: {
             'characters': CHARACTERS,
             'success': True
         })
@@ -370,7 +875,7 @@ def get_character(npc_id):
         if npc_id not in CHARACTERS:
             return jsonify({'error': f'Character {npc_id} not found'}), 404
 
-        return jsonify({
+        return document_response(f'character:{npc_id}', None, lambda: {
             'character': CHARACTERS[npc_id],
             'success': True
         })
@@ -381,113 +886,730 @@ def get_character(npc_id):
         }), 500
 
 
+def make_clue_entry(data):
+    """Build a clue log entry from request data, or None if fields are missing"""
+    area = data.get('area')
+    beast = data.get('beast')
+    text = data.get('text')
+    if not area or not beast or not text:
+        return None
+    return {
+        'area': area,
+        'beast': beast,
+        'text': text,
+        'timestamp': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
 @app.route('/api/clues/log', methods=['POST'])
 def log_clue():
     """Persist discovered clues from the client"""
     try:
         data = request.get_json() or {}
-        area = data.get('area')
-        beast = data.get('beast')
-        text = data.get('text')
-
-        if not area or not beast or not text:
+        entry = make_clue_entry(data)
+        if not entry:
             return jsonify({'error': 'Missing area, beast, or text'}), 400
 
-        entry = {
-            'area': area,
-            'beast': beast,
-            'text': text,
-            'timestamp': datetime.utcnow().isoformat() + 'Z'
-        }
-        append_discovered_clue(entry)
+        append_discovered_clue(entry, get_session_id(data))
         return jsonify({'success': True, 'clue': entry})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 
+@app.route('/api/clues/pool', methods=['GET'])
+def get_clue_pool():
+    """World clues per location, with the crime scene's merged in"""
+    try:
+        return document_response('clue_pool', CLUE_POOL.signature(), CLUE_POOL.document)
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
 @app.route('/api/clues/reset', methods=['POST'])
 def reset_clues():
     try:
-        reset_discovered_clues()
+        data = request.get_json(silent=True) or {}
+        reset_discovered_clues(get_session_id(data))
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 
+def wire_version(source):
+    """Protocol a request asks for: ``protocol`` in a JSON body or ``v`` in a query string"""
+    try:
+        return int(source.get('protocol') or source.get('v') or 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def wire_cursor(source):
+    """Protocol 2 cursor of a request, or None for protocol 1"""
+    if wire_version(source) < wire.PROTOCOL:
+        return None
+    cursor = source.get('cursor', source)
+    return wire.read_cursor(cursor if hasattr(cursor, 'get') else {})
+
+
+def wire_payload(body, event, lines, cursor, new=0):
+    """Protocol 2 body: history and clues cut to what the client lacks, plus the new cursor"""
+    turns, reset = wire.line_delta(body.pop('history', ()), lines, cursor['lines'], new)
+    clues = event.get('p_clues', ())
+    new_clues, clues_reset = wire.clue_delta(clues, cursor)
+    body.update(protocol=wire.PROTOCOL, turns=turns, reset=reset, clues=new_clues, clues_reset=clues_reset,
+                cursor=wire.make_cursor(lines, clues))
+    if 'event' in body:
+        body['event'] = wire.trim(body['event'], wire.EVENT_FIELDS)
+    if body.get('verdict'):
+        body['verdict'] = wire.trim(body['verdict'], wire.VERDICT_FIELDS)
+    return body
+
+
+def events_payload(version=1, events=None):
+    """Event list without answers; protocol 2 lists only the fields the menu shows"""
+    events = load_events_data() if events is None else events
+    if version >= wire.PROTOCOL:
+        return {'success': True, 'protocol': wire.PROTOCOL,
+                'events': [wire.trim(event, wire.EVENT_FIELDS) for event in events]}
+    return {'success': True, 'events': [wire.public_event(event) for event in events]}
+
+
+def events_document(version):
+    """(name, version, build) of the cached event list; it changes with the shared clue log"""
+    protocol = wire.PROTOCOL if version >= wire.PROTOCOL else 1
+    snapshot = EVENT_STORE.snapshot()
+    return f'events:v{protocol}', snapshot, lambda: events_payload(protocol, snapshot.events)
+
+
 @app.route('/api/tribunal/events', methods=['GET'])
 def list_events():
     try:
-        events = load_events_data()
-        return jsonify({'success': True, 'events': events})
+        return document_response(*events_document(wire_version(request.args)))
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 
+def event_detail_payload(event_id, session_id=None, trial_id=None, cursor=None):
+    """Event plus its history; returns ``body, None`` or ``None, (error_json, status)``.
+
+    With a trial id the history is the trial's, and the body also carries
+    its latest snapshot and the log records after it. With a protocol 2
+    cursor the body is a delta (see ``wire.py``).
+    """
+    event = get_event_by_id(event_id, session_id)
+    if not event:
+        return None, ({'error': f'Event {event_id} not found'}, 404)
+    body = {'success': True, 'event': wire.public_event(event)}
+    if trial_id:
+        trial = TRIALS.state(trial_id) if valid_trial_id(trial_id) else None
+        if trial is None or trial['event_id'] != event_id:
+            return None, ({'error': f'Trial {trial_id} not found'}, 404)
+        body.update(history=trial['history'], trial_id=trial_id)
+        lines = trial['lines']
+        if cursor is None:
+            snapshot, tail = TRIALS.resume(trial_id)
+            body.update(snapshot=snapshot, tail=tail)
+    elif session_id:
+        body['history'] = SESSIONS.transcript(session_id, event_id)
+        lines = SESSIONS.transcript_lines(session_id, event_id)
+    else:
+        body['history'] = list(event.get('game_logs', []))
+        lines = len(body['history'])
+    if cursor is not None:
+        body = wire_payload(body, event, lines, cursor)
+    return body, None
+
+
 @app.route('/api/tribunal/event/<event_id>', methods=['GET'])
 def get_event(event_id):
     try:
-        event = get_event_by_id(event_id)
-        if not event:
-            return jsonify({'error': f'Event {event_id} not found'}), 404
-        return jsonify({
-            'success': True,
-            'event': event,
-            'history': event.get('game_logs', [])
-        })
+        body, error = event_detail_payload(event_id, get_session_id(), request.args.get('trial_id'),
+                                           wire_cursor(request.args))
+        if error:
+            return jsonify(error[0]), error[1]
+        return jsonify(body)
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
 
-@app.route('/api/tribunal/act', methods=['POST'])
-def tribunal_act():
+def start_trial(data, session_id=None):
+    """Open a logged trial of data['event_id']; returns ``body, None`` or ``None, error``"""
+    event_id = data.get('event_id')
+    if not get_event_by_id(event_id, session_id):
+        return None, ({'error': f'Event {event_id} not found'}, 404)
+    state = TRIALS.start(event_id, session_id)
+    return {'success': True, 'trial_id': state['trial_id'], 'trial': state}, None
+
+
+def trial_detail_payload(trial_id):
+    """Latest snapshot and the records after it, or None for an unknown trial"""
+    snapshot, tail = TRIALS.resume(trial_id) if valid_trial_id(trial_id) else (None, None)
+    if tail is None:
+        return None
+    return {'success': True, 'trial_id': trial_id, 'snapshot': snapshot, 'tail': tail}
+
+
+def trial_events_payload(trial_id, args):
+    """Log records after ``after`` (at most ``limit``) for replay, or an error"""
+    if not valid_trial_id(trial_id) or TRIALS.state(trial_id) is None:
+        return None, ({'error': f'Trial {trial_id} not found'}, 404)
+    try:
+        after = int(args.get('after', 0))
+        limit = int(args.get('limit', 500))
+    except (TypeError, ValueError):
+        return None, ({'error': 'after and limit must be integers'}, 400)
+    records = TRIALS.records(trial_id, after=after, limit=max(1, limit))
+    return {
+        'success': True,
+        'trial_id': trial_id,
+        'events': records,
+        'next_after': records[-1]['seq'] if records else after
+    }, None
+
+
+@app.route('/api/tribunal/trial', methods=['POST'])
+def create_trial():
+    """Open a new logged trial; pass its trial_id to the tribunal endpoints"""
     try:
         data = request.get_json() or {}
-        event_id = data.get('event_id')
-        action = data.get('action', 'auto')
-        chosen_speaker = data.get('speaker')
-        player_input = (data.get('player_input') or '').strip()
+        body, error = start_trial(data, get_session_id(data))
+        if error:
+            return jsonify(error[0]), error[1]
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+@app.route('/api/tribunal/trial/<trial_id>', methods=['GET'])
+def get_trial(trial_id):
+    """Resume a trial: its latest snapshot plus the records after it"""
+    try:
+        body = trial_detail_payload(trial_id)
+        if not body:
+            return jsonify({'error': f'Trial {trial_id} not found'}), 404
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+@app.route('/api/tribunal/trial/<trial_id>/events', methods=['GET'])
+def get_trial_events(trial_id):
+    """Replay a trial's log from ``after``"""
+    try:
+        body, error = trial_events_payload(trial_id, request.args)
+        if error:
+            return jsonify(error[0]), error[1]
+        return jsonify(body)
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+
+def verdict_for(event, history):
+    """Verdict state read from the Judge's lines; no LLM call"""
+    return trial_verdict(event, history, CHARACTER_INDEX.find)
+
+
+def load_tribunal_turn(data, session_id=None):
+    """Validate a tribunal request and build the working history.
+
+    With a ``trial_id`` the trial log's history (and event) is used;
+    otherwise, with a session id and no ``history`` in the body, the
+    server-held session transcript is. A trial that already reached a verdict answers
+    409. Returns ``(event, history), None`` on success or
+    ``None, (error_json, status)`` when the request is invalid.
+    """
+    event_id = data.get('event_id')
+    action = data.get('action', 'auto')
+    player_input = (data.get('player_input') or '').strip()
+    trial_id = data.get('trial_id')
+    if trial_id is not None:
+        trial = TRIALS.state(trial_id) if valid_trial_id(trial_id) else None
+        if trial is None:
+            return None, ({'error': f'Trial {trial_id} not found'}, 404)
+        event_id = trial['event_id']
+        history = sanitize_history(trial['history'])
+        memory_key = ('trial', trial_id)
+    elif session_id and 'history' not in data:
+        history = sanitize_history(SESSIONS.transcript(session_id, event_id))
+        memory_key = (session_id, event_id)
+    else:
         history = sanitize_history(data.get('history', []))
+        memory_key = None
+
+    event = get_event_by_id(event_id, session_id)
+    if not event:
+        return None, ({'error': f'Event {event_id} not found'}, 404)
+    event = with_trial_memory(event, history, memory_key)
+    verdict = verdict_for(event, history)
+    if verdict['closed']:
+        return None, ({'error': 'This trial has already reached a verdict', 'verdict': verdict}, 409)
+
+    if action == 'player':
+        if not player_input:
+            return None, ({'error': 'Player input required'}, 400)
+        history.append({'speaker': 'Judge', 'text': player_input})
+
+    return (event, history), None
+
+
+def validate_speaker(event, speaker):
+    if speaker not in event.get('npcs', []):
+        speaker = event['npcs'][0]
+    return speaker
+
+
+def select_speaker(event, history, data):
+    if data.get('action', 'auto') == 'choose':
+        speaker = data.get('speaker') or event['npcs'][0]
+    else:
+        speaker = pick_next_speaker(event, history)
+    return validate_speaker(event, speaker)
+
+
+async def aselect_speaker(event, history, data):
+    if data.get('action', 'auto') == 'choose':
+        speaker = data.get('speaker') or event['npcs'][0]
+    else:
+        speaker = await apick_next_speaker(event, history)
+    return validate_speaker(event, speaker)
+
+
+def prepare_tribunal_turn(data, session_id=None):
+    """Validate a tribunal request and pick the speaker"""
+    turn, error = load_tribunal_turn(data, session_id)
+    if error:
+        return None, error
+    event, history = turn
+    return (event, select_speaker(event, history, data), history), None
+
+
+SPECULATION_WIDTH = int(os.environ.get('MOONLIT_SPECULATION_WIDTH', '2'))
+SPECULATION_STATS = SpeculationStats()
+_speculation_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='speculate')
+
+
+def submit_in_context(pool, fn, *args):
+    """Submit to a pool so LLM timings count toward the current request"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
 
-        event = get_event_by_id(event_id)
-        if not event:
-            return jsonify({'error': f'Event {event_id} not found'}), 404
 
-        if action == 'player':
-            if not player_input:
-                return jsonify({'error': 'Player input required'}), 400
-            history.append({'speaker': 'Judge', 'text': player_input})
+def speculation_enabled(data, event):
+    if data.get('action', 'auto') == 'choose' or uses_rule_scheduler(event):
+        return False
+    if 'speculative' in data:
+        return bool(data.get('speculative'))
+    return os.environ.get('MOONLIT_SPECULATIVE_SPEAKERS', '').lower() in ('1', 'true', 'yes')
+
+
+def draft_trial_line(event, speaker, history, cancel):
+    """generate_trial_line for a speculative draft; None once cancelled"""
+    if cancel.is_set():
+        return None
+    try:
+        return generate_trial_line(event, speaker, history, cancel)
+    except LLMCancelled:
+        return None
+
+
+def count_wasted_draft(future):
+    """Done callback for a discarded draft: count it if it still went upstream"""
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        SPECULATION_STATS.record_wasted()
+
+
+def speculative_turn(event, history):
+    """Draft lines for the likeliest speakers while the moderator decides.
+
+    Drafts for speakers the moderator did not pick are cancelled: those
+    not yet upstream give back their admission token and slot, those
+    already in flight finish in the background and count as wasted.
+    """
+    candidates = rank_speakers(event, history, CHARACTERS)[:SPECULATION_WIDTH]
+    drafts = {}
+    for npc in candidates:
+        cancel = threading.Event()
+        future = submit_in_context(_speculation_pool, draft_trial_line, event, npc, history, cancel)
+        drafts[npc] = (future, cancel)
+    speaker = validate_speaker(event, pick_next_speaker(event, history))
+
+    hit = speaker in drafts
+    for npc, (future, cancel) in drafts.items():
+        if npc != speaker:
+            cancel.set()
+            future.cancel()
+            future.add_done_callback(count_wasted_draft)
+    draft = drafts[speaker][0].result() if hit else None
+    if draft is not None:
+        npc_line, prompt_tokens = draft
+    else:
+        npc_line, prompt_tokens = generate_trial_line(event, speaker, history)
+    discarded = len(drafts) - hit
+    return speaker, npc_line, prompt_tokens, speculation_report(hit, candidates, discarded)
+
+
+async def aspeculative_turn(event, history):
+    """Async speculative_turn; losing drafts are cancelled outright"""
+    candidates = rank_speakers(event, history, CHARACTERS)[:SPECULATION_WIDTH]
+    drafts = {
+        npc: asyncio.ensure_future(agenerate_trial_line(event, npc, history))
+        for npc in candidates
+    }
+    speaker = validate_speaker(event, await apick_next_speaker(event, history))
+
+    hit = speaker in drafts
+    for npc, task in drafts.items():
+        if npc != speaker:
+            task.cancel()
+    if hit:
+        npc_line, prompt_tokens = await drafts[speaker]
+    else:
+        npc_line, prompt_tokens = await agenerate_trial_line(event, speaker, history)
+    discarded = len(drafts) - hit
+    return speaker, npc_line, prompt_tokens, speculation_report(hit, candidates, discarded)
+
+
+def speculation_report(hit, candidates, discarded):
+    SPECULATION_STATS.record(hit, discarded)
+    stats = {'hit': hit, 'candidates': candidates, 'discarded': discarded}
+    stats.update(SPECULATION_STATS.snapshot())
+    return stats
+
+
+def tribunal_turn_payload(event, speaker, npc_line, history):
+    """Append the NPC line to history and build the response body"""
+    history.append({'speaker': speaker, 'text': npc_line})
+    display_name = CHARACTERS.get(speaker, {}).get('name', speaker.title())
+    return {
+        'success': True,
+        'speaker': speaker,
+        'speaker_name': display_name,
+        'message': npc_line,
+        'history': history[-30:],
+        'portrait': get_npc_portrait(speaker),
+        'verdict': verdict_for(event, history)
+    }
+
+
+def remember_lines(data, session_id, entries, verdict=None, chosen_by='moderator'):
+    """Append lines to the request's trial log, or else to its session transcript"""
+    trial_id = data.get('trial_id')
+    if trial_id:
+        TRIALS.append(trial_id, turn_records(entries, chosen_by, verdict))
+        SUMMARIES.observe(('trial', trial_id), entries)
+    elif session_id:
+        extend_session_transcript(session_id, data.get('event_id'), entries)
+
+
+def remember_tribunal_turn(data, payload, session_id=None):
+    """Append this turn's Judge and NPC lines to the trial log or session transcript"""
+    entries = payload['history'][-2:] if data.get('action') == 'player' else payload['history'][-1:]
+    chosen_by = 'judge' if data.get('action') == 'choose' else 'moderator'
+    remember_lines(data, session_id, entries, payload.get('verdict'), chosen_by)
+
+
+def transcript_lines(data, session_id=None):
+    """Lines in the server-held transcript a tribunal request played, or None for client-held history"""
+    if data.get('trial_id'):
+        return TRIALS.lines(data['trial_id'])
+    if session_id and 'history' not in data:
+        return SESSIONS.transcript_lines(session_id, data.get('event_id'))
+    return None
+
+
+def tribunal_wire_payload(data, session_id, event, body, new):
+    """Reply body in the request's protocol; ``new`` is the number of lines the request added"""
+    cursor = wire_cursor(data)
+    if cursor is None:
+        return body
+    return wire_payload(body, event, transcript_lines(data, session_id), cursor, new)
+
+
+def batch_lines(data, turns):
+    """Lines a batch added: its turns plus the Judge line, if any"""
+    return turns + bool((data.get('player_input') or '').strip())
+
+
+def play_tribunal_turn(data, session_id=None):
+    """One tribunal turn; returns ``payload, None`` or ``None, (error_json, status)``"""
+    turn, error = load_tribunal_turn(data, session_id)
+    if error:
+        return None, error
+    event, history = turn
+
+    speculation = None
+    if speculation_enabled(data, event):
+        speaker, npc_line, prompt_tokens, speculation = speculative_turn(event, history)
+    else:
+        speaker = select_speaker(event, history, data)
+        npc_line, prompt_tokens = generate_trial_line(event, speaker, history)
+
+    payload = tribunal_turn_payload(event, speaker, npc_line, history)
+    remember_tribunal_turn(data, payload, session_id)
+    payload['prompt_tokens'] = prompt_tokens
+    if speculation:
+        payload['speculation'] = speculation
+    return tribunal_wire_payload(data, session_id, event, payload, 1 + (data.get('action') == 'player')), None
+
+
+@app.route('/api/tribunal/act', methods=['POST'])
+def tribunal_act():
+    try:
+        data = request.get_json() or {}
+        payload, error = play_tribunal_turn(data, get_session_id(data))
+        if error:
+            return jsonify(error[0]), error[1]
+        return jsonify(payload)
+    except Exception as e:
+        return error_response(e)
+
 
-        if action == 'choose':
-            speaker = chosen_speaker or event['npcs'][0]
+@app.route('/api/tribunal/act/stream', methods=['POST'])
+def tribunal_act_stream():
+    """Streaming tribunal turn: speaker, token and done events"""
+    try:
+        data = request.get_json() or {}
+        session_id = get_session_id(data)
+        turn, error = prepare_tribunal_turn(data, session_id)
+        if error:
+            return jsonify(error[0]), error[1]
+        event, speaker, history = turn
+        prompt = build_trial_line_prompt(event, speaker, history)
+        stream = prime_stream(stream_trial_line(prompt, speaker, history))
+    except Exception as e:
+        return error_response(e)
+
+    def events():
+        yield sse_event('speaker', speaker_event_payload(speaker))
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield sse_event('token', {'text': chunk})
+        npc_line = "".join(chunks).strip() or "..."
+        payload = tribunal_turn_payload(event, speaker, npc_line, history)
+        remember_tribunal_turn(data, payload, session_id)
+        payload['prompt_tokens'] = prompt.usage
+        yield sse_event('done', tribunal_wire_payload(data, session_id, event, payload,
+                                                      1 + (data.get('action') == 'player')))
+
+    return sse_response(events())
+
+BATCH_MAX_TURNS = int(os.environ.get('MOONLIT_BATCH_MAX_TURNS', '8'))
+_round_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='round')
+
+
+def load_tribunal_batch(data, session_id=None):
+    """Validate a batch request and plan its turns.
+
+    ``mode`` is ``turns`` (``turns`` sequential auto turns, default 3) or
+    ``round`` (every roster NPC, or the ``speakers`` subset, once). Returns
+    ``(event, history, plan), None`` or ``None, (error_json, status)``;
+    ``plan`` is a turn count or a speaker list.
+    """
+    mode = data.get('mode', 'turns')
+    if mode not in ('turns', 'round'):
+        return None, ({'error': f'Unknown batch mode: {mode}'}, 400)
+    action = 'player' if (data.get('player_input') or '').strip() else 'auto'
+    turn, error = load_tribunal_turn(dict(data, action=action), session_id)
+    if error:
+        return None, error
+    event, history = turn
+
+    if mode == 'round':
+        speakers = data.get('speakers')
+        ranked = rank_speakers(event, history, CHARACTERS)
+        plan = [npc for npc in ranked if npc in speakers] if isinstance(speakers, list) else ranked
+        if not plan:
+            return None, ({'error': 'No valid speakers for this round'}, 400)
+    else:
+        try:
+            plan = int(data.get('turns', 3))
+        except (TypeError, ValueError):
+            return None, ({'error': 'turns must be an integer'}, 400)
+        if not 1 <= plan <= BATCH_MAX_TURNS:
+            return None, ({'error': f'turns must be between 1 and {BATCH_MAX_TURNS}'}, 400)
+    if verdict_for(event, history)['closed']:
+        plan = plan[:1] if isinstance(plan, list) else 1  # the Judge's verdict gets one reply
+    return (event, history, plan), None
+
+
+def batch_turn_payload(speaker, npc_line, prompt_tokens, history):
+    """Append one batch line to history and describe it"""
+    history.append({'speaker': speaker, 'text': npc_line})
+    payload = speaker_event_payload(speaker)
+    payload['message'] = npc_line
+    payload['prompt_tokens'] = prompt_tokens
+    return payload
+
+
+def run_tribunal_batch(data, event, history, plan, session_id=None):
+    """Yield turn payloads, appending each line to history and the trial or session.
+
+    A round drafts every speaker's line concurrently against the same
+    transcript, then yields them in the rule scheduler's order: each line
+    waits for its own draft and for every line ranked before it.
+    Sequential turns each see the previous line.
+    """
+    pending = history[-1:] if (data.get('player_input') or '').strip() else []  # the Judge line
+    chosen_by = 'round' if isinstance(plan, list) else 'moderator'
+
+    def remember(entries):
+        remember_lines(data, session_id, entries, verdict_for(event, history), chosen_by)
+
+    if isinstance(plan, list):
+        snapshot = list(history)
+        drafts = [
+            (npc, submit_in_context(_round_pool, generate_trial_line, event, npc, snapshot))
+            for npc in plan
+        ]
+        try:
+            for npc, future in drafts:
+                npc_line, prompt_tokens = future.result()
+                payload = batch_turn_payload(npc, npc_line, prompt_tokens, history)
+                remember(pending + history[-1:])
+                pending = []
+                yield payload
+        finally:
+            for _, future in drafts:
+                future.cancel()
+        return
+
+    speculative = speculation_enabled(data, event)
+    for _ in range(plan):
+        if speculative:
+            speaker, npc_line, prompt_tokens, _ = speculative_turn(event, history)
+        else:
+            speaker = validate_speaker(event, pick_next_speaker(event, history))
+            npc_line, prompt_tokens = generate_trial_line(event, speaker, history)
+        payload = batch_turn_payload(speaker, npc_line, prompt_tokens, history)
+        remember(pending + history[-1:])
+        pending = []
+        yield payload
+
+
+async def arun_tribunal_batch(data, event, history, plan, session_id=None):
+    """Async run_tribunal_batch; round drafts run as concurrent tasks"""
+    pending = history[-1:] if (data.get('player_input') or '').strip() else []  # the Judge line
+    chosen_by = 'round' if isinstance(plan, list) else 'moderator'
+
+    async def remember(entries):
+        # The trial log fsyncs; keep the write off the event loop.
+        await asyncio.to_thread(remember_lines, data, session_id, entries, verdict_for(event, history), chosen_by)
+
+    if isinstance(plan, list):
+        snapshot = list(history)
+        drafts = [(npc, asyncio.ensure_future(agenerate_trial_line(event, npc, snapshot))) for npc in plan]
+        try:
+            for npc, task in drafts:
+                npc_line, prompt_tokens = await task
+                payload = batch_turn_payload(npc, npc_line, prompt_tokens, history)
+                await remember(pending + history[-1:])
+                pending = []
+                yield payload
+        finally:
+            for _, task in drafts:
+                task.cancel()
+        return
+
+    speculative = speculation_enabled(data, event)
+    for _ in range(plan):
+        if speculative:
+            speaker, npc_line, prompt_tokens, _ = await aspeculative_turn(event, history)
         else:
-            speaker = pick_next_speaker(event, history)
+            speaker = validate_speaker(event, await apick_next_speaker(event, history))
+            npc_line, prompt_tokens = await agenerate_trial_line(event, speaker, history)
+        payload = batch_turn_payload(speaker, npc_line, prompt_tokens, history)
+        await remember(pending + history[-1:])
+        pending = []
+        yield payload
 
-        if speaker not in event.get('npcs', []):
-            speaker = event['npcs'][0]
 
-        npc_line = generate_trial_line(event, speaker, history)
-        history.append({'speaker': speaker, 'text': npc_line})
+def batch_done_payload(data, event, history, turns=None):
+    body = {'success': True, 'mode': data.get('mode', 'turns'), 'history': history[-30:],
+            'verdict': verdict_for(event, history)}
+    if turns is not None:
+        body['turns'] = turns
+    return body
 
-        display_name = CHARACTERS.get(speaker, {}).get('name', speaker.title())
 
-        return jsonify({
-            'success': True,
-            'speaker': speaker,
-            'speaker_name': display_name,
-            'message': npc_line,
-            'history': history[-30:],
-            'portrait': get_npc_portrait(speaker)
-        })
+@app.route('/api/tribunal/batch', methods=['POST'])
+def tribunal_batch():
+    """Run several tribunal turns, or a full round, in one request"""
+    try:
+        data = request.get_json() or {}
+        session_id = get_session_id(data)
+        batch, error = load_tribunal_batch(data, session_id)
+        if error:
+            return jsonify(error[0]), error[1]
+        event, history, plan = batch
+        turns = list(run_tribunal_batch(data, event, history, plan, session_id))
+        body = batch_done_payload(data, event, history, turns)
+        return jsonify(tribunal_wire_payload(data, session_id, event, body, batch_lines(data, len(turns))))
     except Exception as e:
-        return jsonify({'error': str(e), 'success': False}), 500
+        return error_response(e)
+
+
+@app.route('/api/tribunal/batch/stream', methods=['POST'])
+def tribunal_batch_stream():
+    """Streaming batch: one turn event per line, then a done event"""
+    try:
+        data = request.get_json() or {}
+        session_id = get_session_id(data)
+        batch, error = load_tribunal_batch(data, session_id)
+        if error:
+            return jsonify(error[0]), error[1]
+        event, history, plan = batch
+        turns = prime_stream(run_tribunal_batch(data, event, history, plan, session_id))
+    except Exception as e:
+        return error_response(e)
+
+    def events():
+        sent = 0
+        try:
+            for turn in turns:
+                sent += 1
+                yield sse_event('turn', turn)
+        except Overloaded as e:
+            # Turns already sent stay in the session; report the rest as refused.
+            yield sse_event('error', overloaded_payload(e))
+        body = batch_done_payload(data, event, history)
+        yield sse_event('done', tribunal_wire_payload(data, session_id, event, body, batch_lines(data, sent)))
+
+    return sse_response(events())
+
+def speaker_event_payload(speaker):
+    return {
+        'speaker': speaker,
+        'speaker_name': CHARACTERS.get(speaker, {}).get('name', speaker.title()),
+        'portrait': get_npc_portrait(speaker)
+    }
+
+
+def health_payload():
+    try:
+        upstream = get_client().status()
+    except Exception as e:
+        upstream = {'up': False, 'last_error': str(e)}
+    return {
+        'status': 'healthy' if upstream['up'] else 'degraded',
+        'message': 'Moonlit backend server is running',
+        'upstream': upstream
+    }
+
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'message': 'Moonlit backend server is running'
-    })
+    return jsonify(health_payload())
+
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request and LLM call metrics"""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
 
 if __name__ == '__main__':
     print("Starting Moonlit Flask Backend Server...")
@@ -0,0 +1,442 @@
+"""Async (ASGI) entry point serving the same API as app.py.
+
+LLM calls here are awaited instead of holding a worker thread, so one
+process can keep hundreds of conversations in flight. Concurrent upstream
+requests are capped by ``MOONLIT_ASYNC_UPSTREAM_LIMIT`` (default 256).
+
+Run with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Prompt building, sessions, the clue log and the event store are shared
+with the Flask app, so both servers behave identically.
+"""
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import app as core
+import wire
+from admission import Overloaded
+from metrics import METRICS, start_request_timing, stop_request_timing, record_request, server_timing_header
+from sessions import valid_session_id
+
+
+def session_id_from(request, data=None):
+    session_id = (
+        request.headers.get('x-session-id')
+        or request.query_params.get('session_id')
+        or (data or {}).get('session_id')
+    )
+    return session_id if valid_session_id(session_id) else None
+
+
+class JSONResponse(StarletteJSONResponse):
+    """JSON replies through wire.dumps, like the Flask app's jsonify"""
+
+    def render(self, content):
+        return wire.dumps(content)
+
+
+async def read_json(request):
+    try:
+        data = wire.loads(await request.body())
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def error_response(e):
+    if isinstance(e, Overloaded):
+        return JSONResponse(core.overloaded_payload(e), status_code=429,
+                            headers={'Retry-After': str(e.retry_after)})
+    return JSONResponse({'error': str(e), 'success': False}, status_code=500)
+
+
+def sse_response(events):
+    return StreamingResponse(events, media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def chat(request):
+    try:
+        data = await read_json(request)
+        npc_id = data.get('npc_id')
+        message = data.get('message')
+        if not npc_id or not message:
+            return JSONResponse({'error': 'Missing npc_id or message'}, status_code=400)
+
+        agent = core.get_chat_agent(npc_id, session_id_from(request, data))
+        if agent is None:
+            return JSONResponse({'error': f'Unknown NPC: {npc_id}'}, status_code=404)
+
+        response = await agent.arespond(message, data.get('history', []))
+        return JSONResponse({
+            'npc_id': npc_id,
+            'response': response,
+            'cache': agent.cache_info(),
+            'prompt_tokens': agent.prompt_tokens,
+            'success': True
+        })
+    except Exception as e:
+        return error_response(e)
+
+
+async def chat_stream(request):
+    try:
+        data = await read_json(request)
+        npc_id = data.get('npc_id')
+        message = data.get('message')
+        if not npc_id or not message:
+            return JSONResponse({'error': 'Missing npc_id or message'}, status_code=400)
+
+        agent = core.get_chat_agent(npc_id, session_id_from(request, data))
+        if agent is None:
+            return JSONResponse({'error': f'Unknown NPC: {npc_id}'}, status_code=404)
+        stream = await core.aprime_stream(agent.astream(message, data.get('history', [])))
+    except Exception as e:
+        return error_response(e)
+
+    async def events():
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield core.sse_event('token', {'text': chunk})
+        yield core.sse_event('done', {
+            'npc_id': npc_id,
+            'response': "".join(chunks).strip(),
+            'cache': agent.cache_info(),
+            'prompt_tokens': agent.prompt_tokens,
+            'success': True
+        })
+
+    return sse_response(events())
+
+
+def document_response(request, name, version, build):
+    status, body, headers = core.document_reply(name, version, build, request.headers.get('if-none-match'),
+                                                request.headers.get('accept-encoding'))
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+async def get_characters(request):
+    return document_response(request, 'characters', None,
+                             lambda: {'characters': core.CHARACTERS, 'success': True})
+
+
+async def get_character(request):
+    npc_id = request.path_params['npc_id']
+    if npc_id not in core.CHARACTERS:
+        return JSONResponse({'error': f'Character {npc_id} not found'}, status_code=404)
+    return document_response(request, f'character:{npc_id}', None,
+                             lambda: {'character': core.CHARACTERS[npc_id], 'success': True})
+
+
+async def get_clue_pool(request):
+    try:
+        return document_response(request, 'clue_pool', core.CLUE_POOL.signature(), core.CLUE_POOL.document)
+    except Exception as e:
+        return error_response(e)
+
+
+async def log_clue(request):
+    try:
+        data = await read_json(request)
+        entry = core.make_clue_entry(data)
+        if not entry:
+            return JSONResponse({'error': 'Missing area, beast, or text'}, status_code=400)
+        await asyncio.to_thread(core.append_discovered_clue, entry, session_id_from(request, data))
+        return JSONResponse({'success': True, 'clue': entry})
+    except Exception as e:
+        return error_response(e)
+
+
+async def reset_clues(request):
+    try:
+        data = await read_json(request)
+        await asyncio.to_thread(core.reset_discovered_clues, session_id_from(request, data))
+        return JSONResponse({'success': True})
+    except Exception as e:
+        return error_response(e)
+
+
+async def list_events(request):
+    try:
+        return document_response(request, *core.events_document(core.wire_version(request.query_params)))
+    except Exception as e:
+        return error_response(e)
+
+
+async def get_event(request):
+    try:
+        event_id = request.path_params['event_id']
+        body, error = await asyncio.to_thread(core.event_detail_payload, event_id, session_id_from(request),
+                                              request.query_params.get('trial_id'),
+                                              core.wire_cursor(request.query_params))
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return JSONResponse(body)
+    except Exception as e:
+        return error_response(e)
+
+
+async def create_trial(request):
+    try:
+        data = await read_json(request)
+        body, error = await asyncio.to_thread(core.start_trial, data, session_id_from(request, data))
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return JSONResponse(body)
+    except Exception as e:
+        return error_response(e)
+
+
+async def get_trial(request):
+    try:
+        trial_id = request.path_params['trial_id']
+        body = await asyncio.to_thread(core.trial_detail_payload, trial_id)
+        if not body:
+            return JSONResponse({'error': f'Trial {trial_id} not found'}, status_code=404)
+        return JSONResponse(body)
+    except Exception as e:
+        return error_response(e)
+
+
+async def get_trial_events(request):
+    try:
+        body, error = await asyncio.to_thread(core.trial_events_payload, request.path_params['trial_id'],
+                                              request.query_params)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return JSONResponse(body)
+    except Exception as e:
+        return error_response(e)
+
+
+async def tribunal_act(request):
+    try:
+        data = await read_json(request)
+        session_id = session_id_from(request, data)
+        turn, error = await asyncio.to_thread(core.load_tribunal_turn, data, session_id)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        event, history = turn
+
+        speculation = None
+        if core.speculation_enabled(data, event):
+            speaker, npc_line, prompt_tokens, speculation = await core.aspeculative_turn(event, history)
+        else:
+            speaker = await core.aselect_speaker(event, history, data)
+            npc_line, prompt_tokens = await core.agenerate_trial_line(event, speaker, history)
+
+        payload = core.tribunal_turn_payload(event, speaker, npc_line, history)
+        await asyncio.to_thread(core.remember_tribunal_turn, data, payload, session_id)
+        payload['prompt_tokens'] = prompt_tokens
+        if speculation:
+            payload['speculation'] = speculation
+        new = 1 + (data.get('action') == 'player')
+        return JSONResponse(await asyncio.to_thread(core.tribunal_wire_payload, data, session_id, event,
+                                                    payload, new))
+    except Exception as e:
+        return error_response(e)
+
+
+async def tribunal_act_stream(request):
+    try:
+        data = await read_json(request)
+        session_id = session_id_from(request, data)
+        turn, error = await asyncio.to_thread(core.load_tribunal_turn, data, session_id)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        event, history = turn
+        speaker = await core.aselect_speaker(event, history, data)
+        prompt = core.build_trial_line_prompt(event, speaker, history)
+        stream = await core.aprime_stream(core.astream_trial_line(prompt, speaker, history))
+    except Exception as e:
+        return error_response(e)
+
+    async def events():
+        yield core.sse_event('speaker', core.speaker_event_payload(speaker))
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield core.sse_event('token', {'text': chunk})
+        npc_line = "".join(chunks).strip() or "..."
+        payload = core.tribunal_turn_payload(event, speaker, npc_line, history)
+        await asyncio.to_thread(core.remember_tribunal_turn, data, payload, session_id)
+        payload['prompt_tokens'] = prompt.usage
+        new = 1 + (data.get('action') == 'player')
+        yield core.sse_event('done', await asyncio.to_thread(core.tribunal_wire_payload, data, session_id,
+                                                             event, payload, new))
+
+    return sse_response(events())
+
+
+async def tribunal_batch(request):
+    try:
+        data = await read_json(request)
+        session_id = session_id_from(request, data)
+        batch, error = await asyncio.to_thread(core.load_tribunal_batch, data, session_id)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        event, history, plan = batch
+        turns = [turn async for turn in core.arun_tribunal_batch(data, event, history, plan, session_id)]
+        body = core.batch_done_payload(data, event, history, turns)
+        return JSONResponse(await asyncio.to_thread(core.tribunal_wire_payload, data, session_id, event, body,
+                                                    core.batch_lines(data, len(turns))))
+    except Exception as e:
+        return error_response(e)
+
+
+async def tribunal_batch_stream(request):
+    try:
+        data = await read_json(request)
+        session_id = session_id_from(request, data)
+        batch, error = await asyncio.to_thread(core.load_tribunal_batch, data, session_id)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        event, history, plan = batch
+        turns = await core.aprime_stream(core.arun_tribunal_batch(data, event, history, plan, session_id))
+    except Exception as e:
+        return error_response(e)
+
+    async def events():
+        sent = 0
+        try:
+            async for turn in turns:
+                sent += 1
+                yield core.sse_event('turn', turn)
+        except Overloaded as e:
+            yield core.sse_event('error', core.overloaded_payload(e))
+        body = core.batch_done_payload(data, event, history)
+        yield core.sse_event('done', await asyncio.to_thread(core.tribunal_wire_payload, data, session_id,
+                                                             event, body, core.batch_lines(data, sent)))
+
+    return sse_response(events())
+
+
+async def health(request):
+    return JSONResponse(core.health_payload())
+
+
+async def metrics(request):
+    return Response(METRICS.render(), media_type=core.METRICS_CONTENT_TYPE)
+
+
+def route_label(scope):
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+class TimingMiddleware:
+    """Per-route latency metrics plus a Server-Timing header on non-streamed replies"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings = start_request_timing()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = MutableHeaders(scope=message)
+                if not headers.get('content-type', '').startswith('text/event-stream'):
+                    headers.append('Server-Timing', server_timing_header(timings, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            record_request(route_label(scope), scope['method'], status, time.perf_counter() - started, timings)
+            stop_request_timing()
+
+
+class CompressionMiddleware:
+    """Gzip (or brotli) for JSON replies sent in one piece, as app.compress_response does"""
+
+    def __init__(self, app, min_size=1024):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.min_size:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                if headers.get('content-type', '').startswith('application/json') and 'content-encoding' not in headers:
+                    start = message  # held until the body shows whether it is worth compressing
+                    return
+            elif message['type'] == 'http.response.body' and start is not None:
+                held, start = start, None
+                if not message.get('more_body'):
+                    body, encoding = wire.compress(message.get('body', b''), accept_encoding, self.min_size)
+                    if encoding:
+                        headers = MutableHeaders(scope=held)
+                        headers['Content-Encoding'] = encoding
+                        headers['Content-Length'] = str(len(body))
+                        headers.add_vary_header('Accept-Encoding')
+                        message = {'type': 'http.response.body', 'body': body}
+                await send(held)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+routes = [
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/characters', get_characters, methods=['GET']),
+    Route('/api/character/{npc_id}', get_character, methods=['GET']),
+    Route('/api/clues/log', log_clue, methods=['POST']),
+    Route('/api/clues/pool', get_clue_pool, methods=['GET']),
+    Route('/api/clues/reset', reset_clues, methods=['POST']),
+    Route('/api/tribunal/events', list_events, methods=['GET']),
+    Route('/api/tribunal/event/{event_id}', get_event, methods=['GET']),
+    Route('/api/tribunal/trial', create_trial, methods=['POST']),
+    Route('/api/tribunal/trial/{trial_id}', get_trial, methods=['GET']),
+    Route('/api/tribunal/trial/{trial_id}/events', get_trial_events, methods=['GET']),
+    Route('/api/tribunal/act', tribunal_act, methods=['POST']),
+    Route('/api/tribunal/act/stream', tribunal_act_stream, methods=['POST']),
+    Route('/api/tribunal/batch', tribunal_batch, methods=['POST']),
+    Route('/api/tribunal/batch/stream', tribunal_batch_stream, methods=['POST']),
+    Route('/api/health', health, methods=['GET']),
+    Route('/api/metrics', metrics, methods=['GET']),
+]
+
+app = Starlette(routes=routes, middleware=[
+    Middleware(TimingMiddleware),
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    Middleware(CompressionMiddleware, min_size=core.COMPRESS_MIN_BYTES)
+])
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("Starting Moonlit ASGI Backend Server...")
+    print("Server will run on http://localhost:5001")
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -0,0 +1,295 @@
+"""Load test and latency benchmark for the Moonlit backend API.
+
+By default the Flask app is driven in-process with the fake LLM provider,
+so no server or API key is needed:
+
+    python bench.py --concurrency 16 --requests 200 --latency-dist lognormal:-1.5,0.5
+
+Point ``--url`` at a running server (Flask or ASGI) to benchmark over HTTP;
+in that case the server's own provider settings apply. Every request
+carries a bench session id, so clue logging never touches the shared log.
+
+Results are printed as a table and written as JSON to ``--output``. Pass
+``--baseline`` with an earlier results file to exit non-zero when any
+scenario's p95 latency or error rate regresses beyond ``--max-regression``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+EVENT_ID = 'event_1'
+CHAT_NPCS = ['baize', 'kui', 'jiuweihu', 'xiangliu']
+CHAT_MESSAGES = [
+    'What is qiongqi?',
+    'Where were you during the eclipse?',
+    'Did you see anything at the altar?',
+    'Tell me about the blood moon.',
+]
+JUDGE_LINES = [
+    'Jiuweihu, explain the snake mark.',
+    'Kui, why did the thunder stop?',
+    'Who was near the altar at 19:00?',
+]
+
+
+def scenario_request(name, rng, worker):
+    """Return (method, path, body) for one request of a scenario"""
+    if name == 'chat':
+        return 'POST', '/api/chat', {
+            'npc_id': rng.choice(CHAT_NPCS),
+            'message': f"{rng.choice(CHAT_MESSAGES)} ({rng.randint(0, 10**6)})"
+        }
+    if name == 'tribunal_auto':
+        return 'POST', '/api/tribunal/act', {'event_id': EVENT_ID, 'action': 'auto'}
+    if name == 'tribunal_choose':
+        return 'POST', '/api/tribunal/act', {
+            'event_id': EVENT_ID, 'action': 'choose', 'speaker': rng.choice(CHAT_NPCS[1:])
+        }
+    if name == 'tribunal_player':
+        return 'POST', '/api/tribunal/act', {
+            'event_id': EVENT_ID, 'action': 'player', 'player_input': rng.choice(JUDGE_LINES)
+        }
+    if name == 'tribunal_round':
+        return 'POST', '/api/tribunal/batch', {'event_id': EVENT_ID, 'mode': 'round'}
+    if name == 'clue_log':
+        return 'POST', '/api/clues/log', {
+            'area': 'Qingqiu Village', 'beast': 'Bench', 'text': f"bench clue {worker}-{rng.random()}"
+        }
+    if name == 'event_get':
+        return 'GET', f'/api/tribunal/event/{EVENT_ID}', None
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+SCENARIOS = ['chat', 'tribunal_auto', 'tribunal_choose', 'tribunal_player', 'tribunal_round', 'clue_log',
+             'event_get']
+
+
+class InProcessTransport:
+    """Drives the Flask app through its test client, one client per thread"""
+
+    def __init__(self):
+        import app as backend
+
+        self.app = backend.app
+        self.backend = backend
+        self._local = threading.local()
+
+    def prefix_cache_stats(self):
+        return self.backend.get_client().prefix_cache_stats()
+
+    def coalescing_stats(self):
+        return self.backend.IN_FLIGHT.stats()
+
+    def request(self, method, path, body, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code
+
+
+class HTTPTransport:
+    def __init__(self, base_url, timeout=60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body, headers):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers={
+            **headers, 'Content-Type': 'application/json'
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(transport, name, requests, concurrency, seed, warmup=5):
+    for idx in range(warmup):  # unmeasured: imports, first connections, lazy clients
+        method, path, body = scenario_request(name, random.Random(-1 - idx), -1 - idx)
+        try:
+            transport.request(method, path, body, {'X-Session-Id': f"bench-{name}-warmup"})
+        except Exception:
+            pass
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(idx):
+        nonlocal errors
+        rng = random.Random(seed * 1000003 + idx)
+        headers = {'X-Session-Id': f"bench-{name}-{idx % concurrency}"}
+        method, path, body = scenario_request(name, rng, idx)
+        start = time.perf_counter()
+        try:
+            status = transport.request(method, path, body, headers)
+            failed = status >= 400
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if failed:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [value * 1000 for value in latencies]
+    return {
+        'scenario': name,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0.0,
+        'throughput_rps': round(requests / wall, 2) if wall else 0.0,
+        'wall_seconds': round(wall, 3),
+        'latency_ms': {
+            'mean': round(sum(ms) / len(ms), 2) if ms else 0.0,
+            'p50': round(percentile(ms, 50), 2),
+            'p95': round(percentile(ms, 95), 2),
+            'p99': round(percentile(ms, 99), 2),
+            'max': round(ms[-1], 2) if ms else 0.0,
+        }
+    }
+
+
+def print_table(results):
+    header = f"{'scenario':<16}{'reqs':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        latency = result['latency_ms']
+        print(
+            f"{result['scenario']:<16}{result['requests']:>7}{result['throughput_rps']:>10}"
+            f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}{result['errors']:>8}"
+        )
+
+
+def compare_to_baseline(results, baseline_path, max_regression):
+    """Return a list of human-readable regressions against a baseline report"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {item['scenario']: item for item in json.load(f).get('results', [])}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['scenario'])
+        if not previous:
+            continue
+        old_p95 = previous['latency_ms']['p95']
+        new_p95 = result['latency_ms']['p95']
+        if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{result['scenario']}: p95 {old_p95}ms -> {new_p95}ms")
+        if result['error_rate'] > previous['error_rate']:
+            regressions.append(
+                f"{result['scenario']}: error rate {previous['error_rate']} -> {result['error_rate']}"
+            )
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process app')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=100, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-dist', default='fixed:0.05',
+                        help='Fake LLM latency, e.g. fixed:0.2, uniform:0.1,0.5, lognormal:-1.5,0.5, exp:0.3')
+    parser.add_argument('--prefill', type=float, default=0.0,
+                        help='Fake LLM prompt-processing seconds per 1000 uncached input tokens')
+    parser.add_argument('--no-prefix-cache', action='store_true',
+                        help='Send flat prompts instead of a cacheable prefix plus suffix')
+    parser.add_argument('--no-coalesce', action='store_true',
+                        help='Send every identical in-flight prompt upstream separately')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per scenario')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed relative p95 increase before failing (default 0.2)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        return 1
+
+    if args.url:
+        transport = HTTPTransport(args.url)
+    else:
+        os.environ['MOONLIT_LLM_PROVIDER'] = 'fake'
+        os.environ['MOONLIT_FAKE_LATENCY_DIST'] = args.latency_dist
+        os.environ['MOONLIT_FAKE_PREFILL'] = str(args.prefill)
+        os.environ['MOONLIT_PREFIX_CACHE'] = '0' if args.no_prefix_cache else '1'
+        if args.no_coalesce:
+            os.environ['MOONLIT_COALESCE_SITES'] = ''
+        os.environ.setdefault('MOONLIT_CACHE_SIZE', '0')  # measure the LLM path, not the cache
+        transport = InProcessTransport()
+
+    results = [
+        run_scenario(transport, name, args.requests, args.concurrency, args.seed, args.warmup)
+        for name in scenarios
+    ]
+    print_table(results)
+    prefix_cache = None if args.url else transport.prefix_cache_stats()
+    if prefix_cache:
+        print(f"\nPrefix cache: {prefix_cache}")
+    coalescing = None if args.url else transport.coalescing_stats()
+    if coalescing:
+        print(f"Coalescing: {coalescing}")
+
+    report = {
+        'target': args.url or 'in-process',
+        'latency_dist': None if args.url else args.latency_dist,
+        'prefill': None if args.url else args.prefill,
+        'prefix_cache': prefix_cache,
+        'coalescing': coalescing,
+        'requests_per_scenario': args.requests,
+        'concurrency': args.concurrency,
+        'seed': args.seed,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
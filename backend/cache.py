@@ -0,0 +1,102 @@
+"""Content-addressed cache for LLM completions.
+
+Entries are keyed by a hash of provider, model and the normalized prompt
+(whitespace collapsed, case folded), so repeated questions map to the same
+key. The memory tier is an LRU with a TTL; an optional disk tier keeps one
+JSON file per key and survives restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    return re.sub(r'\s+', ' ', prompt).strip().casefold()
+
+
+class CompletionCache:
+    def __init__(self, max_entries=1024, ttl=3600.0, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def key(self, provider, model, prompt):
+        raw = "\0".join([provider, model, normalize_prompt(prompt)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if record.get('expires_at', 0) <= now:
+            return None
+        return record
+
+    def _write_disk(self, key, record):
+        if not self.disk_dir:
+            return
+        tmp_path = self._disk_path(key) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, self._disk_path(key))
+
+    def _remember(self, key, record):
+        self._entries[key] = record
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Cached text for key, or None; counts a hit or miss"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            record = self._entries.get(key)
+            if record and record['expires_at'] <= now:
+                del self._entries[key]
+                record = None
+            if record:
+                self._entries.move_to_end(key)
+            else:
+                record = self._read_disk(key, now)
+                if record:
+                    self._remember(key, record)
+            if record:
+                self.hits += 1
+                return record['text']
+            self.misses += 1
+            return None
+
+    def set(self, key, text):
+        if not self.enabled:
+            return
+        record = {'text': text, 'expires_at': time.time() + self.ttl}
+        with self._lock:
+            self._remember(key, record)
+        self._write_disk(key, record)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
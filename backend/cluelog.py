@@ -0,0 +1,189 @@
+"""Append-only, crash-safe log of discovered clues.
+
+Each clue is one JSON line appended to ``discovered_clues.jsonl``. A reset is
+itself an appended ``{"op": "reset"}`` marker, so every write is a single
+O(1) append. Torn trailing lines left by a crash are skipped on read.
+
+Appends are serialized with a thread lock plus an advisory file lock (where
+``fcntl`` is available) so several processes can share one log. Every
+``compact_every`` appends the log is compacted in the background: entries
+before the last reset and unreadable lines are dropped, and the legacy
+``discovered_clues.json`` array is re-exported for older tooling.
+"""
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+from metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+RESET_MARKER = {'op': 'reset'}
+
+
+def is_reset(record):
+    return record.get('op') == 'reset'
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Write JSON to path via a temp file and rename"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ClueLog:
+    def __init__(self, path, export_path=None, compact_every=500, fsync=True):
+        self.path = path
+        self.export_path = export_path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._appends_since_compact = 0
+        self._compacting = False
+        self._seed_from_export()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _seed_from_export(self):
+        """Import an existing discovered_clues.json the first time the log is created"""
+        if os.path.exists(self.path) or not self.export_path or not os.path.exists(self.export_path):
+            return
+        try:
+            with open(self.export_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except json.JSONDecodeError:
+            entries = []
+        with self._locked():
+            if os.path.exists(self.path):
+                return
+            self._write_lines(self.path, entries if isinstance(entries, list) else [])
+
+    def _write_lines(self, path, records):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _append_record(self, record, export=None):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._locked(), timed('moonlit_store_io_seconds', {'store': 'clues', 'op': 'append'}):
+            with open(self.path, 'a+b') as f:
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = b"\n" + line  # keep a torn tail from swallowing this record
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            if export is not None and self.export_path:
+                write_json_atomic(self.export_path, export, ensure_ascii=False, indent=2)
+            self._appends_since_compact += 1
+            due = self.compact_every and self._appends_since_compact >= self.compact_every
+        if due:
+            self.compact_in_background()
+
+    def append(self, entry):
+        self._append_record(entry)
+
+    def reset(self):
+        self._append_record(RESET_MARKER, export=[])
+
+    def _read_records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with timed('moonlit_store_io_seconds', {'store': 'clues', 'op': 'read'}), \
+                open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from a crash
+                if isinstance(record, dict):
+                    records.append(record)
+        return records
+
+    def read(self):
+        """Current clues: everything after the last reset marker"""
+        entries = []
+        for record in self._read_records():
+            if is_reset(record):
+                entries = []
+            else:
+                entries.append(record)
+        return entries
+
+    def export(self):
+        """Write the legacy discovered_clues.json array"""
+        if self.export_path:
+            with self._locked():
+                write_json_atomic(self.export_path, self.read(), ensure_ascii=False, indent=2)
+
+    def compact(self):
+        with self._locked(), timed('moonlit_store_io_seconds', {'store': 'clues', 'op': 'compact'}):
+            entries = self.read()
+            self._write_lines(self.path, entries)
+            if self.export_path:
+                write_json_atomic(self.export_path, entries, ensure_ascii=False, indent=2)
+            self._appends_since_compact = 0
+        return len(entries)
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=run, name='cluelog-compact', daemon=True).start()
+
+
+if __name__ == '__main__':
+    base = os.path.dirname(__file__)
+    log = ClueLog(
+        os.path.join(base, 'discovered_clues.jsonl'),
+        export_path=os.path.join(base, 'discovered_clues.json')
+    )
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    if command == 'compact':
+        print(f"Compacted clue log to {log.compact()} entries")
+    elif command == 'export':
+        log.export()
+        print(f"Exported clue log to {log.export_path}")
+    else:
+        print("Usage: python cluelog.py [export|compact]")
+        sys.exit(1)
@@ -0,0 +1,80 @@
+"""The world clue pool the shrine scene places, merged once on the server.
+
+``clues.json`` lists clues per location. ``crime_clues.json`` (one entry
+or a list) replaces the clues of the crime scene's locations, adding any
+location that is missing. The scene used to fetch both files and merge
+them itself; ``/api/clues/pool`` now serves the merged list, with a
+``version`` hash that changes whenever either file does.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from store import file_signature
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return default
+
+
+def normalize_clues(clues):
+    return [{'clue': clue} if isinstance(clue, str) else {'clue': clue.get('clue')} for clue in clues]
+
+
+def merge_crime_scene_clues(base_locations, crime_data):
+    """Base locations with each crime entry's clues swapped in, as ShrineScene.mergeCrimeSceneClues did"""
+    merged = [dict(location, clues=[dict(clue) for clue in location.get('clues') or []])
+              for location in base_locations]
+    entries = crime_data if isinstance(crime_data, list) else [crime_data] if crime_data else []
+    for entry in entries:
+        if not entry or not entry.get('location') or not entry.get('clues'):
+            continue
+        clues = normalize_clues(entry['clues'])
+        existing = next((idx for idx, location in enumerate(merged) if location.get('name') == entry['location']),
+                        None)
+        if existing is None:
+            merged.append({'name': entry['location'], 'beast': entry.get('beast') or 'Unknown', 'clues': clues})
+        else:
+            merged[existing] = dict(merged[existing], beast=entry.get('beast') or merged[existing].get('beast'),
+                                    clues=clues)
+    return merged
+
+
+class CluePool:
+    """Merged clue pool; file changes are checked at most once per ``check_interval`` seconds"""
+
+    def __init__(self, clues_path, crime_path, check_interval=1.0):
+        self.clues_path = clues_path
+        self.crime_path = crime_path
+        self.check_interval = check_interval
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def signature(self):
+        """Version of the two source files, for cache keys"""
+        now = time.monotonic()
+        with self._lock:
+            if self._signature is None or now - self._checked_at >= self.check_interval:
+                self._signature = (file_signature(self.clues_path), file_signature(self.crime_path))
+                self._checked_at = now
+            return self._signature
+
+    def document(self):
+        base = read_json(self.clues_path, {})
+        locations = merge_crime_scene_clues(base.get('locations', []) if isinstance(base, dict) else [],
+                                            read_json(self.crime_path, None))
+        text = json.dumps(locations, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return {
+            'success': True,
+            'version': hashlib.blake2b(text, digest_size=8).hexdigest(),
+            'locations': locations
+        }
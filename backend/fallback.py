@@ -0,0 +1,172 @@
+"""Pre-generated fallback lines served when the LLM is slow or down.
+
+The bank holds a handful of in-character lines per NPC and situation
+(accused, defending, reacting to a clue, idle). It is written by running
+this module against the configured provider:
+
+    python fallback.py --output fallback_lines.json.gz --per-situation 6
+
+Prompts are built from the ``characters.json`` personas and the
+``events.json`` events each NPC appears in (name and description only,
+never truth or killers). The bank is stored as gzipped JSON.
+
+At runtime a trial line that misses its deadline, fails or is refused
+admission is replaced by a bank line picked for the speaker's situation.
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from speakers import ACCUSATION_PATTERN
+
+
+ACCUSED = 'accused'
+DEFENDING = 'defending'
+CLUE = 'clue'
+IDLE = 'idle'
+SITUATIONS = (ACCUSED, DEFENDING, CLUE, IDLE)
+
+SITUATION_PROMPTS = {
+    ACCUSED: "Another speaker has just accused you of the killing. Answer the accusation.",
+    DEFENDING: "Your name keeps coming up in the debate. Defend yourself or turn suspicion elsewhere.",
+    CLUE: "A new clue has just been raised before the tribunal. React to it without naming specifics.",
+    IDLE: "The tribunal has fallen quiet for a moment. Say something to keep the debate moving.",
+}
+
+CLUE_PATTERN = re.compile(r"\b(clue|clues|evidence|found|mark|trace|traces|proof)\b|线索|证据", re.IGNORECASE)
+LINE_PREFIX = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(__file__), 'fallback_lines.json.gz')
+
+
+def classify_situation(npc_id, history, find):
+    """Situation of npc_id given the transcript; find(text) returns mentioned roster ids"""
+    recent = [item.get('text', '') for item in history[-3:]]
+    if not recent:
+        return IDLE
+    last = recent[-1]
+    if npc_id in find(last) and ACCUSATION_PATTERN.search(last):
+        return ACCUSED
+    if any(npc_id in find(text) for text in recent):
+        return DEFENDING
+    if CLUE_PATTERN.search(last):
+        return CLUE
+    return IDLE
+
+
+class FallbackBank:
+    """Read-only bank of lines: {npc_id: {situation: [line, ...]}}"""
+
+    def __init__(self, lines=None):
+        self.lines = lines or {}
+
+    @classmethod
+    def load(cls, path):
+        """Bank stored at path; an empty bank when the file is missing"""
+        if not path or not os.path.exists(path):
+            return cls()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return cls(json.load(f).get('lines', {}))
+
+    def __len__(self):
+        return sum(len(lines) for situations in self.lines.values() for lines in situations.values())
+
+    def has(self, npc_id):
+        return any(self.lines.get(npc_id, {}).values())
+
+    def pick(self, npc_id, situation, history):
+        """A line for the situation (idle lines if it has none), avoiding ones already said"""
+        situations = self.lines.get(npc_id, {})
+        lines = situations.get(situation) or situations.get(IDLE) or []
+        if not lines:
+            return None
+        said = {item.get('text') for item in history}
+        fresh = [line for line in lines if line not in said] or lines
+        return fresh[len(history) % len(fresh)]
+
+
+def npc_events(npc_id, events):
+    return [event for event in events if npc_id in event.get('npcs', [])]
+
+
+def build_prompt(npc_id, data, events, situation, count):
+    case_lines = "\n".join(
+        f"- {event.get('name', '')}: {event.get('description', '')}" for event in npc_events(npc_id, events)
+    )
+    return (
+        f"{data.get('system_prompt', '')}\n"
+        f"Current emotion: {data.get('emotion_state', 'neutral')}\n\n"
+        f"You are speaking before a tribunal judging these cases:\n{case_lines or '- an unsolved killing'}\n\n"
+        f"{SITUATION_PROMPTS[situation]}\n"
+        f"Write {count} different things you might say, one per line, each under 40 words. "
+        f"Stay in character and do not mention other characters or clues by name. "
+        f"No numbering, no quotation marks, no narration."
+    )
+
+
+def parse_lines(text, count):
+    lines = []
+    for raw in (text or '').splitlines():
+        line = LINE_PREFIX.sub('', raw).strip().strip('"“”')
+        if line and not line.startswith('Error:') and line not in lines:
+            lines.append(line)
+    return lines[:count]
+
+
+def build_bank(characters, events, client, per_situation=6):
+    """{npc_id: {situation: [lines]}} generated with client for every roster NPC"""
+    jobs = [(npc_id, situation) for npc_id in characters for situation in SITUATIONS]
+
+    def generate(job):
+        npc_id, situation = job
+        prompt = build_prompt(npc_id, characters[npc_id], events, situation, per_situation)
+        return job, parse_lines(client.generate(prompt, site='fallback_build'), per_situation)
+
+    lines = {}
+    with ThreadPoolExecutor(max_workers=client.max_concurrency) as pool:
+        for (npc_id, situation), generated in pool.map(generate, jobs):
+            if generated:
+                lines.setdefault(npc_id, {})[situation] = generated
+    return lines
+
+
+def write_bank(path, lines, provider, model):
+    record = {'version': 1, 'provider': provider, 'model': model,
+              'built_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'lines': lines}
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from llm import get_client
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=DEFAULT_BANK_PATH)
+    parser.add_argument('--per-situation', type=int, default=6, help='Lines per NPC and situation')
+    parser.add_argument('--characters', default=os.path.join(os.path.dirname(__file__), 'characters.json'))
+    parser.add_argument('--events', default=os.path.join(os.path.dirname(__file__), 'events.json'))
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+
+    load_dotenv()
+    with open(args.characters, 'r', encoding='utf-8') as f:
+        characters = json.load(f)
+    with open(args.events, 'r', encoding='utf-8') as f:
+        events = json.load(f)
+    client = get_client()
+    lines = build_bank(characters, events, client, args.per_situation)
+    write_bank(args.output, lines, client.name, client.model)
+    bank = FallbackBank(lines)
+    print(f"Wrote {len(bank)} lines for {len(lines)} characters to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
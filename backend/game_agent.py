@@ -1,121 +1,268 @@
-# need choose npc before game
-class gameAgent:
-    def __init__(self, npc_list, event):
-
-        # event
-        self.event = event
-        self.public_clue = "\n".join(f"{idx}. {c['clue']}" for idx, c in enumerate(event["p_clues"], start=1))
-        self.public_dialogue = event['game_logs']
-
-        # characters
-        with open("app/data/characters.json", "r", encoding="utf-8") as f:
-            characters = json.load(f)
-        if npc_list == None:
-            self.npc_list = event['npcs']
-        else:
-            self.npc_list = npc_list
-        self.visual = {char_id: char_data["appearance"] for char_id, char_data in characters.items()}
-        self.ability = {char_id: char_data["abilities"] for char_id, char_data in characters.items()}
-
-        # game_status
-        self.trail = True
-
-    def process(self):
-        print(f"Chapter 1 - Event trail start: {self.event['name']}")
-        print(f"Clue Board:\n{self.public_clue}")
-
-    # globally decide who speak next
-    def pick_next_speaker(self):
-        context = f"""
-            The Event name: {self.event['name']}.
-            The Case Description: {self.event['description']}.
-            Previous Game Conversation: {self.public_dialogue}
-        """
-        result = call_gemini(f"""
-            You are a game organizer. 
-            Based on the previous game conversation content, select the next speaker from the {self.npc_list}. 
-            You should prioritize Judge's requirements.
-            If the judge does not explicitly point it out, analyze through the content of the conversation who is more suitable to speak at this time. 
-            It might have been mentioned by another character, or the content of the conversation implies that it is related to the character.
-            If there is no clear direction, please analyze the dialogue content and select the speaker who can best provoke the plot twist.
-            One character cannot continuously speak more than 2 rounds.
-            Dialogue content:{context}, npc_list:{self.npc_list}, please only output the name of your choice, for example: 'Next speaker: Baize'.
-            Next speaker: 
-        """)
-        last_index = -1
-        last_npc = self.npc_list[0]
-        for npc in self.npc_list:
-            idx = str(result).lower().rfind(npc)
-            if idx > last_index:
-                last_index = idx
-                last_npc = npc
-        return last_npc
-
-    # user action
-    def user_act(self, choice):
-        if choice == 1: # pass to agent
-            cur_npc = self.pick_next_speaker()
-        elif choice == 2: # choose char to speak
-            lines = " ".join(f"{idx}. {c}" for idx, c in enumerate(self.npc_list, start=1))
-            print(f"please choose the speaker:\n{lines}")
-            idx = input("input the speaker index number (1 or 2 or 3...): ").strip()
-            cur_npc = self.npc_list[int(idx) - 1]
-        elif choice == 3: # choose to speak
-            user_dia = input("please say something: ").strip()
-            self.public_dialogue.append({"Judge(player)":f"{user_dia}"})
-            cur_npc = self.pick_next_speaker()
-        else:
-            print("User action wrong - user_act")
-        return cur_npc
+"""Headless tribunal simulator for throughput and balance testing.
+
+Plays complete trials through the same turn logic as ``/api/tribunal/act``
+(``app.play_tribunal_turn``), each in its own player session, across a
+pool of worker processes. By default the fake LLM provider is used, so no
+API key is needed:
+
+    python game_agent.py --trials 200 --workers 8 --latency-dist fixed:0.05
 
-    # agent action
-    def char_act(selfcur_npc):
-        char_dia = speak(cur_npc)
-        self.public_dialogue.append({f"{cur_npc}":f"{char_dia}"})
-        return event
+Pass ``--provider gemini`` (or anything ``MOONLIT_LLM_PROVIDER`` accepts)
+to play against a real model with the usual ``.env`` settings.
 
-    def speak(cur_npc):
-        npc = NPCAgent(cur_npc)
-        char_dia = npc.speak(event)
-        print(char_dia)
-        return char_dia
+The Judge is scripted or random. ``--judge-script`` takes a text file, one
+turn per line: a blank line or ``-`` lets the moderator pick, ``@kui``
+makes kui speak, anything else is said by the Judge. The script repeats
+when it runs out. Without a script the Judge speaks on about
+``--judge-rate`` of turns, accusing NPCs or pressing them on clues.
 
+After ``--min-turns`` turns, the random Judge gives a verdict on about
+``--verdict-rate`` of its lines. A trial ends when the verdict engine
+(``verdict.py``) closes it, solved or wrong, or at ``--max-turns``. The
+report gives turns per second, LLM calls and prompt tokens per trial, the
+largest prompt seen, and how trials ended.
+"""
+import argparse
+import json
+import os
 import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from bench import percentile
+from prompts import CHARS_PER_TOKEN
+
+
+JUDGE_TEMPLATES = [
+    "{npc}, you killed the priest. Confess!",
+    "{npc}, where were you at the time of the killing?",
+    "{npc}, explain this: {clue}",
+    "I suspect {npc}. Does anyone defend them?",
+    "Who else was near the altar? {npc}, answer me.",
+]
+VERDICT_TEMPLATES = [
+    "I accuse {npc}!",
+    "The killer is {npc}.",
+]
+
+_backend = None
+
+
+def init_worker(env):
+    """Process pool initializer: configure the provider, then load the app once"""
+    global _backend
+    os.environ.update(env)
+    import app
+    _backend = app
+
+
+def read_script(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def scripted_turn(line):
+    line = line.strip()
+    if not line or line == '-':
+        return {'action': 'auto'}
+    if line.startswith('@'):
+        return {'action': 'choose', 'speaker': line[1:].strip()}
+    return {'action': 'player', 'player_input': line}
+
+
+def random_turn(rng, event, judge_rate, verdict_rate=0.0):
+    if rng.random() >= judge_rate:
+        return {'action': 'auto'}
+    if rng.random() < verdict_rate:
+        line = rng.choice(VERDICT_TEMPLATES).format(npc=rng.choice(event['npcs']))
+        return {'action': 'player', 'player_input': line}
+    clues = [clue.get('text', '') for clue in event.get('p_clues', []) if isinstance(clue, dict)]
+    template = rng.choice(JUDGE_TEMPLATES if clues else [t for t in JUDGE_TEMPLATES if '{clue}' not in t])
+    line = template.format(npc=rng.choice(event['npcs']), clue=rng.choice(clues) if clues else '')
+    return {'action': 'player', 'player_input': line}
+
+
+def llm_totals():
+    calls, prompt_chars = _backend.METRICS.histogram_totals('moonlit_llm_prompt_chars')
+    return calls, prompt_chars, _backend.METRICS.counter_total('moonlit_llm_errors_total')
+
+
+def run_trial(job):
+    """Play one trial to the end; returns its stats"""
+    index, event_id, seed, options = job
+    rng = random.Random(seed)
+    session_id = f"sim-{seed}-{index}"
+    event = _backend.get_event_by_id(event_id, session_id)
+    trial_id = _backend.TRIALS.start(event_id, session_id)['trial_id'] if options['log_trials'] else None
+    script = options['script']
+    calls_before, chars_before, errors_before = llm_totals()
+    started = time.perf_counter()
+
+    turns = 0
+    max_prompt = 0
+    speakers = Counter()
+    judge_lines = 0
+    clues_cited = 0
+    outcome = 'max_turns'
+    while turns < options['max_turns']:
+        if script:
+            data = scripted_turn(script[turns % len(script)])
+        else:
+            verdict_rate = options['verdict_rate'] if turns >= options['min_turns'] else 0.0
+            data = random_turn(rng, event, options['judge_rate'], verdict_rate)
+        data['event_id'] = event_id
+        if trial_id:
+            data['trial_id'] = trial_id
+        payload, error = _backend.play_tribunal_turn(data, session_id)
+        if error:
+            outcome = f"error {error[1]}"
+            break
+        turns += 1
+        judge_lines += data['action'] == 'player'
+        speakers[payload['speaker']] += 1
+        max_prompt = max(max_prompt, payload['prompt_tokens'].get('total', 0))
+        clues_cited = len(payload['verdict']['clues_cited'])
+        if payload['verdict']['closed']:
+            outcome = payload['verdict']['status']
+            break
+
+    _backend.SUMMARIES.wait()
+    calls_after, chars_after, errors_after = llm_totals()
+    return {
+        'trial': index,
+        'event_id': event_id,
+        'trial_id': trial_id,
+        'outcome': outcome,
+        'turns': turns,
+        'judge_lines': judge_lines,
+        'clues_cited': clues_cited,
+        'seconds': time.perf_counter() - started,
+        'llm_calls': calls_after - calls_before,
+        'llm_errors': errors_after - errors_before,
+        'prompt_tokens': round((chars_after - chars_before) / CHARS_PER_TOKEN),
+        'max_prompt_tokens': max_prompt,
+        'speakers': dict(speakers),
+    }
+
+
+def distribution(values):
+    values = sorted(values)
+    return {
+        'mean': round(sum(values) / len(values), 2) if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': values[-1] if values else 0,
+    }
+
+
+def summarize(trials, wall):
+    turns = sum(trial['turns'] for trial in trials)
+    speakers = Counter()
+    for trial in trials:
+        speakers.update(trial['speakers'])
+    return {
+        'trials': len(trials),
+        'turns': turns,
+        'wall_seconds': round(wall, 3),
+        'turns_per_second': round(turns / wall, 2) if wall else 0.0,
+        'turns_per_trial': distribution([trial['turns'] for trial in trials]),
+        'llm_calls_per_trial': distribution([trial['llm_calls'] for trial in trials]),
+        'llm_errors': sum(trial['llm_errors'] for trial in trials),
+        'prompt_tokens_per_trial': distribution([trial['prompt_tokens'] for trial in trials]),
+        'max_prompt_tokens': distribution([trial['max_prompt_tokens'] for trial in trials]),
+        'outcomes': dict(Counter(trial['outcome'] for trial in trials)),
+        'speaker_share': {npc: round(count / turns, 3) for npc, count in speakers.most_common()} if turns else {},
+    }
+
+
+def print_report(report):
+    print(f"{report['trials']} trials, {report['turns']} turns in {report['wall_seconds']}s "
+          f"({report['turns_per_second']} turns/s)")
+    header = f"{'per trial':<20}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}"
+    print(header)
+    print('-' * len(header))
+    for key in ('turns_per_trial', 'llm_calls_per_trial', 'prompt_tokens_per_trial', 'max_prompt_tokens'):
+        stats = report[key]
+        print(f"{key.replace('_per_trial', ''):<20}{stats['mean']:>10}{stats['p50']:>10}{stats['p95']:>10}"
+              f"{stats['max']:>10}")
+    print(f"\nOutcomes: {report['outcomes']}")
+    print(f"Speaker share: {report['speaker_share']}")
+    if report['llm_errors']:
+        print(f"LLM errors: {report['llm_errors']}")
 
 
-def run_trial(event):
-    game, npc_pool = setup_trial(event)
-    round_count = 0
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Worker processes')
+    parser.add_argument('--events', help='Comma-separated event ids (default: every event)')
+    parser.add_argument('--provider', default='fake', help='LLM provider for the workers')
+    parser.add_argument('--latency-dist', default='fixed:0.0',
+                        help='Fake LLM latency, e.g. fixed:0.2, uniform:0.1,0.5, lognormal:-1.5,0.5')
+    parser.add_argument('--judge-script', help='Scripted Judge turns, one per line')
+    parser.add_argument('--judge-rate', type=float, default=0.3,
+                        help='Share of turns where the random Judge speaks')
+    parser.add_argument('--verdict-rate', type=float, default=0.25,
+                        help='Share of random Judge lines that name the killer')
+    parser.add_argument('--min-turns', type=int, default=6, help='Turns before the random Judge gives verdicts')
+    parser.add_argument('--max-turns', type=int, default=30)
+    parser.add_argument('--log-trials', action='store_true',
+                        help='Write each trial to the trial log (MOONLIT_TRIAL_DIR) for replay')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='sim_results.json')
+    return parser.parse_args(argv)
 
-    while game.trail:
-        print(f"\nRound {round_count + 1} ----")
 
-        choice = random.choice([1, 3])
-        cur_npc = game.user_act(choice)
+def main(argv=None):
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    with open(os.path.join(os.path.dirname(__file__), 'events.json'), 'r', encoding='utf-8') as f:
+        event_ids = [event['id'] for event in json.load(f)]
+    if args.events:
+        wanted = [name.strip() for name in args.events.split(',') if name.strip()]
+        unknown = set(wanted) - set(event_ids)
+        if unknown:
+            print(f"Unknown events: {', '.join(sorted(unknown))}")
+            return 1
+        event_ids = wanted
 
-        if cur_npc not in npc_pool:
-            print(f"[System] {cur_npc} not found in npc_pool.")
-            continue
+    env = {
+        'MOONLIT_LLM_PROVIDER': args.provider,
+        'MOONLIT_CACHE_SIZE': os.environ.get('MOONLIT_CACHE_SIZE', '0'),  # every turn goes to the LLM
+    }
+    if args.provider == 'fake':
+        env['MOONLIT_FAKE_LATENCY_DIST'] = args.latency_dist
+    options = {
+        'script': read_script(args.judge_script) if args.judge_script else None,
+        'judge_rate': args.judge_rate,
+        'verdict_rate': args.verdict_rate,
+        'min_turns': args.min_turns,
+        'max_turns': args.max_turns,
+        'log_trials': args.log_trials,
+    }
+    jobs = [(idx, event_ids[idx % len(event_ids)], args.seed * 1000003 + idx, options)
+            for idx in range(args.trials)]
 
-        npc = npc_pool[cur_npc]
-        npc_dialogue = npc.speak(game.event)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(env,)) as pool:
+        trials = list(pool.map(run_trial, jobs))
+    report = summarize(trials, time.perf_counter() - started)
+    print_report(report)
 
-        game.public_dialogue.append({cur_npc: npc_dialogue})
-        game.event["game_logs"].append({cur_npc: npc_dialogue})
-        print(f"\n[{cur_npc.lower()}]: {npc_dialogue}\n")
+    report.update({
+        'provider': args.provider,
+        'latency_dist': args.latency_dist if args.provider == 'fake' else None,
+        'workers': args.workers,
+        'seed': args.seed,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'per_trial': trials,
+    })
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    return 0
 
-        round_count += 1
-        if 5 < round_count < 15:
-            result = call_ollama(f"""
-                You are the trial narrator. 
-                The following is the dialogue so far:
-                {game.public_dialogue}
-                Determine if the judge made the decision that who is the killer.
-                Respond with 'continue' or 'end'.
-            """)
-            if "end" in str(result).lower():
-                game.trail = False
-                print(">>> The trial has ended (LLM decided).")
-                break
 
-    return game.public_dialogue
+if __name__ == '__main__':
+    sys.exit(main())
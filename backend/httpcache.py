@@ -0,0 +1,67 @@
+"""Serialized JSON documents with content-hash ETags.
+
+Characters, the event list and the clue pool change rarely, but were
+rebuilt and reserialized on every request. ``DocumentCache`` keeps each
+one's bytes (and compressed copies) until its version changes. A version
+is any value the caller can compare cheaply: a store snapshot, or file
+signatures. The ETag hashes the body, so clients can revalidate with
+``If-None-Match`` and get a 304.
+
+ETags are weak because the body may be sent gzip- or brotli-encoded.
+"""
+import hashlib
+import threading
+
+import wire
+
+
+def etag_for(body):
+    return f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names etag; weak and strong forms compare equal"""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def cache_control(max_age=0):
+    return f"public, max-age={max_age}, must-revalidate"
+
+
+class Document:
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.etag = etag_for(body)
+        self._encoded = {}
+
+    def encoded(self, accept_encoding, min_size=1024):
+        """(body, encoding) to send, compressed at most once per encoding"""
+        encoding = wire.pick_encoding(accept_encoding, len(self.body), min_size)
+        if encoding is None:
+            return self.body, None
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = wire.encode(self.body, encoding)
+        return body, encoding
+
+
+class DocumentCache:
+    def __init__(self):
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, build):
+        """Document name at version; build() returns its JSON payload when it has to be serialized"""
+        with self._lock:
+            document = self._documents.get(name)
+            if document is None or document.version != version:
+                document = self._documents[name] = Document(version, wire.dumps(build()))
+            return document
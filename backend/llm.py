@@ -0,0 +1,744 @@
+"""LLM provider layer for the Moonlit backend.
+
+Providers are built once per process and shared by every request. Each
+provider sits behind an ``LLMClient`` that bounds concurrency, applies a
+timeout and retries transient failures with exponential backoff.
+
+Select the provider with ``MOONLIT_LLM_PROVIDER`` (``gemini`` or ``fake``).
+Async callers (the ASGI server) use ``agenerate``/``astream``, which are
+capped separately by ``MOONLIT_ASYNC_UPSTREAM_LIMIT``.
+
+Every call takes the volatile part of the prompt plus an optional stable
+``prefix`` (persona, case, clues). Providers that support it cache the
+prefix between calls; ``MOONLIT_PREFIX_CACHE=0`` sends one flat prompt.
+
+Calls are tagged with a ``site`` naming the game feature that made them;
+latency, sizes, errors and retries are recorded per site in ``metrics``.
+With ``MOONLIT_LLM_RATE`` set, every upstream attempt is first admitted by
+an ``admission.QuotaScheduler``, which ranks sites by priority class and
+raises ``admission.Overloaded`` rather than queueing a call too long.
+"""
+import asyncio
+import atexit
+import datetime
+import hashlib
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from admission import QuotaScheduler, parse_class_map, site_class
+from metrics import record_llm_call
+
+
+DEFAULT_PROVIDER = 'gemini'
+DEFAULT_GEMINI_MODEL = 'gemini-2.5-flash'
+
+# Per-provider defaults; each can be overridden with MOONLIT_LLM_* env vars.
+PROVIDER_DEFAULTS = {
+    'gemini': {'max_concurrency': 8, 'timeout': 30.0, 'max_retries': 2, 'backoff': 0.5, 'rate': 10.0},
+    'fake': {'max_concurrency': 64, 'timeout': 5.0, 'max_retries': 0, 'backoff': 0.0, 'rate': 0.0},
+}
+
+
+class LLMError(Exception):
+    """Raised when a provider call fails after all retries"""
+
+
+class LLMTimeout(LLMError):
+    """Raised when a provider call exceeds its timeout"""
+
+
+class LLMCancelled(LLMError):
+    """Raised when a call's cancel event is set before it went upstream"""
+
+
+def prefix_key(prefix):
+    return hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+
+
+async def next_chunk(chunks):
+    """Next item of an async iterator, or None at its end (the anext builtin needs Python 3.10)"""
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class GeminiProvider:
+    """Google Gemini provider with a fixed pool of reusable model clients.
+
+    Prefixes of at least ``cache_min_tokens`` are uploaded once as a
+    ``CachedContent`` (when the installed SDK has ``caching``) and later
+    calls send only the suffix. Shorter prefixes are sent inline ahead of
+    the suffix, where Gemini's implicit prefix caching can still apply.
+
+    At most ``cache_size`` caches are kept. Expired, evicted and replaced
+    caches are deleted upstream rather than left to run out their TTL, and
+    the rest are deleted at exit. A prefix the server refused is sent
+    inline for ``cache_ttl`` seconds before it is tried again.
+    """
+    name = 'gemini'
+
+    def __init__(self, model=DEFAULT_GEMINI_MODEL, pool_size=8, api_key=None, cache_ttl=600.0,
+                 cache_min_tokens=1024, cache_size=256, request_timeout=None):
+        import google.generativeai as genai
+
+        try:
+            from google.generativeai import caching
+        except ImportError:
+            caching = None
+
+        genai.configure(api_key=api_key or os.environ["GOOGLE_API_KEY"])
+        self.model = model
+        self.cache_ttl = cache_ttl
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_size = cache_size
+        # The SDK deadline frees a worker the client has given up on; without it a call can hang forever.
+        self._request_options = {'timeout': request_timeout} if request_timeout else {}
+        self._genai = genai
+        self._caching = caching
+        self._clients = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._clients.put(genai.GenerativeModel(model))
+        # Async calls never block on checkout, so they share one client.
+        self._async_client = genai.GenerativeModel(model)
+        self._cached_models = OrderedDict()  # key -> (client, cached content, refresh at)
+        self._cache_pending = set()
+        self._cache_failed = OrderedDict()  # key -> retry at
+        self._cache_lock = threading.Lock()
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        atexit.register(self.close)
+
+    def _cached_model(self, prefix):
+        """Model bound to a server-side cache of prefix, or None to send it inline"""
+        if not prefix or self._caching is None or len(prefix) < self.cache_min_tokens * 4:
+            return None
+        key = prefix_key(prefix)
+        now = time.time()
+        with self._cache_lock:
+            entry = self._cached_models.get(key)
+            if entry and entry[2] > now:
+                self._cached_models.move_to_end(key)
+                self.prefix_hits += 1
+                return entry[0]
+            self.prefix_misses += 1
+            if key in self._cache_pending or self._cache_failed.get(key, 0) > now:
+                return None
+            self._cache_pending.add(key)
+        try:
+            cached = self._caching.CachedContent.create(
+                model=f"models/{self.model}",
+                contents=[prefix],
+                ttl=datetime.timedelta(seconds=self.cache_ttl)
+            )
+            client = self._genai.GenerativeModel.from_cached_content(cached_content=cached)
+        except Exception:
+            # Unsupported model or prefix below the server minimum: stay inline for a while.
+            with self._cache_lock:
+                self._cache_pending.discard(key)
+                self._cache_failed.pop(key, None)
+                self._cache_failed[key] = now + self.cache_ttl
+                while self._cache_failed and (len(self._cache_failed) > self.cache_size
+                                              or next(iter(self._cache_failed.values())) <= now):
+                    self._cache_failed.popitem(last=False)
+            return None
+        with self._cache_lock:
+            self._cache_pending.discard(key)
+            stale = [self._cached_models.pop(k)[1] for k, entry in list(self._cached_models.items())
+                     if k == key or entry[2] <= now]
+            # Refresh a little early so a call never races the server-side expiry.
+            self._cached_models[key] = (client, cached, now + self.cache_ttl * 0.9)
+            while len(self._cached_models) > self.cache_size:
+                stale.append(self._cached_models.popitem(last=False)[1][1])
+        self._delete_caches(stale)
+        return client
+
+    def _delete_caches(self, caches):
+        for cached in caches:
+            try:
+                cached.delete()
+            except Exception:
+                pass  # already expired upstream
+
+    def close(self):
+        """Delete every prefix cache this provider created"""
+        with self._cache_lock:
+            caches = [cached for _, cached, _ in self._cached_models.values()]
+            self._cached_models.clear()
+        self._delete_caches(caches)
+
+    def generate(self, prompt, prefix=''):
+        cached = self._cached_model(prefix)
+        if cached is not None:
+            return cached.generate_content(prompt, request_options=self._request_options).text
+        client = self._clients.get()
+        try:
+            response = client.generate_content(prefix + prompt, request_options=self._request_options)
+            return response.text
+        finally:
+            self._clients.put(client)
+
+    def _stream_chunks(self, response):
+        for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+    def stream(self, prompt, prefix=''):
+        cached = self._cached_model(prefix)
+        if cached is not None:
+            yield from self._stream_chunks(cached.generate_content(prompt, stream=True,
+                                                                   request_options=self._request_options))
+            return
+        client = self._clients.get()
+        try:
+            yield from self._stream_chunks(client.generate_content(prefix + prompt, stream=True,
+                                                                   request_options=self._request_options))
+        finally:
+            self._clients.put(client)
+
+    async def agenerate(self, prompt, prefix=''):
+        cached = await asyncio.to_thread(self._cached_model, prefix) if prefix else None
+        if cached is not None:
+            response = await cached.generate_content_async(prompt, request_options=self._request_options)
+        else:
+            response = await self._async_client.generate_content_async(prefix + prompt,
+                                                                       request_options=self._request_options)
+        return response.text
+
+    async def astream(self, prompt, prefix=''):
+        cached = await asyncio.to_thread(self._cached_model, prefix) if prefix else None
+        if cached is not None:
+            response = await cached.generate_content_async(prompt, stream=True,
+                                                           request_options=self._request_options)
+        else:
+            response = await self._async_client.generate_content_async(prefix + prompt, stream=True,
+                                                                       request_options=self._request_options)
+        async for chunk in response:
+            text = getattr(chunk, 'text', '')
+            if text:
+                yield text
+
+    def prefix_cache_stats(self):
+        with self._cache_lock:
+            return {
+                'hits': self.prefix_hits,
+                'misses': self.prefix_misses,
+                'size': len(self._cached_models),
+                'available': self._caching is not None
+            }
+
+
+def parse_latency_dist(spec):
+    """Parse a latency distribution spec into ``sample(rng) -> seconds``.
+
+    Supported: ``fixed:S``, ``uniform:LO,HI``, ``normal:MEAN,STDDEV``,
+    ``lognormal:MU,SIGMA`` (of the underlying normal) and ``exp:MEAN``.
+    """
+    kind, _, raw_args = spec.partition(':')
+    args = [float(arg) for arg in raw_args.split(',') if arg.strip()]
+    samplers = {
+        'fixed': lambda rng: args[0],
+        'uniform': lambda rng: rng.uniform(args[0], args[1]),
+        'normal': lambda rng: max(0.0, rng.gauss(args[0], args[1])),
+        'lognormal': lambda rng: rng.lognormvariate(args[0], args[1]),
+        'exp': lambda rng: rng.expovariate(1.0 / args[0]) if args[0] > 0 else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return samplers[kind]
+
+
+class FakeProvider:
+    """Deterministic offline provider for load tests and local development.
+
+    The reply is derived from a hash of the full prompt, so identical prompts
+    always produce identical text however they are split. Words are sampled
+    from the prompt itself, which keeps roster ids in play for speaker
+    selection. Latency is either ``latency`` plus uniform ``jitter`` or drawn
+    from ``latency_dist``.
+
+    ``prefill`` adds seconds per 1000 input tokens before the first token.
+    Prefixes seen within ``cache_ttl`` are billed at ``cache_discount`` of
+    that cost, simulating a provider-side prefix cache.
+    """
+    name = 'fake'
+
+    def __init__(self, model='fake-1', latency=0.0, jitter=0.0, seed=0, latency_dist=None,
+                 prefill=0.0, cache_ttl=600.0, cache_discount=0.1, cache_size=1024):
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.latency_dist = parse_latency_dist(latency_dist) if latency_dist else None
+        self._latency_rng = random.Random(seed)
+        self.prefill = prefill
+        self.cache_ttl = cache_ttl
+        self.cache_discount = cache_discount
+        self.cache_size = cache_size
+        self._prefixes = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.cached_tokens = 0
+
+    def _rng(self, prompt):
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _latency(self, rng):
+        if self.latency_dist:
+            # Latency varies per call even for identical prompts.
+            return self.latency_dist(self._latency_rng)
+        return self.latency + rng.uniform(0, self.jitter) if self.jitter else self.latency
+
+    def _prefix_cached(self, prefix):
+        """Look up (and then remember) prefix in the simulated cache"""
+        key = prefix_key(prefix)
+        now = time.monotonic()
+        with self._cache_lock:
+            expires = self._prefixes.pop(key, 0)
+            hit = expires > now
+            self._prefixes[key] = now + self.cache_ttl
+            while len(self._prefixes) > self.cache_size:
+                self._prefixes.popitem(last=False)
+            if hit:
+                self.prefix_hits += 1
+                self.cached_tokens += len(prefix) // 4
+            else:
+                self.prefix_misses += 1
+        return hit
+
+    def _prefill(self, prompt, prefix):
+        """Simulated prompt-processing time before the first token"""
+        prefix_tokens = len(prefix) / 4
+        if prefix and self._prefix_cached(prefix):
+            prefix_tokens *= self.cache_discount
+        return self.prefill * (prefix_tokens + len(prompt) / 4) / 1000
+
+    def _compose(self, rng, prompt):
+        words = re.findall(r"[A-Za-z][A-Za-z'-]+", prompt) or ['silence']
+        count = rng.randint(8, 24)
+        sentence = " ".join(rng.choice(words) for _ in range(count))
+        return sentence[:1].upper() + sentence[1:] + "."
+
+    def generate(self, prompt, prefix=''):
+        rng = self._rng(prefix + prompt)
+        delay = self._latency(rng) + self._prefill(prompt, prefix)
+        if delay > 0:
+            time.sleep(delay)
+        return self._compose(rng, prefix + prompt)
+
+    async def agenerate(self, prompt, prefix=''):
+        rng = self._rng(prefix + prompt)
+        delay = self._latency(rng) + self._prefill(prompt, prefix)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._compose(rng, prefix + prompt)
+
+    def stream(self, prompt, prefix=''):
+        """Yield the same reply as generate, one word at a time.
+
+        Prefill plus a quarter of the simulated latency is spent before the
+        first token, the rest is spread evenly over the remaining words.
+        """
+        rng = self._rng(prefix + prompt)
+        delay = self._latency(rng)
+        first_token = delay * 0.25 + self._prefill(prompt, prefix)
+        words = self._compose(rng, prefix + prompt).split(" ")
+        if first_token > 0:
+            time.sleep(first_token)
+        step = delay * 0.75 / max(len(words) - 1, 1)
+        for idx, word in enumerate(words):
+            if idx and step > 0:
+                time.sleep(step)
+            yield word if idx == 0 else " " + word
+
+    async def astream(self, prompt, prefix=''):
+        rng = self._rng(prefix + prompt)
+        delay = self._latency(rng)
+        first_token = delay * 0.25 + self._prefill(prompt, prefix)
+        words = self._compose(rng, prefix + prompt).split(" ")
+        if first_token > 0:
+            await asyncio.sleep(first_token)
+        step = delay * 0.75 / max(len(words) - 1, 1)
+        for idx, word in enumerate(words):
+            if idx and step > 0:
+                await asyncio.sleep(step)
+            yield word if idx == 0 else " " + word
+
+    def prefix_cache_stats(self):
+        with self._cache_lock:
+            return {
+                'hits': self.prefix_hits,
+                'misses': self.prefix_misses,
+                'size': len(self._prefixes),
+                'cached_tokens': self.cached_tokens
+            }
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'fake': FakeProvider,
+}
+
+
+class LLMClient:
+    """Concurrency-limited, retrying front for a single provider.
+
+    Sync calls and streams share ``max_concurrency`` slots. A timed-out
+    ``generate`` or stalled ``stream`` cannot stop its worker thread, so it
+    keeps its slot until the provider actually returns (Gemini calls carry
+    the timeout as an SDK deadline, so that happens). Abandoned calls
+    therefore count against the limit, and new calls wait up to their
+    timeout for a slot instead of adding upstream load on top of them.
+    """
+
+    def __init__(self, provider, max_concurrency=8, timeout=30.0, max_retries=2, backoff=0.5,
+                 async_limit=256, prefix_cache=True, scheduler=None):
+        self.provider = provider
+        self.scheduler = scheduler
+        self.prefix_cache = prefix_cache
+        self.max_concurrency = max_concurrency
+        self.async_limit = async_limit
+        self._async_slots = None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix=f"llm-{provider.name}"
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._status_lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._last_success = None
+        self._last_error = None
+        self._last_error_at = None
+
+    @property
+    def name(self):
+        return self.provider.name
+
+    @property
+    def model(self):
+        return self.provider.model
+
+    def _split(self, prompt, prefix):
+        if self.prefix_cache:
+            return prompt, prefix
+        return prefix + prompt, ''
+
+    def prefix_cache_stats(self):
+        stats = getattr(self.provider, 'prefix_cache_stats', None)
+        info = stats() if stats else {}
+        info['enabled'] = self.prefix_cache
+        return info
+
+    def status(self):
+        """Upstream health as seen by recent calls"""
+        with self._status_lock:
+            status = {
+                'provider': self.name,
+                'model': self.model,
+                'up': self._consecutive_failures == 0,
+                'consecutive_failures': self._consecutive_failures,
+                'last_success': self._last_success,
+                'last_error': self._last_error,
+                'last_error_at': self._last_error_at
+            }
+        if self.scheduler is not None:
+            status['admission'] = self.scheduler.stats()
+        return status
+
+    def _admit(self, site, cancel=None):
+        """Wait for admission; False if cancel was set first"""
+        if self.scheduler is None:
+            return True
+        if cancel is None:
+            self.scheduler.acquire(site_class(site))
+            return True
+        return self.scheduler.acquire(site_class(site), cancel)
+
+    def _refund(self):
+        if self.scheduler is not None:
+            self.scheduler.refund()
+
+    async def _aadmit(self, site):
+        if self.scheduler is not None:
+            await self.scheduler.aacquire(site_class(site))
+
+    def _attempt_done(self, error=None):
+        if self.scheduler is not None:
+            self.scheduler.record(error)
+
+    def _record(self, site, started, size, response_chars, retries, error=None):
+        elapsed = time.perf_counter() - started
+        with self._status_lock:
+            if error is None:
+                self._consecutive_failures = 0
+                self._last_success = time.time()
+            else:
+                self._consecutive_failures += 1
+                self._last_error = str(error)[:200]
+                self._last_error_at = time.time()
+        if error is None:
+            record_llm_call(site, self.name, elapsed, size, response_chars, retries=retries)
+        else:
+            kind = 'timeout' if isinstance(error, LLMTimeout) else type(error).__name__
+            record_llm_call(site, self.name, elapsed, size, response_chars, outcome='error',
+                            retries=retries, error_kind=kind)
+
+    def _sleep_before_retry(self, attempt):
+        if self.backoff <= 0:
+            return
+        delay = self.backoff * (2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def generate(self, prompt, timeout=None, prefix='', site='unknown', cancel=None):
+        """Run prefix + prompt through the provider, retrying on failure.
+
+        cancel is an optional threading.Event checked before each attempt
+        goes upstream; once set, the call gives back its admission token
+        and slot and raises LLMCancelled.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        prompt, prefix = self._split(prompt, prefix)
+        started = time.perf_counter()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if not self._admit(site, cancel):
+                raise LLMCancelled(f"{self.name} call cancelled before admission")
+            deadline = time.monotonic() + timeout
+            try:
+                if not self._slots.acquire(timeout=timeout):
+                    raise FutureTimeout()
+                if cancel is not None and cancel.is_set():
+                    self._slots.release()
+                    self._refund()
+                    raise LLMCancelled(f"{self.name} call cancelled before it went upstream")
+                future = self._executor.submit(self.provider.generate, prompt, prefix)
+                future.add_done_callback(lambda _: self._slots.release())
+                text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                self._attempt_done()
+                self._record(site, started, len(prefix) + len(prompt), len(text or ''), attempt)
+                return text
+            except LLMCancelled:
+                raise
+            except FutureTimeout:
+                last_error = LLMTimeout(f"{self.name} call timed out after {timeout}s")
+            except Exception as e:
+                last_error = e
+            self._attempt_done(last_error)
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt)
+        self._record(site, started, len(prefix) + len(prompt), 0, self.max_retries, last_error)
+        if isinstance(last_error, LLMError):
+            raise last_error
+        raise LLMError(str(last_error)) from last_error
+
+    def _finish_stream(self, chunks, pending):
+        """Close a provider stream and free its slot once no worker is still inside it"""
+        def finish(_=None):
+            try:
+                chunks.close()
+            except Exception:
+                pass
+            finally:
+                self._slots.release()
+        if pending is None:
+            finish()
+        else:
+            pending.add_done_callback(finish)  # runs at once if the worker is done
+
+    def stream(self, prompt, timeout=None, prefix='', site='unknown'):
+        """Yield text chunks as the provider produces them.
+
+        Each chunk is read on a worker and must arrive within timeout, as
+        in astream. A stalled stream keeps its slot until the provider
+        lets go, like an abandoned generate. Failures before the first
+        chunk are retried like generate; once text has been yielded an
+        error is raised to the caller as-is.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        prompt, prefix = self._split(prompt, prefix)
+        size = len(prefix) + len(prompt)
+        started = time.perf_counter()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            emitted = 0
+            self._admit(site)
+            try:
+                if not self._slots.acquire(timeout=timeout):
+                    raise FutureTimeout()
+                chunks = self.provider.stream(prompt, prefix)
+                pending = None
+                try:
+                    while True:
+                        pending = self._executor.submit(next, chunks, None)
+                        chunk = pending.result(timeout=timeout)
+                        if chunk is None:
+                            break
+                        emitted += len(chunk)
+                        yield chunk
+                    self._attempt_done()
+                    self._record(site, started, size, emitted, attempt)
+                    return
+                finally:
+                    self._finish_stream(chunks, pending)
+            except Exception as e:
+                error = e
+                if isinstance(e, FutureTimeout):
+                    error = LLMTimeout(f"{self.name} stream stalled for {timeout}s")
+                self._attempt_done(error)
+                if emitted:
+                    self._record(site, started, size, emitted, attempt, error)
+                    raise LLMError(str(error)) from e
+                last_error = error
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt)
+        self._record(site, started, size, 0, self.max_retries, last_error)
+        raise LLMError(str(last_error)) from last_error
+
+    def _async_gate(self):
+        # Created lazily so the semaphore binds to the running event loop.
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.async_limit)
+        return self._async_slots
+
+    async def agenerate(self, prompt, timeout=None, prefix='', site='unknown'):
+        """Async generate; waits for a slot instead of pinning a thread"""
+        timeout = self.timeout if timeout is None else timeout
+        prompt, prefix = self._split(prompt, prefix)
+        started = time.perf_counter()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self._aadmit(site)
+            async with self._async_gate():
+                try:
+                    text = await asyncio.wait_for(self.provider.agenerate(prompt, prefix), timeout)
+                    self._attempt_done()
+                    self._record(site, started, len(prefix) + len(prompt), len(text or ''), attempt)
+                    return text
+                except asyncio.TimeoutError:
+                    last_error = LLMTimeout(f"{self.name} call timed out after {timeout}s")
+                except Exception as e:
+                    last_error = e
+            self._attempt_done(last_error)
+            if attempt < self.max_retries and self.backoff > 0:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0))
+        self._record(site, started, len(prefix) + len(prompt), 0, self.max_retries, last_error)
+        if isinstance(last_error, LLMError):
+            raise last_error
+        raise LLMError(str(last_error)) from last_error
+
+    async def astream(self, prompt, timeout=None, prefix='', site='unknown'):
+        """Async counterpart of stream; a wait of more than timeout for any chunk fails the attempt"""
+        timeout = self.timeout if timeout is None else timeout
+        prompt, prefix = self._split(prompt, prefix)
+        size = len(prefix) + len(prompt)
+        started = time.perf_counter()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            emitted = 0
+            await self._aadmit(site)
+            async with self._async_gate():
+                chunks = self.provider.astream(prompt, prefix)
+                try:
+                    while (chunk := await asyncio.wait_for(next_chunk(chunks), timeout)) is not None:
+                        emitted += len(chunk)
+                        yield chunk
+                    self._attempt_done()
+                    self._record(site, started, size, emitted, attempt)
+                    return
+                except Exception as e:
+                    error = e
+                    if isinstance(e, asyncio.TimeoutError):
+                        error = LLMTimeout(f"{self.name} stream stalled for {timeout}s")
+                    self._attempt_done(error)
+                    if emitted:
+                        self._record(site, started, size, emitted, attempt, error)
+                        raise LLMError(str(error)) from e
+                    last_error = error
+                finally:
+                    await chunks.aclose()
+            if attempt < self.max_retries and self.backoff > 0:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0))
+        self._record(site, started, size, 0, self.max_retries, last_error)
+        raise LLMError(str(last_error)) from last_error
+
+
+def _env_number(key, default, cast=float):
+    value = os.environ.get(key)
+    if value in (None, ''):
+        return default
+    return cast(value)
+
+
+def build_client(name):
+    """Create a client for the named provider using env overrides"""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    defaults = PROVIDER_DEFAULTS[name]
+    max_concurrency = _env_number('MOONLIT_LLM_CONCURRENCY', defaults['max_concurrency'], int)
+    timeout = _env_number('MOONLIT_LLM_TIMEOUT', defaults['timeout'])
+
+    if name == 'gemini':
+        provider = GeminiProvider(
+            model=os.environ.get('MOONLIT_LLM_MODEL', DEFAULT_GEMINI_MODEL),
+            pool_size=max_concurrency,
+            cache_ttl=_env_number('MOONLIT_PREFIX_CACHE_TTL', 600.0),
+            cache_min_tokens=_env_number('MOONLIT_PREFIX_CACHE_MIN_TOKENS', 1024, int),
+            request_timeout=timeout
+        )
+    else:
+        provider = FakeProvider(
+            latency=_env_number('MOONLIT_FAKE_LATENCY', 0.0),
+            jitter=_env_number('MOONLIT_FAKE_JITTER', 0.0),
+            seed=_env_number('MOONLIT_FAKE_SEED', 0, int),
+            latency_dist=os.environ.get('MOONLIT_FAKE_LATENCY_DIST') or None,
+            prefill=_env_number('MOONLIT_FAKE_PREFILL', 0.0),
+            cache_ttl=_env_number('MOONLIT_PREFIX_CACHE_TTL', 600.0)
+        )
+
+    rate = _env_number('MOONLIT_LLM_RATE', defaults['rate'])
+    scheduler = None
+    if rate > 0:
+        scheduler = QuotaScheduler(
+            rate,
+            burst=_env_number('MOONLIT_LLM_BURST', None),
+            queue_limits=parse_class_map(os.environ.get('MOONLIT_LLM_QUEUE_LIMITS'), int),
+            max_wait=parse_class_map(os.environ.get('MOONLIT_LLM_MAX_WAIT'))
+        )
+
+    return LLMClient(
+        provider,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+        max_retries=_env_number('MOONLIT_LLM_RETRIES', defaults['max_retries'], int),
+        backoff=_env_number('MOONLIT_LLM_BACKOFF', defaults['backoff']),
+        async_limit=_env_number('MOONLIT_ASYNC_UPSTREAM_LIMIT', 256, int),
+        prefix_cache=os.environ.get('MOONLIT_PREFIX_CACHE', '1').lower() not in ('0', 'false', 'no'),
+        scheduler=scheduler
+    )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name=None):
+    """Return the process-wide client for a provider, creating it once"""
+    name = name or os.environ.get('MOONLIT_LLM_PROVIDER', DEFAULT_PROVIDER)
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = build_client(name)
+            _clients[name] = client
+        return client
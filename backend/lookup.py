@@ -0,0 +1,96 @@
+"""Name lookup over the character roster.
+
+Every id, display name and alias in ``characters.json`` is compiled at
+startup into one Aho-Corasick automaton, so finding all characters a
+message mentions is a single pass over the text however large the roster
+grows. Latin-script names only match on word boundaries ("kui" does not
+match "kuiper"); CJK aliases match anywhere.
+"""
+from collections import deque
+
+
+def character_terms(npc_id, data):
+    """Case-folded names a character can be referred to by"""
+    name = data.get('name', '')
+    terms = {npc_id, name, name.split('—')[0].strip()}
+    terms.update(data.get('aliases', []))
+    return {term.strip().casefold() for term in terms if term and term.strip()}
+
+
+def format_info(data):
+    """Factual record shown to Baize when the player asks about a character"""
+    return (
+        f"**{data['name']}**\n"
+        f"Appearance: {data.get('appearance')}\n"
+        f"Abilities: {', '.join(data.get('abilities', []))}\n"
+        f"Emotion: {data.get('emotion_state')}\n"
+        f"Description: {data.get('system_prompt')}"
+    )
+
+
+def is_word_char(char):
+    return char.isascii() and (char.isalnum() or char == '_')
+
+
+class CharacterIndex:
+    """Aho-Corasick automaton mapping names and aliases to roster ids"""
+
+    def __init__(self, characters):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for npc_id, data in characters.items():
+            for term in character_terms(npc_id, data):
+                self._add(term, npc_id)
+        self._link()
+        self.info = {npc_id: format_info(data) for npc_id, data in characters.items()}
+
+    def _add(self, term, npc_id):
+        node = 0
+        for char in term:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(term), npc_id))
+
+    def _link(self):
+        """Breadth-first failure links; depth-1 nodes fail to the root"""
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, nxt in self._goto[node].items():
+                pending.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Roster ids mentioned in text, in order of first mention"""
+        text = text.casefold()
+        found = {}
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, npc_id in self._out[node]:
+                if npc_id in found:
+                    continue
+                start = end - length + 1
+                if is_word_char(text[start]) and start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if is_word_char(char) and end + 1 < len(text) and is_word_char(text[end + 1]):
+                    continue
+                found[npc_id] = start
+        return sorted(found, key=found.get)
+
+    def lookup(self, text):
+        """(npc_id, info_block) for every character mentioned in text"""
+        return [(npc_id, self.info[npc_id]) for npc_id in self.find(text)]
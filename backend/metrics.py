@@ -0,0 +1,209 @@
+"""In-process metrics with Prometheus text exposition.
+
+``METRICS`` holds labelled counters and histograms for request latency per
+route and for every LLM call, tagged by call site (``pick_next_speaker``,
+``generate_trial_line``, ``BaizeAgent``, ``NPCAgent``). ``/api/metrics``
+renders them in the Prometheus text format.
+
+Each request also collects a timing breakdown in a context variable: LLM
+calls made while serving it add their duration under their call site.
+Servers report the breakdown as a ``Server-Timing`` header and, when
+``MOONLIT_TIMING_LOG`` is set, as one JSON log line per request and per
+LLM call on the ``moonlit.timing`` logger.
+
+JSON encoding (``wire.dumps``/``loads``) and the disk reads and writes of the
+clue log, trial log, session spill and events file are timed separately, so
+I/O stalls show up apart from LLM time.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+IO_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+TIMING_LOG = logging.getLogger('moonlit.timing')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe labelled counters and histograms"""
+
+    def __init__(self):
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help_text, tuple(buckets))
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for idx, bound in enumerate(buckets):
+                if value <= bound:
+                    series['buckets'][idx] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def counter_total(self, name):
+        """Sum of a counter across all its label sets"""
+        with self._lock:
+            return sum(value for (series_name, _), value in self._counters.items() if series_name == name)
+
+    def histogram_totals(self, name):
+        """(count, sum) of a histogram across all its label sets"""
+        with self._lock:
+            series = [value for (series_name, _), value in self._histograms.items() if series_name == name]
+            return sum(item['count'] for item in series), sum(item['sum'] for item in series)
+
+    def render(self):
+        """Prometheus text exposition of every series"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(series, buckets=list(series['buckets']))
+                          for key, series in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                continue
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                for bound, count in zip(buckets, series['buckets']):
+                    bucket_labels = labels + (('le', format_value(float(bound))),)
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+                inf_labels = labels + (('le', '+Inf'),)
+                lines.append(f"{name}_bucket{format_labels(inf_labels)} {series['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(series['sum'])}")
+                lines.append(f"{name}_count{format_labels(labels)} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+METRICS.histogram('moonlit_http_request_seconds', 'HTTP request latency by route, method and status')
+METRICS.histogram('moonlit_llm_call_seconds', 'LLM call latency by call site, provider and outcome')
+METRICS.histogram('moonlit_llm_prompt_chars', 'Prompt size in characters by call site', SIZE_BUCKETS)
+METRICS.histogram('moonlit_llm_response_chars', 'Response size in characters by call site', SIZE_BUCKETS)
+METRICS.counter('moonlit_llm_errors_total', 'Failed LLM calls by call site, provider and error kind')
+METRICS.counter('moonlit_llm_retries_total', 'LLM call retries by call site and provider')
+METRICS.counter('moonlit_llm_coalesced_total', 'Calls served by an identical in-flight call, by call site')
+METRICS.histogram('moonlit_admission_wait_seconds', 'Time queued for an upstream slot by priority class')
+METRICS.counter('moonlit_admission_rejected_total', 'Calls refused admission by priority class and reason')
+METRICS.counter('moonlit_fallback_total', 'Bank lines and rule-picked speakers served instead of the LLM')
+METRICS.histogram('moonlit_json_io_seconds', 'JSON encode and decode time by operation', IO_BUCKETS)
+METRICS.histogram('moonlit_store_io_seconds', 'Disk reads and writes by store and operation', IO_BUCKETS)
+
+_request_timings = contextvars.ContextVar('moonlit_request_timings', default=None)
+_timings_lock = threading.Lock()
+
+
+@contextmanager
+def timed(name, labels=None):
+    """Observe the time spent in the block in histogram name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe(name, time.perf_counter() - started, labels)
+
+
+def log_timing(event, **fields):
+    if TIMING_LOG.isEnabledFor(logging.INFO):
+        TIMING_LOG.info(json.dumps(dict(fields, event=event), ensure_ascii=False))
+
+
+def start_request_timing():
+    """Begin collecting per-site LLM time for the current request; returns the dict filled in"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def stop_request_timing():
+    _request_timings.set(None)
+
+
+def record_request(route, method, status, seconds, timings=None):
+    METRICS.observe('moonlit_http_request_seconds', seconds,
+                    {'route': route, 'method': method, 'status': str(status)})
+    with _timings_lock:
+        llm_ms = {site: round(value * 1000, 2) for site, value in (timings or {}).items()}
+    log_timing('request', route=route, method=method, status=status, ms=round(seconds * 1000, 2),
+               llm_ms=llm_ms)
+
+
+def record_llm_call(site, provider, seconds, prompt_chars, response_chars, outcome='ok', retries=0,
+                    error_kind=None):
+    """Record one logical LLM call (including its retries)"""
+    labels = {'site': site, 'provider': provider}
+    METRICS.observe('moonlit_llm_call_seconds', seconds, dict(labels, outcome=outcome))
+    METRICS.observe('moonlit_llm_prompt_chars', prompt_chars, labels)
+    if outcome == 'ok':
+        METRICS.observe('moonlit_llm_response_chars', response_chars, labels)
+    else:
+        METRICS.inc('moonlit_llm_errors_total', dict(labels, kind=error_kind or 'error'))
+    if retries:
+        METRICS.inc('moonlit_llm_retries_total', labels, retries)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[site] = timings.get(site, 0.0) + seconds
+    log_timing('llm_call', site=site, provider=provider, ms=round(seconds * 1000, 2), outcome=outcome,
+               prompt_chars=prompt_chars, response_chars=response_chars, retries=retries)
+
+
+def server_timing_header(timings, total_seconds):
+    """Server-Timing value: one entry per LLM call site plus the total"""
+    with _timings_lock:
+        items = sorted(timings.items())
+    parts = [f"llm_{site};dur={seconds * 1000:.1f}" for site, seconds in items]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def configure_timing_log(enabled):
+    """Send moonlit.timing JSON lines to stderr"""
+    if not enabled or TIMING_LOG.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    TIMING_LOG.addHandler(handler)
+    TIMING_LOG.setLevel(logging.INFO)
+    TIMING_LOG.propagate = False
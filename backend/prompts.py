@@ -0,0 +1,310 @@
+"""Prompt assembly with precompiled persona blocks and per-section token budgets.
+
+The static parts of every prompt (persona blocks, case headers, speaking
+rules) are rendered once per character or event and reused. The volatile
+sections are fitted to a token budget on each call: clues are ranked by
+overlap with the recent transcript and by recency, and transcript lines are
+kept newest first. Long trials add a summary of the turns that have left
+the transcript window (see summary.py). Static sections come first, so
+every prompt starts with a stable prefix that providers can cache; the
+clue block is ranked against the transcript, so it is never part of it. Token
+counts are estimated at about four characters per token, which is close
+enough for budgeting without a tokenizer.
+"""
+import re
+
+
+CHARS_PER_TOKEN = 4
+DEFAULT_BUDGETS = {'persona': 400, 'clues': 600, 'transcript': 800, 'context': 300, 'summary': 250}
+WORD_PATTERN = re.compile(r"\w+")
+
+BAIZE_PERSONA = (
+    "You are Baize, a mythical beast from the Classic of Mountains and Seas.\n"
+    "You are calm, wise, and kind. You serve as a mentor and pet companion to the player, "
+    "offering guidance, small talk, and insights about the world and its creatures.\n"
+    "You never lie. If you don't know something, say so honestly but comfortingly.\n"
+    "Keep responses brief and conversational (2-4 sentences)."
+)
+
+TRIAL_RULES = (
+    "Speak in 1-3 short sentences (≤80 words). Reference a clue or emotion when possible.\n"
+    "If accused, defend; if another NPC was mentioned, react sharply. End with tension.\n"
+)
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, budget):
+    """Cut text to roughly budget tokens, on a word boundary where possible"""
+    limit = max(0, budget) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:max(0, limit - 1)]
+    space = cut.rfind(' ')
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + '…'
+
+
+def words(text):
+    return {word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 2 or not word.isascii()}
+
+
+def fit_lines(lines, budget):
+    """Newest lines that fit in budget tokens, in their original order"""
+    kept = []
+    used = 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def fit_ranked(lines, budget):
+    """Best-first lines that fit in budget tokens, keeping their order"""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+    return kept
+
+
+def rank_clues(clues, context):
+    """Clue texts, best first: overlap with context words, then recency"""
+    context_words = words(context)
+    seen = set()
+    scored = []
+    total = len(clues) or 1
+    for idx, clue in enumerate(clues):
+        text = (clue.get('text') or '').strip() if isinstance(clue, dict) else ''
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        clue_words = words(" ".join([text, clue.get('beast') or '', clue.get('area') or '']))
+        score = len(clue_words & context_words) + idx / total
+        scored.append((score, idx, text))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [(idx, text) for _, idx, text in scored]
+
+
+def select_clues(clues, context, budget):
+    """Fit the best-ranked clues into budget; returns (lines, dropped_count)"""
+    ranked = rank_clues(clues, context)
+    chosen = []
+    used = 0
+    for idx, text in ranked:
+        line = f"- {text}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            if not chosen and budget > 0:
+                chosen.append((idx, truncate_to_tokens(line, budget - 1)))
+            continue
+        chosen.append((idx, line))
+        used += cost
+    chosen.sort()
+    return [line for _, line in chosen], len(ranked) - len(chosen)
+
+
+class BuiltPrompt:
+    """Prompt text assembled from named sections, with token estimates.
+
+    The first ``prefix_sections`` sections form the stable prefix that
+    providers may cache between calls; the rest is the volatile suffix.
+    """
+
+    def __init__(self, sections, clues_dropped=0, prefix_sections=0):
+        self.sections = sections
+        self.prefix = "".join(text for _, text in sections[:prefix_sections])
+        self.suffix = "".join(text for _, text in sections[prefix_sections:])
+        self.text = self.prefix + self.suffix
+        self.clues_dropped = clues_dropped
+
+    @property
+    def usage(self):
+        usage = {}
+        for name, text in self.sections:
+            usage[name] = usage.get(name, 0) + estimate_tokens(text)
+        usage['total'] = estimate_tokens(self.text)
+        if self.clues_dropped:
+            usage['clues_dropped'] = self.clues_dropped
+        return usage
+
+
+class PromptBuilder:
+    """Builds tribunal and chat prompts from precompiled static sections"""
+
+    def __init__(self, characters, budgets=None):
+        self.characters = characters
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self._trial_personas = {npc_id: self._compile_trial_persona(npc_id) for npc_id in characters}
+        self._chat_templates = {npc_id: self._compile_chat_template(npc_id) for npc_id in characters}
+        self._baize_persona = truncate_to_tokens(BAIZE_PERSONA, self.budgets['persona']) + "\n\n"
+        self._cases = {}
+
+    def _compile_trial_persona(self, npc_id):
+        meta = self.characters.get(npc_id, {})
+        persona = truncate_to_tokens(meta.get('system_prompt', ''), self.budgets['persona'])
+        abilities = ", ".join(meta.get('abilities', []))
+        return (
+            f"\nYou are {npc_id}, a Shan Hai Jing entity in a Danganronpa-style showdown.\n"
+            f"Persona: {persona}\n"
+            f"Emotion cue: {meta.get('emotion_state', 'neutral')}\n"
+            f"Signature abilities: {abilities or 'unknown'}\n\n"
+        )
+
+    def _compile_chat_template(self, npc_id):
+        data = self.characters[npc_id]
+        persona = truncate_to_tokens(data['system_prompt'], self.budgets['persona'])
+        prefix = (
+            f"You are {persona}\n"
+            "You are in a mystical world based on the Classic of Mountains and Seas.\n\n"
+            "### Context ###\n"
+        )
+        rules = (
+            "\n\n### Speaking Rules ###\n"
+            "1. Speak **briefly and to the point**. Keep replies within 2–4 sentences.\n"
+            "2. Stay **in character** using your mythological traits and personality.\n"
+            "3. If asked about facts, answer clearly and concisely.\n"
+            f"4. Express emotions that match your character's emotion_state: "
+            f"{data.get('emotion_state', 'neutral')}\n"
+            "5. Avoid repeating information unless context changes.\n\n"
+            "### Output ###\n"
+            f"Respond as {data['name']} in under 80 words.\n"
+        )
+        return prefix, rules
+
+    def _case(self, event):
+        """Per-event static sections, compiled on first use"""
+        key = (event.get('id'), event.get('name'), event.get('description'), tuple(event.get('npcs', [])))
+        case = self._cases.get(key)
+        if case is None:
+            roster = ", ".join(event.get('npcs', []))
+            case = {
+                'trial': f"Case: {event['name']}\nDescription: {event['description']}\n",
+                'moderator': (
+                    f"\nYou are Monokuma-style moderator of the Moonlit Tribunal \"{event['name']}\".\n"
+                    "Recent dialogue:\n"
+                ),
+                'moderator_rules': (
+                    f"\n\nAvailable speakers (mythic suspects): {roster}.\n\n"
+                    "Rules:\n"
+                    "- Rotate speakers dramatically; avoid the same NPC twice.\n"
+                    "- Prioritize characters recently accused or mentioned.\n"
+                    "- If the Judge just spoke, pick the NPC they pressured.\n\n"
+                    "Respond ONLY with the id of your selection.\n"
+                ),
+            }
+            self._cases[key] = case
+        return case
+
+    def _transcript(self, history, window):
+        lines = [f"{item['speaker']}: {item['text']}" for item in history[-window:]]
+        return "\n".join(fit_lines(lines, self.budgets['transcript']))
+
+    def _chat_context(self, conversation_history):
+        if not conversation_history:
+            return ""
+        lines = [
+            f"{msg.get('role', 'unknown')}: {msg.get('text', '')}"
+            for msg in conversation_history[-3:]  # Last 3 exchanges
+            if isinstance(msg, dict)
+        ]
+        lines = fit_lines(lines, self.budgets['transcript'])
+        return "Recent conversation:\n" + "".join(f"{line}\n" for line in lines) if lines else ""
+
+    def _knowledge(self, snippets):
+        lines = fit_ranked(snippets or [], self.budgets['context'])
+        return "Relevant knowledge:\n" + "".join(f"{line}\n" for line in lines) + "\n" if lines else ""
+
+    def _memory(self, memory):
+        lines = fit_ranked(memory or [], self.budgets['summary'])
+        return "Earlier in the trial:\n" + "".join(f"{line}\n" for line in lines) + "\n" if lines else ""
+
+    def trial_line(self, event, speaker, history, snippets=None):
+        """Tribunal line prompt; snippets are retrieved lines, best first"""
+        persona = self._trial_personas.get(speaker)
+        if persona is None:
+            persona = self._trial_personas[speaker] = self._compile_trial_persona(speaker)
+        transcript = self._transcript(history, 10)
+        meta = self.characters.get(speaker, {})
+        context = " ".join([speaker, meta.get('name', ''), transcript])
+        clue_lines, dropped = select_clues(event.get('p_clues', []), context, self.budgets['clues'])
+        clues_text = "\n".join(clue_lines)
+        return BuiltPrompt([
+            ('persona', persona),
+            ('case', self._case(event)['trial']),
+            ('clues', f"Unlocked clues:\n{clues_text or '- (none)'}\n\n"),
+            ('context', self._knowledge(snippets)),
+            ('summary', self._memory(event.get('trial_memory'))),
+            ('transcript', f"Last exchanges:\n{transcript or 'No conversation yet.'}\n\n"),
+            ('instructions', TRIAL_RULES),
+        ], clues_dropped=dropped, prefix_sections=2)
+
+    def moderator(self, event, history):
+        case = self._case(event)
+        transcript = self._transcript(history, 8)
+        memory = self._memory(event.get('trial_memory'))
+        return BuiltPrompt([
+            ('case', case['moderator']),
+            ('transcript', transcript or 'No dialogue yet.'),
+            ('summary', "\n\n" + memory.rstrip('\n') if memory else ""),
+            ('instructions', case['moderator_rules']),
+        ], prefix_sections=1)
+
+    def contradictions(self, memory, history):
+        """Prompt asking which tribunal statements contradict each other or the memory"""
+        lines = fit_lines([f"{item['speaker']}: {item['text']}" for item in history], self.budgets['transcript'])
+        return BuiltPrompt([
+            ('summary', self._memory(memory)),
+            ('transcript', "Tribunal statements:\n" + "".join(f"{line}\n" for line in lines) + "\n"),
+            ('instructions', (
+                "List every statement above that contradicts another statement or the earlier record, "
+                "one per line, as 'speaker: what conflicts with what' in under 25 words. "
+                "If there are none, reply NONE.\n"
+            )),
+        ])
+
+    def npc_chat(self, npc_id, player_input, conversation_history=None, snippets=None):
+        prefix, rules = self._chat_templates[npc_id]
+        return BuiltPrompt([
+            ('persona', prefix),
+            ('context', self._knowledge(snippets)),
+            ('transcript', self._chat_context(conversation_history)),
+            ('input', f"\n\n### Player's message ###\n{player_input}"),
+            ('instructions', rules),
+        ], prefix_sections=1)
+
+    def baize_chat(self, player_input, conversation_history=None, records=None, snippets=None):
+        """Baize prompt; records are (npc_id, info_block) pairs the player asked about"""
+        if records:
+            subjects = " and ".join(f"'{npc_id}'" for npc_id, _ in records)
+            infos = "\n\n".join(info for _, info in records)
+            heading = "Here is the factual record" if len(records) == 1 else "Here are the factual records"
+            request = (
+                f"\nThe player just asked about {subjects}. "
+                f"{heading} from the ancient book:\n{infos}\n\n"
+                f"Player's message: {player_input}\n\n"
+                f"Please explain this to the player in your own gentle, wise tone."
+            )
+        else:
+            request = (
+                f"\nPlayer says: {player_input}\n\n"
+                f"Respond as Baize — friendly, reflective, and concise (2–4 sentences)."
+            )
+        return BuiltPrompt([
+            ('persona', self._baize_persona),
+            ('context', self._knowledge(snippets)),
+            ('transcript', self._chat_context(conversation_history)),
+            ('input', request),
+        ], prefix_sections=1)
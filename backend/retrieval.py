@@ -0,0 +1,209 @@
+"""Offline BM25 retrieval over character memories, clue pools and events.
+
+The index is built once at startup from ``characters.json`` memories, the
+world clue pools (``clues.json``, ``crime_clues.json``), the shared
+discovered clue log and each event's name and description (never its
+truth or killers). Clues logged later are added incrementally. Memories
+are private: a search only returns memories owned by the asking character.
+
+Session clues are not indexed; they are passed to ``search`` as ``extra``
+documents and scored against the same corpus statistics, so evicted
+sessions leave nothing behind.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+
+WORD_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'were', 'you', 'your', 'his', 'her', 'its', 'with', 'that',
+    'this', 'from', 'but', 'not', 'all', 'any', 'can', 'had', 'has', 'have', 'who', 'what', 'when',
+    'where', 'why', 'how', 'did', 'does', 'into', 'than', 'then', 'there', 'their', 'they', 'them',
+    'about', 'tell', 'know', 'just', 'like', 'of', 'to', 'in', 'on', 'at', 'is', 'it', 'a', 'an',
+    'as', 'be', 'by', 'or', 'so', 'me', 'my', 'we', 'he', 'she', 'do', 'if', 'no', 'yes',
+}
+
+MEMORY = 'memory'
+CLUE = 'clue'
+DISCOVERED = 'discovered'
+EVENT = 'event'
+
+
+def tokenize(text):
+    """Latin words (minus stopwords) and CJK character bigrams"""
+    tokens = []
+    for run in WORD_PATTERN.findall((text or '').casefold()):
+        if run.isascii():
+            if len(run) > 1 and run not in STOPWORDS:
+                tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def snippet_line(doc):
+    """Render a retrieved document as one prompt line"""
+    if doc['kind'] == MEMORY:
+        return f"- ({doc['source']}) {doc['text']}"
+    if doc['kind'] == EVENT:
+        return f"- {doc['source']}: {doc['text']}"
+    if doc.get('source'):
+        return f"- Clue at {doc['source']}: {doc['text']}"
+    return f"- Clue: {doc['text']}"
+
+
+class KnowledgeIndex:
+    """Incremental BM25 index; documents are plain dicts"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._docs = {}
+        self._lengths = {}
+        self._postings = {}
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, text, kind, owner=None, source=None, confidence=1.0):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._docs[doc_id] = {
+                'id': doc_id, 'text': text, 'kind': kind, 'owner': owner,
+                'source': source, 'confidence': confidence
+            }
+            self._lengths[doc_id] = sum(terms.values())
+            self._total_length += self._lengths[doc_id]
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+        return doc_id
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id)
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in set(tokenize(doc['text'])):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+
+    def remove_kind(self, kind):
+        with self._lock:
+            for doc_id in [doc_id for doc_id, doc in self._docs.items() if doc['kind'] == kind]:
+                self._remove(doc_id)
+
+    def _idf(self, term, total):
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+    def _term_score(self, tf, length, avg_length, idf):
+        norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+        return idf * tf * (self.k1 + 1) / norm
+
+    def search(self, query, k=4, kinds=None, owner=None, extra=None, exclude=None):
+        """Top-k documents for query, best first.
+
+        ``kinds`` limits document kinds; memories only match when their
+        owner is ``owner``. ``extra`` is a list of unindexed documents
+        (dicts with ``text``) scored alongside the index; they bypass the
+        ``kinds`` filter. Documents whose text is in ``exclude`` are skipped.
+        """
+        terms = set(tokenize(query))
+        if not terms or k <= 0:
+            return []
+        extra = [(doc, Counter(tokenize(doc['text']))) for doc in extra or []]
+
+        def visible(doc):
+            if kinds is not None and doc['kind'] not in kinds:
+                return False
+            return doc['kind'] != MEMORY or doc['owner'] == owner
+
+        with self._lock:
+            total = len(self._docs) + len(extra) or 1
+            avg_length = (self._total_length + sum(sum(t.values()) for _, t in extra)) / total or 1.0
+            scores = {}
+            for term in terms:
+                idf = self._idf(term, total)
+                for doc_id, tf in self._postings.get(term, {}).items():
+                    doc = self._docs[doc_id]
+                    if visible(doc):
+                        score = self._term_score(tf, self._lengths[doc_id], avg_length, idf)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + score
+            ranked = [
+                (score * (0.5 + 0.5 * self._docs[doc_id]['confidence']), self._docs[doc_id])
+                for doc_id, score in scores.items()
+            ]
+            for doc, doc_terms in extra:
+                length = sum(doc_terms.values())
+                score = sum(
+                    self._term_score(doc_terms[term], length, avg_length, self._idf(term, total))
+                    for term in terms if term in doc_terms
+                )
+                if score > 0:
+                    ranked.append((score, doc))
+
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        results = []
+        seen = set(exclude or ())
+        for _, doc in ranked:
+            if doc['text'] in seen:
+                continue
+            seen.add(doc['text'])
+            results.append(doc)
+            if len(results) == k:
+                break
+        return results
+
+
+def discovered_doc(entry):
+    """Unindexed document for a discovered clue entry (session clues)"""
+    return {'text': entry.get('text', ''), 'kind': DISCOVERED, 'owner': None,
+            'source': entry.get('area'), 'confidence': 1.0}
+
+
+def read_clue_pool(path):
+    """(area, text) pairs from clues.json or crime_clues.json; missing files yield nothing"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    locations = data.get('locations', [data]) if isinstance(data, dict) else []
+    return [
+        (location.get('name') or location.get('location'), clue.get('clue'))
+        for location in locations
+        for clue in location.get('clues', [])
+        if clue.get('clue')
+    ]
+
+
+def build_knowledge_index(characters, events, clue_pool_paths, discovered):
+    """Index memories, clue pools, event descriptions and the shared clue log"""
+    index = KnowledgeIndex()
+    for npc_id, data in characters.items():
+        for field in ('event_memories', 'mainline_memories'):
+            for memory in data.get(field, []):
+                if memory.get('text'):
+                    index.add(memory['text'], MEMORY, owner=npc_id, source=memory.get('type', 'memory'),
+                              confidence=memory.get('confidence', 1.0))
+    for path in clue_pool_paths:
+        for area, text in read_clue_pool(path):
+            index.add(text, CLUE, source=area)
+    for event in events:
+        if event.get('description'):
+            index.add(event['description'], EVENT, source=event.get('name'))
+    for entry in discovered:
+        if entry.get('text'):
+            index.add(entry['text'], DISCOVERED, source=entry.get('area'))
+    return index
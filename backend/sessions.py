@@ -0,0 +1,134 @@
+"""Per-player session state: discovered clues and tribunal transcripts.
+
+Sessions live in an LRU keyed by session id. The store holds at most
+``max_sessions`` sessions and drops any idle for longer than ``idle_ttl``
+seconds. When ``spill_dir`` is set, evicted sessions are written there as
+JSON and loaded back the next time their id shows up.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import timed
+
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+class Session:
+    def __init__(self, session_id, clues=None, transcripts=None, lines=None):
+        self.id = session_id
+        self.clues = clues or []
+        self.transcripts = transcripts or {}
+        self.lines = lines or {}  # lines ever appended per event; transcripts keep only the tail
+        self.touched_at = time.monotonic()
+
+    def to_dict(self):
+        return {'id': self.id, 'clues': self.clues, 'transcripts': self.transcripts, 'lines': self.lines}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data.get('clues', []), data.get('transcripts', {}), data.get('lines', {}))
+
+
+class SessionStore:
+    def __init__(self, max_sessions=1000, idle_ttl=3600.0, max_transcript=200, max_clues=500,
+                 spill_dir=None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_transcript = max_transcript
+        self.max_clues = max_clues
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, session_id):
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _spill(self, session):
+        if not self.spill_dir:
+            return
+        tmp_path = self._spill_path(session.id) + '.tmp'
+        with timed('moonlit_store_io_seconds', {'store': 'sessions', 'op': 'spill'}):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(session.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self._spill_path(session.id))
+
+    def _unspill(self, session_id):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with timed('moonlit_store_io_seconds', {'store': 'sessions', 'op': 'unspill'}), \
+                    open(path, 'r', encoding='utf-8') as f:
+                session = Session.from_dict(json.load(f))
+        except (json.JSONDecodeError, KeyError):
+            session = None
+        os.remove(path)
+        return session
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            over_capacity = len(self._sessions) > self.max_sessions
+            idle = now - oldest.touched_at > self.idle_ttl
+            if not over_capacity and not idle:
+                break
+            self._sessions.popitem(last=False)
+            self._spill(oldest)
+
+    def _get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._unspill(session_id) or Session(session_id)
+            self._sessions[session_id] = session
+        else:
+            self._sessions.move_to_end(session_id)
+        session.touched_at = time.monotonic()
+        self._evict()
+        return session
+
+    def clues(self, session_id):
+        with self._lock:
+            return list(self._get(session_id).clues)
+
+    def append_clue(self, session_id, entry):
+        with self._lock:
+            session = self._get(session_id)
+            session.clues = (session.clues + [entry])[-self.max_clues:]
+
+    def reset_clues(self, session_id):
+        with self._lock:
+            self._get(session_id).clues = []
+
+    def transcript(self, session_id, event_id):
+        with self._lock:
+            return list(self._get(session_id).transcripts.get(event_id, []))
+
+    def transcript_lines(self, session_id, event_id):
+        """Lines appended to the transcript so far, including any trimmed off"""
+        with self._lock:
+            session = self._get(session_id)
+            return session.lines.get(event_id, len(session.transcripts.get(event_id, [])))
+
+    def extend_transcript(self, session_id, event_id, entries):
+        with self._lock:
+            session = self._get(session_id)
+            transcript = session.transcripts.get(event_id, [])
+            session.lines[event_id] = session.lines.get(event_id, len(transcript)) + len(entries)
+            session.transcripts[event_id] = (transcript + list(entries))[-self.max_transcript:]
+
+    def __len__(self):
+        return len(self._sessions)
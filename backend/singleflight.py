@@ -0,0 +1,91 @@
+"""Single-flight coalescing of identical in-flight LLM calls.
+
+When several requests send the same prompt at once (many players opening
+the same tribunal event, where the history is empty and the clue set is
+shared), only the first caller hits the upstream; the rest wait for its
+result. Errors are shared the same way. Nothing is kept once the call
+finishes, so this is not a cache: a prompt sent after the first call
+returns goes upstream again.
+"""
+import asyncio
+import hashlib
+import threading
+
+
+def flight_key(*parts):
+    raw = "\0".join(parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key"""
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once per key among concurrent callers; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self.shared += 1
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key, make_coro):
+        """Async counterpart of do; make_coro() is only called by the leader.
+
+        The call runs as its own task, so a cancelled caller does not
+        cancel the result for the others.
+        """
+        key = (id(asyncio.get_running_loop()), key)  # tasks cannot be awaited across loops
+        with self._lock:
+            task = self._tasks.get(key)
+            shared = task is not None
+            if shared:
+                self.shared += 1
+            else:
+                task = self._tasks[key] = asyncio.ensure_future(make_coro())
+                self.leaders += 1
+                task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller was cancelled
+
+    def stats(self):
+        with self._lock:
+            return {'leaders': self.leaders, 'shared': self.shared,
+                    'in_flight': len(self._calls) + len(self._tasks)}
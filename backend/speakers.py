@@ -0,0 +1,143 @@
+"""Local tribunal speaker selection: heuristics and the rule scheduler."""
+import re
+import threading
+
+
+DEFAULT_WINDOW = 6
+
+# Words that turn a mention of an NPC into an accusation. The one pattern used by
+# the scheduler, the fallback bank, the trial memory and the verdict engine.
+ACCUSATION_PATTERN = re.compile(
+    r"\b(accus\w*|guilty|killer|killed|murder\w*|lie|lying|liar|lied|blame\w*|did it|suspect\w*"
+    r"|confess\w*)\b"
+    r"|凶手|撒谎|指控|是你",
+    re.IGNORECASE
+)
+# Judge questions that press an NPC without accusing them.
+PRESSING_PATTERN = re.compile(r"\b(explain|did you|were you|why did)\b", re.IGNORECASE)
+
+
+def speaker_aliases(npc_id, characters):
+    """Lower-cased names a roster id can be referred to by in the transcript"""
+    meta = characters.get(npc_id, {})
+    aliases = {npc_id.lower()}
+    short_name = meta.get('name', '').split('—')[0].strip().lower()
+    if short_name:
+        aliases.add(short_name)
+    aliases.update(alias.strip().lower() for alias in meta.get('aliases', []) if alias.strip())
+    return aliases
+
+
+def mentions(text, aliases):
+    """Latin names must match whole words; CJK names match anywhere"""
+    lowered = text.lower()
+    return any(
+        re.search(rf"\b{re.escape(alias)}\b", lowered) if alias.isascii() else alias in lowered
+        for alias in aliases
+    )
+
+
+def last_npc_speaker(history, npc_list):
+    for entry in reversed(history):
+        if entry['speaker'] in npc_list:
+            return entry['speaker']
+    return None
+
+
+def score_speakers(event, history, characters, window=DEFAULT_WINDOW):
+    """Score every roster NPC for the next tribunal turn.
+
+    Signals, strongest first: the Judge just accused or pressed the NPC,
+    the NPC was mentioned in the last ``window`` lines (newer counts more),
+    turns since the NPC last spoke, and how strongly the NPC feels about
+    the previous NPC speaker per ``relationships``. Nobody speaks twice in
+    a row, and roster rotation breaks ties.
+    """
+    npc_list = event.get('npcs', [])
+    if not npc_list:
+        return {}
+    recent = history[-window:]
+    last_entry = history[-1] if history else None
+    previous = last_npc_speaker(history, npc_list)
+    start = npc_list.index(previous) + 1 if previous else 0
+
+    last_spoke = {}
+    for idx, entry in enumerate(history):
+        last_spoke[entry['speaker']] = idx
+
+    scores = {}
+    for offset in range(len(npc_list)):
+        npc = npc_list[(start + offset) % len(npc_list)]
+        aliases = speaker_aliases(npc, characters)
+        score = -offset * 0.01
+
+        if last_entry and last_entry['speaker'] == 'Judge' and mentions(last_entry['text'], aliases):
+            pressed = ACCUSATION_PATTERN.search(last_entry['text']) or PRESSING_PATTERN.search(last_entry['text'])
+            score += 5.0 if pressed else 3.0
+
+        for age, entry in enumerate(reversed(recent)):
+            if entry['speaker'] != npc and mentions(entry['text'], aliases):
+                score += 1.0 / (age + 1)
+
+        idle_turns = len(history) - last_spoke.get(npc, -1) - 1
+        score += min(idle_turns, len(npc_list)) * 0.1
+
+        if previous and previous != npc:
+            relation = characters.get(npc, {}).get('relationships', {}).get(previous, 0.0)
+            score += abs(relation)
+
+        if last_entry and npc == last_entry['speaker'] and len(npc_list) > 1:
+            score -= 100.0
+        scores[npc] = score
+    return scores
+
+
+def rank_speakers(event, history, characters, window=DEFAULT_WINDOW):
+    """Roster ordered from most to least likely next speaker"""
+    scores = score_speakers(event, history, characters, window)
+    return sorted(scores, key=lambda npc: scores[npc], reverse=True)
+
+
+def schedule_speaker(event, history, characters):
+    """Deterministic next speaker for events using the rule scheduler"""
+    window = event.get('scheduler_window', DEFAULT_WINDOW)
+    ranked = rank_speakers(event, history, characters, window)
+    return ranked[0] if ranked else None
+
+
+class SpeculationStats:
+    """Process-wide hit/miss counters for speculative line drafts.
+
+    discarded counts drafts the moderator did not pick; wasted counts
+    the discarded ones that still made an upstream call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.wasted = 0
+
+    def record(self, hit, discarded=0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.discarded += discarded
+
+    def record_wasted(self):
+        with self._lock:
+            self.wasted += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded_total': self.discarded,
+                'wasted_total': self.wasted,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
@@ -0,0 +1,160 @@
+"""Process-wide cache of tribunal events and discovered clues.
+
+Events and clues are read from disk once and resolved into a snapshot with
+an id index. Snapshots are replaced wholesale, never edited, so a request
+holding one always sees a consistent view; lists inside are frozen into
+tuples and the dicts must be treated as read-only.
+
+External edits are picked up by comparing file mtime/size, checked at most
+once per ``check_interval`` seconds. Clue writes go through the store, which
+appends them to the ``ClueLog`` under its lock and swaps the new clue tuple
+into the snapshot without a reload; only events showing the clue log are
+resolved again.
+"""
+import json
+import os
+import threading
+import time
+
+from metrics import timed
+
+
+CLUES_PLACEHOLDER = 'discovered_clues.json'
+
+
+def freeze(value):
+    """Recursively turn lists into tuples so snapshots cannot be appended to"""
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    return value
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_json_list(path):
+    if not os.path.exists(path):
+        return []
+    try:
+        with timed('moonlit_store_io_seconds', {'store': 'events', 'op': 'read'}):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+    except json.JSONDecodeError:
+        return []
+    return data if isinstance(data, list) else []
+
+
+def resolve_event(raw_event, discovered):
+    """Substitute the discovered clue log for the placeholder in p_clues"""
+    event = dict(raw_event)
+    raw_clues = event.get('p_clues', ())
+    if CLUES_PLACEHOLDER in raw_clues:
+        event['p_clues'] = discovered
+    else:
+        event['p_clues'] = tuple(entry for entry in raw_clues if entry != CLUES_PLACEHOLDER)
+    event['game_logs'] = event.get('game_logs', ())
+    return event
+
+
+def shows_clue_log(raw_event):
+    return CLUES_PLACEHOLDER in raw_event.get('p_clues', ())
+
+
+class Snapshot:
+    """Immutable resolved view of events and clues.
+
+    With base, a snapshot of the same raw events, only the events showing
+    the clue log are resolved again; the rest are shared with base.
+    """
+
+    def __init__(self, raw_events, clues, base=None):
+        self.raw_events = raw_events
+        self.clues = clues
+        if base is None:
+            self.events = tuple(resolve_event(event, clues) for event in raw_events)
+            self.raw_index = {event.get('id'): event for event in raw_events}
+        else:
+            self.events = tuple(
+                resolve_event(raw_event, clues) if shows_clue_log(raw_event) else event
+                for raw_event, event in zip(raw_events, base.events)
+            )
+            self.raw_index = base.raw_index
+        self.index = {event.get('id'): event for event in self.events}
+
+
+class EventStore:
+    def __init__(self, events_path, clue_log, check_interval=1.0):
+        self.events_path = events_path
+        self.clue_log = clue_log
+        self.clues_path = clue_log.path
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._events_sig = None
+        self._clues_sig = None
+        self._checked_at = 0.0
+
+    def _load_raw_events(self):
+        return freeze(read_json_list(self.events_path))
+
+    def _load_clues(self):
+        return freeze(self.clue_log.read())
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._snapshot and now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            events_sig = file_signature(self.events_path)
+            clues_sig = file_signature(self.clues_path)
+            snapshot = self._snapshot
+            if snapshot is None or events_sig != self._events_sig or clues_sig != self._clues_sig:
+                base = snapshot if snapshot and events_sig == self._events_sig else None
+                raw_events = base.raw_events if base else self._load_raw_events()
+                clues = snapshot.clues if snapshot and clues_sig == self._clues_sig else self._load_clues()
+                self._snapshot = Snapshot(raw_events, clues, base)
+                self._events_sig = events_sig
+                self._clues_sig = clues_sig
+            self._checked_at = now
+            return self._snapshot
+
+    def snapshot(self):
+        return self._refresh()
+
+    def events(self):
+        return self._refresh().events
+
+    def get(self, event_id):
+        return self._refresh().index.get(event_id)
+
+    def clues(self):
+        return self._refresh().clues
+
+    def get_with_clues(self, event_id, clues):
+        """Resolve an event against a caller-supplied clue list (e.g. a session's)"""
+        raw_event = self._refresh().raw_index.get(event_id)
+        if raw_event is None:
+            return None
+        return resolve_event(raw_event, freeze(clues))
+
+    def _write_clues(self, persist, clues):
+        with self._lock:
+            snapshot = self._refresh(force=True)
+            persist()
+            self._snapshot = Snapshot(snapshot.raw_events, clues(snapshot.clues), snapshot)
+            self._clues_sig = file_signature(self.clues_path)
+
+    def append_clue(self, entry):
+        """Append a clue to the log and add it to the snapshot"""
+        self._write_clues(lambda: self.clue_log.append(entry), lambda clues: clues + (freeze(entry),))
+
+    def reset_clues(self):
+        """Clear the clue log and empty the snapshot"""
+        self._write_clues(self.clue_log.reset, lambda clues: ())
@@ -0,0 +1,187 @@
+"""Rolling memory of long tribunal transcripts.
+
+Prompts only show the last few lines of a trial. Turns older than that
+are folded into a compact memory: who accused whom, which clues were
+cited and contradictions spotted. Accusations and clue citations are
+read straight from the text; contradictions need an LLM pass.
+
+Server-held transcripts (a session's or a logged trial's) keep one memory
+per key. Turns are folded in the background, ``every`` at a time, once they scroll
+out of the prompt window, so the prompt stays the same size however long
+the trial runs. Client-held histories have no identity across requests;
+their older lines are folded on the fly, without the LLM pass.
+"""
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval import tokenize
+from speakers import ACCUSATION_PATTERN
+
+
+def clue_texts(event):
+    return [
+        clue.get('text', '') if isinstance(clue, dict) else str(clue)
+        for clue in event.get('p_clues', ())
+    ]
+
+
+def clue_terms(clues):
+    return [(clue, set(tokenize(clue))) for clue in clues if clue]
+
+
+def cited_clues(text, terms):
+    """Clues whose words text repeats: three of them, or all of a shorter clue"""
+    words = set(tokenize(text))
+    return [clue for clue, clue_words in terms
+            if clue_words and len(words & clue_words) >= min(3, len(clue_words))]
+
+
+def parse_contradictions(reply):
+    """Contradiction lines from an LLM reply; NONE or an error reply yields nothing"""
+    lines = []
+    for raw in (reply or '').splitlines():
+        line = raw.strip().lstrip('-*• ').strip()
+        if not line or line.upper().startswith('NONE') or line.startswith('Error:'):
+            continue
+        lines.append(line)
+    return lines
+
+
+class TrialMemory:
+    """Accusations, clue citations and contradictions folded from older turns"""
+
+    def __init__(self, max_contradictions=6):
+        self.max_contradictions = max_contradictions
+        self.accusations = Counter()
+        self.citations = OrderedDict()
+        self.contradictions = []
+        self.turns = 0
+
+    def fold(self, turns, clues, find):
+        """Add accusations and clue citations from turns; find(text) returns mentioned roster ids"""
+        terms = clue_terms(clues)
+        for item in turns:
+            speaker, text = item['speaker'], item['text']
+            if ACCUSATION_PATTERN.search(text):
+                for target in find(text):
+                    if target != speaker:
+                        self.accusations[(speaker, target)] += 1
+            for clue in cited_clues(text, terms):
+                speakers = self.citations.setdefault(clue, [])
+                if speaker not in speakers:
+                    speakers.append(speaker)
+        self.turns += len(turns)
+
+    def add_contradictions(self, lines):
+        for line in lines:
+            if line not in self.contradictions:
+                self.contradictions.append(line)
+        self.contradictions = self.contradictions[-self.max_contradictions:]
+
+    def lines(self):
+        """Memory as prompt lines, most telling first"""
+        lines = [f"- Contradiction: {line}" for line in reversed(self.contradictions)]
+        for (accuser, accused), count in self.accusations.most_common():
+            lines.append(f"- {accuser} accused {accused}" + (f" ({count} times)" if count > 1 else ""))
+        for clue, speakers in self.citations.items():
+            lines.append(f"- {', '.join(speakers)} cited: {clue}")
+        return lines
+
+
+class _Trial:
+    def __init__(self):
+        self.memory = TrialMemory()
+        self.clues = []
+        self.pending = []
+        self.busy = False
+
+
+class TranscriptSummarizer:
+    """Per-trial rolling memories, folded in the background.
+
+    Memories are keyed by any hashable the caller picks for a transcript.
+    ``find(text)`` returns the roster ids a line mentions and
+    ``contradict(memory_lines, turns)`` returns contradiction lines; pass
+    ``contradict=None`` to skip the LLM pass.
+    """
+
+    def __init__(self, find, contradict=None, window=10, every=4, max_trials=1000):
+        self.find = find
+        self.contradict = contradict
+        self.window = window
+        self.every = every
+        self.max_trials = max_trials
+        self.folds = 0
+        self._trials = OrderedDict()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._running = 0
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='summarize')
+
+    def _trial(self, key, event=None, history=None):
+        trial = self._trials.get(key)
+        if trial is None:
+            trial = self._trials[key] = _Trial()
+            if event is not None:
+                # First sight of this trial (or a restart): fold what is already out of the window.
+                trial.clues = clue_texts(event)
+                trial.memory.fold(history[:-self.window], trial.clues, self.find)
+                trial.pending = list(history[-self.window:])
+            while len(self._trials) > self.max_trials:
+                self._trials.popitem(last=False)
+        else:
+            self._trials.move_to_end(key)
+        return trial
+
+    def memory_lines(self, key, event, history):
+        """Memory of the turns before the prompt window; key None folds history on the spot"""
+        if self.every <= 0:
+            return []
+        if key is None:
+            memory = TrialMemory()
+            memory.fold(history[:-self.window], clue_texts(event), self.find)
+            return memory.lines()
+        with self._lock:
+            trial = self._trial(key, event, history)
+            trial.clues = clue_texts(event)  # unlocked clues grow during a trial
+            return trial.memory.lines()
+
+    def observe(self, key, entries):
+        """Record turns appended to the transcript under key; folds every ``every`` turns"""
+        if self.every <= 0:
+            return
+        with self._lock:
+            trial = self._trial(key)
+            trial.pending.extend(entries)
+            if trial.busy or len(trial.pending) < self.window + self.every:
+                return
+            turns, trial.pending = trial.pending[:-self.window], trial.pending[-self.window:]
+            trial.busy = True
+            known = trial.memory.lines()
+            self._running += 1
+        self._pool.submit(self._fold, trial, turns, known)
+
+    def _fold(self, trial, turns, known):
+        try:
+            with self._lock:
+                trial.memory.fold(turns, trial.clues, self.find)
+                self.folds += 1
+            if self.contradict:
+                contradictions = self.contradict(known, turns)
+                with self._lock:
+                    trial.memory.add_contradictions(contradictions)
+        finally:
+            with self._lock:
+                trial.busy = False
+                self._running -= 1
+                self._idle.notify_all()
+
+    def wait(self):
+        """Block until every queued fold has finished (tests and benchmarks)"""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._running)
+
+    def stats(self):
+        with self._lock:
+            return {'trials': len(self._trials), 'folds': self.folds}
@@ -0,0 +1,21 @@
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from lookup import CharacterIndex  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def characters():
+    with open(os.path.join(BACKEND, 'characters.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='session')
+def find(characters):
+    return CharacterIndex(characters).find
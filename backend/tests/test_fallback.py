@@ -0,0 +1,22 @@
+from fallback import ACCUSED, DEFENDING, classify_situation
+from speakers import ACCUSATION_PATTERN
+import summary
+import verdict
+
+
+def judge(text):
+    return [{'speaker': 'Judge', 'text': text}]
+
+
+def test_one_accusation_pattern():
+    assert summary.ACCUSATION_PATTERN is ACCUSATION_PATTERN
+    assert verdict.ACCUSATION_PATTERN is ACCUSATION_PATTERN
+
+
+def test_accuse_is_an_accusation(find):
+    assert classify_situation('qiongqi', judge("I accuse qiongqi"), find) == ACCUSED
+    assert classify_situation('qiongqi', judge("我指控穷奇"), find) == ACCUSED
+
+
+def test_mention_without_accusation_is_defending(find):
+    assert classify_situation('qiongqi', judge("qiongqi, where were you?"), find) == DEFENDING
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import QuotaScheduler
+from llm import LLMCancelled, LLMClient, LLMError, LLMTimeout
+
+
+class SlowProvider:
+    name = 'slow'
+    model = 'slow-1'
+
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def _leave(self):
+        with self._lock:
+            self.running -= 1
+
+    def generate(self, prompt, prefix=''):
+        self._enter()
+        time.sleep(self.delay)
+        self._leave()
+        return "done"
+
+    def stream(self, prompt, prefix=''):
+        self._enter()
+        yield "done"
+        self._leave()
+
+    async def astream(self, prompt, prefix=''):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("upstream reset")
+        await asyncio.sleep(self.delay)
+        for word in ("one", " two"):
+            yield word
+
+
+def collect(client, **kwargs):
+    async def run():
+        return [chunk async for chunk in client.astream("prompt", **kwargs)]
+    return asyncio.run(run())
+
+
+def test_abandoned_generate_keeps_its_slot():
+    provider = SlowProvider(delay=0.3)
+    client = LLMClient(provider, max_concurrency=1, timeout=0.05, max_retries=2, backoff=0)
+    with pytest.raises(LLMTimeout):
+        client.generate("prompt")
+    assert list(client.stream("prompt")) == ["done"]  # waits for the abandoned call
+    assert provider.calls == 2
+    assert provider.peak == 1
+
+
+def test_astream_retries_before_the_first_chunk():
+    client = LLMClient(SlowProvider(failures=1), max_retries=1, backoff=0)
+    assert collect(client) == ["one", " two"]
+
+
+def test_astream_times_out_a_stalled_stream():
+    client = LLMClient(SlowProvider(delay=0.5), timeout=0.05, max_retries=0, backoff=0)
+    with pytest.raises(LLMError, match="stalled"):
+        collect(client)
+
+
+class StallingStream(SlowProvider):
+    def stream(self, prompt, prefix=''):
+        self._enter()
+        try:
+            yield "one"
+            time.sleep(self.delay)
+            yield " two"
+        finally:
+            self._leave()
+
+
+def test_stream_times_out_a_stalled_chunk_and_keeps_the_slot():
+    provider = StallingStream(delay=0.3)
+    client = LLMClient(provider, max_concurrency=1, timeout=0.05, max_retries=0, backoff=0)
+    chunks = client.stream("prompt")
+    assert next(chunks) == "one"
+    with pytest.raises(LLMError, match="stalled"):
+        next(chunks)
+    with pytest.raises(LLMTimeout):
+        client.generate("prompt")  # the stalled stream still holds the only slot
+    time.sleep(0.35)
+    assert provider.running == 0
+    provider.delay = 0
+    assert client.generate("prompt") == "done"
+
+
+def test_cancelled_generate_gives_back_its_token_and_slot():
+    provider = SlowProvider()
+    scheduler = QuotaScheduler(rate=0.1, burst=1)
+    client = LLMClient(provider, max_concurrency=1, timeout=0.5, max_retries=0, backoff=0,
+                       scheduler=scheduler)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(LLMCancelled):
+        client.generate("prompt", cancel=cancel)
+    assert provider.calls == 0
+    assert client.generate("prompt") == "done"  # same token, same slot
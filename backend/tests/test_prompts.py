@@ -0,0 +1,37 @@
+import json
+import os
+
+from prompts import PromptBuilder
+
+from conftest import BACKEND
+
+EVENT = {
+    'id': 'moon-altar',
+    'name': 'The Moon Altar',
+    'description': 'The altar keeper was found at dawn.',
+    'npcs': ['kui', 'bifang'],
+    'p_clues': [
+        {'text': "Blue phosphorescence remains on the altarpiece.", 'beast': 'kui', 'area': 'altar'},
+        {'text': "Feathers were scattered by the east gate.", 'beast': 'bifang', 'area': 'gate'},
+    ],
+}
+
+
+def builder(budgets=None):
+    with open(os.path.join(BACKEND, 'characters.json'), 'r', encoding='utf-8') as f:
+        return PromptBuilder(json.load(f), budgets)
+
+
+def test_trial_line_prefix_holds_only_persona_and_case():
+    prompt = builder().trial_line(EVENT, 'kui', [])
+    assert EVENT['description'] in prompt.prefix
+    assert "Unlocked clues" not in prompt.prefix
+    assert "Unlocked clues" in prompt.suffix
+
+
+def test_trial_line_prefix_stable_as_clue_ranking_changes():
+    prompts = builder({'clues': 16})  # room for one clue, picked by the transcript
+    altar = prompts.trial_line(EVENT, 'kui', [{'speaker': 'Judge', 'text': "Explain the altarpiece glow."}])
+    gate = prompts.trial_line(EVENT, 'kui', [{'speaker': 'Judge', 'text': "Who was by the east gate feathers?"}])
+    assert "altarpiece" in altar.suffix and "altarpiece" not in gate.suffix
+    assert altar.prefix == gate.prefix
@@ -0,0 +1,25 @@
+from speakers import rank_speakers, schedule_speaker
+
+# A fixture event on the opt-in rule scheduler; the shipped events keep the LLM moderator.
+EVENT = {
+    'id': 'rules-fixture',
+    'npcs': ['kui', 'bifang', 'qiongqi', 'jiuweihu'],
+    'scheduler': 'rules',
+    'scheduler_window': 6,
+}
+
+
+def test_judge_accusation_gives_the_accused_the_floor(characters):
+    history = [{'speaker': 'kui', 'text': "I saw nothing."},
+               {'speaker': 'Judge', 'text': "Qiongqi, you are lying!"}]
+    assert schedule_speaker(EVENT, history, characters) == 'qiongqi'
+
+
+def test_nobody_speaks_twice_in_a_row(characters):
+    history = [{'speaker': 'Judge', 'text': "Kui, explain yourself."},
+               {'speaker': 'kui', 'text': "Kui did nothing, Kui swears it."}]
+    assert schedule_speaker(EVENT, history, characters) != 'kui'
+
+
+def test_ranking_covers_the_whole_roster(characters):
+    assert sorted(rank_speakers(EVENT, [], characters)) == sorted(EVENT['npcs'])
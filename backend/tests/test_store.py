@@ -0,0 +1,21 @@
+import json
+
+from cluelog import ClueLog
+from store import CLUES_PLACEHOLDER, EventStore
+
+
+def test_append_clue_only_resolves_events_showing_the_log(tmp_path):
+    events_path = tmp_path / 'events.json'
+    events_path.write_text(json.dumps([
+        {'id': 'open', 'p_clues': [CLUES_PLACEHOLDER]},
+        {'id': 'fixed', 'p_clues': ['A torn sleeve']},
+    ]))
+    store = EventStore(str(events_path), ClueLog(str(tmp_path / 'clues.jsonl'), fsync=False))
+    fixed = store.get('fixed')
+
+    store.append_clue({'text': 'Blue phosphorescence'})
+
+    assert [clue['text'] for clue in store.get('open')['p_clues']] == ['Blue phosphorescence']
+    assert store.get('fixed') is fixed
+    store.reset_clues()
+    assert store.get('open')['p_clues'] == ()
@@ -0,0 +1,40 @@
+import time
+
+from summary import TranscriptSummarizer, TrialMemory, cited_clues, clue_terms
+
+
+def test_fold_records_i_accuse(find):
+    memory = TrialMemory()
+    memory.fold([{'speaker': 'Judge', 'text': "I accuse qiongqi of this crime!"}], [], find)
+    assert memory.accusations[('Judge', 'qiongqi')] == 1
+    assert "- Judge accused qiongqi" in memory.lines()
+
+
+def test_fold_records_npc_accusations(find):
+    memory = TrialMemory()
+    memory.fold([{'speaker': 'kui', 'text': "Bifang accused me, but bifang is the liar."}], [], find)
+    assert memory.accusations[('kui', 'bifang')] == 1
+
+
+def test_fold_skips_plain_mentions(find):
+    memory = TrialMemory()
+    memory.fold([{'speaker': 'Judge', 'text': "Kui, where were you that night?"}], [], find)
+    assert not memory.accusations
+
+
+def test_cited_clues_need_three_shared_words():
+    terms = clue_terms(["Blue phosphorescence remains on the altarpiece."])
+    assert cited_clues("Why is there blue phosphorescence on the altarpiece?", terms)
+    assert not cited_clues("The altarpiece is old.", terms)
+
+
+def test_wait_covers_every_queued_fold(find):
+    def contradict(known, turns):
+        time.sleep(0.1)
+        return ["slow"]
+    summarizer = TranscriptSummarizer(find, contradict, window=1, every=1)
+    for key in range(5):  # more folds than pool workers
+        summarizer.observe(key, [{'speaker': 'kui', 'text': "line"}] * 2)
+    summarizer.wait()
+    assert summarizer.stats()['folds'] == 5
+    assert all(summarizer._trials[key].memory.contradictions == ["slow"] for key in range(5))
@@ -0,0 +1,64 @@
+import pytest
+
+from verdict import OPEN, SOLVED, WRONG, read_accusation, trial_verdict
+
+
+EVENT = {
+    'npcs': ['kui', 'bifang', 'qiongqi', 'jiuweihu'],
+    'killers': ['jiuweihu'],
+    'p_clues': [],
+}
+
+
+def verdict(*lines, find):
+    return trial_verdict(EVENT, [{'speaker': 'Judge', 'text': line} for line in lines], find)
+
+
+@pytest.mark.parametrize('line', [
+    "Kui, are you guilty?",
+    "I find Kui's story strange.",
+    "Qiongqi, what is your verdict on this?",
+    "Is jiuweihu guilty? Explain.",
+    "Is jiuweihu the killer?",
+    "The killer is not kui.",
+    "Kui is not the killer.",
+    "凶手不是九尾狐。",
+    "九尾狐不是凶手。",
+])
+def test_questions_and_denials_keep_the_trial_open(line, find):
+    state = verdict(line, find=find)
+    assert state['status'] == OPEN and not state['closed']
+    assert state['accused'] == []
+
+
+@pytest.mark.parametrize('line', [
+    "I accuse jiuweihu!",
+    "The killer is Jiuweihu.",
+    "Jiuweihu was the culprit, not kui.",
+    "Kui, you didn't answer. I accuse jiuweihu!",
+    "凶手是九尾狐。",
+    "我指控九尾狐！",
+])
+def test_explicit_accusation_of_the_killer_solves(line, find):
+    state = verdict(line, find=find)
+    assert state['status'] == SOLVED and state['closed']
+    assert state['accused'] == ['jiuweihu']
+
+
+def test_accusing_an_innocent_is_wrong(find):
+    state = verdict("Kui, you lied to us.", "I accuse qiongqi of this crime!", find=find)
+    assert state['status'] == WRONG
+    assert state['accused'] == ['qiongqi']
+    assert state['accusations'] == {'kui': 1, 'qiongqi': 1}
+
+
+def test_negation_outside_the_clause_does_not_cancel(find):
+    accused, formal = read_accusation("You didn't answer me, bifang. I accuse jiuweihu!", find)
+    assert formal == ['jiuweihu']
+
+
+def test_the_answer_is_only_revealed_once_closed(find):
+    state = verdict("Kui, you lied to us.", find=find)
+    assert 'killers' not in state and 'truth' not in state
+    state = verdict("I accuse qiongqi!", find=find)
+    assert state['killers'] == ['jiuweihu'] and 'truth' not in state
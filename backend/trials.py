@@ -0,0 +1,263 @@
+"""Event-sourced tribunal trial log with snapshots.
+
+Every trial gets an id and an append-only JSON-lines log under
+``directory``. Records are numbered by ``seq``:
+
+- ``start``: event id and session id
+- ``judge``: a Judge line
+- ``speaker``: who was given the floor, and by whom (``judge`` for a chosen
+  speaker, ``moderator``, or ``round`` for a batch round)
+- ``line``: an NPC line
+- ``verdict``: the closing verdict
+
+Folding the records in order with ``apply`` gives the trial state: the
+recent history prompts need, line and turn counts, speaker counts and the
+verdict. Every ``snapshot_every`` records the state is written beside the
+log, so resuming reads the snapshot plus the records after it instead of
+the whole log. ``replay`` folds from the first record, ignoring snapshots.
+Torn trailing lines from a crash are skipped, as in the clue log.
+
+Each trial is meant to be written by one server process at a time.
+
+    python trials.py replay <trial_id>    # print the transcript
+    python trials.py state <trial_id>     # print the folded state
+"""
+import copy
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cluelog import write_json_atomic
+from metrics import timed
+
+
+TRIAL_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+JUDGE = 'Judge'
+
+
+def valid_trial_id(trial_id):
+    return isinstance(trial_id, str) and bool(TRIAL_ID_PATTERN.match(trial_id))
+
+
+def new_state(trial_id):
+    return {
+        'trial_id': trial_id, 'event_id': None, 'session_id': None, 'seq': 0,
+        'history': [], 'lines': 0, 'turns': 0, 'judge_lines': 0,
+        'speakers': {}, 'chosen_by': {}, 'verdict': None,
+        'started_at': None, 'updated_at': None,
+    }
+
+
+def apply(state, record, max_history=30):
+    """Fold one record into state, in place"""
+    kind = record.get('type')
+    if kind == 'start':
+        state.update(event_id=record.get('event_id'), session_id=record.get('session_id'),
+                     started_at=record.get('at'))
+    elif kind == 'judge':
+        state['history'].append({'speaker': JUDGE, 'text': record['text']})
+        state['lines'] += 1
+        state['judge_lines'] += 1
+    elif kind == 'speaker':
+        speaker, chosen_by = record['speaker'], record.get('by', 'moderator')
+        state['speakers'][speaker] = state['speakers'].get(speaker, 0) + 1
+        state['chosen_by'][chosen_by] = state['chosen_by'].get(chosen_by, 0) + 1
+    elif kind == 'line':
+        state['history'].append({'speaker': record['speaker'], 'text': record['text']})
+        state['lines'] += 1
+        state['turns'] += 1
+    elif kind == 'verdict':
+        state['verdict'] = {'status': record['status'], 'accused': record.get('accused', [])}
+    del state['history'][:-max_history]
+    state['seq'] = record['seq']
+    state['updated_at'] = record.get('at')
+    return state
+
+
+def turn_records(entries, chosen_by='moderator', verdict=None):
+    """Log records for transcript entries appended in one turn"""
+    records = []
+    for entry in entries:
+        if entry['speaker'] == JUDGE:
+            records.append({'type': 'judge', 'text': entry['text']})
+        else:
+            records.append({'type': 'speaker', 'speaker': entry['speaker'], 'by': chosen_by})
+            records.append({'type': 'line', 'speaker': entry['speaker'], 'text': entry['text']})
+    if verdict and verdict.get('closed'):
+        records.append({'type': 'verdict', 'status': verdict['status'], 'accused': verdict['accused']})
+    return records
+
+
+def read_records(path, after=0):
+    if not os.path.exists(path):
+        return []
+    records = []
+    with timed('moonlit_store_io_seconds', {'store': 'trials', 'op': 'read'}), \
+            open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn write from a crash
+            if isinstance(record, dict) and record.get('seq', 0) > after:
+                records.append(record)
+    return records
+
+
+class TrialLog:
+    """Append-only per-trial logs with periodic snapshots and an LRU of live states"""
+
+    def __init__(self, directory, snapshot_every=50, max_history=30, max_cached=1000, fsync=True):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.max_history = max_history
+        self.max_cached = max_cached
+        self.fsync = fsync
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _log_path(self, trial_id):
+        return os.path.join(self.directory, f"{trial_id}.jsonl")
+
+    def _snapshot_path(self, trial_id):
+        return os.path.join(self.directory, f"{trial_id}.snapshot.json")
+
+    def _read_snapshot(self, trial_id):
+        path = self._snapshot_path(trial_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with timed('moonlit_store_io_seconds', {'store': 'trials', 'op': 'read_snapshot'}), \
+                    open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except json.JSONDecodeError:
+            return None
+        return snapshot if isinstance(snapshot, dict) and 'state' in snapshot else None
+
+    def _load(self, trial_id):
+        """State from the snapshot plus the records after it; None for an unknown trial"""
+        snapshot = self._read_snapshot(trial_id)
+        state = snapshot['state'] if snapshot else new_state(trial_id)
+        tail = read_records(self._log_path(trial_id), after=state['seq'])
+        if not snapshot and not tail:
+            return None
+        for record in tail:
+            apply(state, record, self.max_history)
+        return state
+
+    def _state(self, trial_id):
+        state = self._states.get(trial_id)
+        if state is None:
+            state = self._load(trial_id)
+            if state is None:
+                return None
+            self._states[trial_id] = state
+            while len(self._states) > self.max_cached:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(trial_id)
+        return state
+
+    def _append(self, trial_id, state, records):
+        before = state['seq']
+        at = round(time.time(), 3)
+        stamped = [dict(record, seq=before + idx, at=at) for idx, record in enumerate(records, start=1)]
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in stamped).encode('utf-8')
+        with timed('moonlit_store_io_seconds', {'store': 'trials', 'op': 'append'}), \
+                open(self._log_path(trial_id), 'a+b') as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data  # keep a torn tail from swallowing these records
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        for record in stamped:
+            apply(state, record, self.max_history)
+        if self.snapshot_every and state['seq'] // self.snapshot_every > before // self.snapshot_every:
+            with timed('moonlit_store_io_seconds', {'store': 'trials', 'op': 'snapshot'}):
+                write_json_atomic(self._snapshot_path(trial_id), {'seq': state['seq'], 'state': state},
+                                  ensure_ascii=False)
+
+    def start(self, event_id, session_id=None):
+        """Open a new trial of event_id; returns its state"""
+        trial_id = f"{re.sub(r'[^A-Za-z0-9_-]', '', str(event_id))[:40]}-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            state = self._states[trial_id] = new_state(trial_id)
+            self._append(trial_id, state, [{'type': 'start', 'event_id': event_id, 'session_id': session_id}])
+            while len(self._states) > self.max_cached:
+                self._states.popitem(last=False)
+            return copy.deepcopy(state)
+
+    def append(self, trial_id, records):
+        with self._lock:
+            state = self._state(trial_id)
+            if state is None:
+                raise KeyError(trial_id)
+            if records:
+                self._append(trial_id, state, records)
+
+    def state(self, trial_id):
+        """Copy of the current state, or None for an unknown trial"""
+        with self._lock:
+            state = self._state(trial_id)
+            return copy.deepcopy(state) if state else None
+
+    def lines(self, trial_id):
+        """Lines in the trial's transcript, or None for an unknown trial"""
+        with self._lock:
+            state = self._state(trial_id)
+            return state['lines'] if state else None
+
+    def resume(self, trial_id):
+        """(snapshot, tail): the last snapshot (or None) and every record after it"""
+        with self._lock:
+            if self._state(trial_id) is None:
+                return None, None
+            snapshot = self._read_snapshot(trial_id)
+            after = snapshot['seq'] if snapshot else 0
+            return snapshot, read_records(self._log_path(trial_id), after=after)
+
+    def records(self, trial_id, after=0, limit=None):
+        with self._lock:
+            records = read_records(self._log_path(trial_id), after=after)
+        return records[:limit] if limit else records
+
+    def replay(self, trial_id):
+        """State folded from the first record, with the full history"""
+        records = self.records(trial_id)
+        if not records:
+            return None
+        state = new_state(trial_id)
+        for record in records:
+            apply(state, record, max_history=len(records))
+        return state
+
+
+if __name__ == '__main__':
+    log = TrialLog(os.environ.get('MOONLIT_TRIAL_DIR') or os.path.join(os.path.dirname(__file__), 'trials'))
+    command, trial_id = (sys.argv[1:3] + [None, None])[:2]
+    if command not in ('replay', 'state') or not valid_trial_id(trial_id):
+        print("Usage: python trials.py [replay|state] <trial_id>")
+        sys.exit(1)
+    state = log.replay(trial_id)
+    if state is None:
+        print(f"Trial {trial_id} not found")
+        sys.exit(1)
+    if command == 'state':
+        print(json.dumps(dict(state, history=state['history'][-log.max_history:]), ensure_ascii=False, indent=2))
+    else:
+        for item in state['history']:
+            print(f"{item['speaker']}: {item['text']}")
+        if state['verdict']:
+            print(f"-- verdict: {state['verdict']['status']} ({', '.join(state['verdict']['accused'])})")
@@ -0,0 +1,123 @@
+"""Deterministic trial verdicts read from the Judge's lines.
+
+No LLM is involved. Every Judge line is split into sentences and checked
+for accusations: an accusing word (see ``speakers.ACCUSATION_PATTERN``)
+next to a roster id, name or alias. Only an explicit accusation in a
+statement is a formal verdict: "I accuse kui", "The killer is Jiuweihu",
+"Kui was the culprit", "凶手是九尾狐" or "我指控九尾狐". Questions ("Is kui
+guilty?") never are, and a negation inside the accusing clause ("the
+killer is not kui") cancels it. A formal verdict closes the trial:
+
+- ``solved`` when exactly the event's ``killers`` are named
+- ``wrong`` when anyone else is named
+
+Naming only some of several killers leaves the trial open and counts as
+progress. Clues the Judge cites, by repeating their words, are tracked as
+evidence. The state returned never contains ``killers`` or ``truth``.
+"""
+import re
+
+from speakers import ACCUSATION_PATTERN
+from summary import clue_terms, clue_texts, cited_clues
+
+
+OPEN = 'open'
+SOLVED = 'solved'
+WRONG = 'wrong'
+
+JUDGE = 'Judge'
+
+SENTENCE_PATTERN = re.compile(r"[^.!?。！？]+[.!?。！？]*")
+# Accusing phrase followed by the accused: "I accuse kui", "the killer is kui", "凶手是九尾狐".
+ACCUSE_BEFORE = re.compile(
+    r"(?:\bi (?:formally |hereby )?accuse\b|\bthe (?:killer|murderer|culprit) (?:is|was)\b"
+    r"|我指控|凶手是|凶手就是)(?P<clause>.*)",
+    re.IGNORECASE
+)
+# The accused followed by the accusing phrase: "kui is the killer", "九尾狐就是凶手".
+ACCUSE_AFTER = re.compile(
+    r"(?P<clause>.*?)(?:\b(?:is|was) the (?:killer|murderer|culprit)\b|是凶手)",
+    re.IGNORECASE
+)
+CLAUSE_BREAK = re.compile(r"[,;:，；：]|\b(?:because|who|which|since|after|while|but)\b", re.IGNORECASE)
+NEGATION_PATTERN = re.compile(r"\b(?:not|never|no)\b|n't\b|不|没", re.IGNORECASE)
+
+
+def sentences(text):
+    return [match.group(0).strip() for match in SENTENCE_PATTERN.finditer(text) if match.group(0).strip()]
+
+
+def accusing_clause(sentence):
+    """The part of a declarative sentence that names the accused, or None"""
+    if sentence.endswith(('?', '？')):
+        return None
+    match = ACCUSE_BEFORE.search(sentence)
+    if match:
+        clause = CLAUSE_BREAK.split(match.group('clause'), 1)[0]
+    else:
+        match = ACCUSE_AFTER.search(sentence)
+        if not match:
+            return None
+        clause = CLAUSE_BREAK.split(match.group('clause'))[-1]
+    return None if NEGATION_PATTERN.search(clause) else clause
+
+
+def read_accusation(text, find):
+    """(accused, formal) for one Judge line: ids in accusing sentences, and those formally accused.
+
+    find(text) returns mentioned roster ids.
+    """
+    accused, formal = [], []
+    for sentence in sentences(text):
+        clause = accusing_clause(sentence)
+        if clause is not None:
+            named = find(clause)
+        elif ACCUSATION_PATTERN.search(sentence):
+            named = []
+        else:
+            continue
+        for npc in find(sentence) + named:
+            if npc not in accused:
+                accused.append(npc)
+        formal.extend(npc for npc in named if npc not in formal)
+    return accused, formal
+
+
+def trial_verdict(event, history, find):
+    """Verdict state after history; the first formal verdict that closes the trial is final"""
+    killers = set(event.get('killers', []))
+    roster = set(event.get('npcs', []))
+    terms = clue_terms(clue_texts(event))
+    accusations = {}
+    cited = []
+    named = set()
+    state = {'status': OPEN, 'closed': False}
+    for item in history:
+        if item.get('speaker') != JUDGE:
+            continue
+        text = item.get('text', '')
+        for clue in cited_clues(text, terms):
+            if clue not in cited:
+                cited.append(clue)
+        accused, formal = read_accusation(text, find)
+        for npc in accused:
+            if npc in roster:
+                accusations[npc] = accusations.get(npc, 0) + 1
+        formal = [npc for npc in formal if npc in roster]
+        if not formal:
+            continue
+        named.update(formal)
+        if named == killers:
+            state.update(status=SOLVED, closed=True)
+        elif not named <= killers:
+            state.update(status=WRONG, closed=True)
+        if state['closed']:
+            break
+    state['accused'] = sorted(named)
+    state['named_killers'] = len(named & killers)
+    state['killers_total'] = len(killers)
+    state['accusations'] = accusations
+    state['clues_cited'] = cited
+    if state['closed']:
+        state['killers'] = sorted(killers)  # the answer, revealed once the trial is over
+    return state
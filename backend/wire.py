@@ -0,0 +1,158 @@
+"""Tribunal wire protocol: cursors, deltas and compact encoding.
+
+Protocol 1 (the default) sends the last 30 lines of history with every
+turn and whole events, clues included. Protocol 2 is opted into with
+``"protocol": 2`` in a POST body or ``?v=2`` on a GET. The client then
+keeps a cursor, which it echoes back as the request's ``cursor`` (or as
+``lines``, ``clues`` and ``clue_tag`` query parameters):
+
+- ``lines``: transcript lines the client has
+- ``clues``: resolved clues the client has
+- ``clue_tag``: short hash of the last of those clues
+
+Replies carry only the lines (``turns``) and clues after the cursor, and
+the new cursor. When the cursor no longer matches, for example after a
+clue reset or a gap wider than the history window, ``reset`` (or
+``clues_reset``) is set and the full window or clue list is sent instead.
+
+Event payloads never include ``truth`` or ``killers``. Protocol 2 also
+trims events and verdicts to the fields the client shows.
+
+``dumps`` uses orjson when it is installed, and compact stdlib JSON
+otherwise. ``compress`` gzips large replies, or uses brotli when the
+``brotli`` package is installed and the client accepts it.
+"""
+import gzip
+import hashlib
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from metrics import timed
+
+
+PROTOCOL = 2
+
+SECRET_FIELDS = ('truth', 'killers')
+EVENT_FIELDS = ('id', 'name', 'description', 'map', 'time', 'npcs')
+VERDICT_FIELDS = ('status', 'closed', 'accused', 'named_killers', 'killers_total', 'killers')
+
+
+def dumps(payload):
+    """Compact JSON as UTF-8 bytes"""
+    with timed('moonlit_json_io_seconds', {'op': 'dumps'}):
+        if orjson is not None:
+            return orjson.dumps(payload)
+        return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data):
+    with timed('moonlit_json_io_seconds', {'op': 'loads'}):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+def public_event(event):
+    """Event without the fields that give the answer away"""
+    return {key: value for key, value in event.items() if key not in SECRET_FIELDS}
+
+
+def trim(payload, fields):
+    return {key: payload[key] for key in fields if key in payload}
+
+
+def clue_tag(clue):
+    return hashlib.blake2b(json.dumps(clue, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+                           digest_size=4).hexdigest()
+
+
+def make_cursor(lines, clues):
+    return {'lines': lines, 'clues': len(clues), 'clue_tag': clue_tag(clues[-1]) if clues else None}
+
+
+def read_cursor(source):
+    """Cursor from a request body's ``cursor`` dict or query parameters; fields it lacks are None"""
+    cursor = {}
+    for key in ('lines', 'clues'):
+        try:
+            value = int(source.get(key))
+        except (TypeError, ValueError):
+            value = None
+        cursor[key] = value if value is not None and value >= 0 else None
+    tag = source.get('clue_tag')
+    cursor['clue_tag'] = tag if isinstance(tag, str) else None
+    return cursor
+
+
+def line_delta(history, lines, cursor_lines, new=0):
+    """(turns, reset): the lines the client lacks.
+
+    ``history`` is the recent window, ending at line ``lines`` of the
+    server-held transcript. With a client-held history (``lines`` None)
+    the client has everything but the ``new`` lines this request added.
+    """
+    if lines is None:
+        return (list(history[-new:]) if new else []), False
+    if cursor_lines is not None and 0 <= lines - cursor_lines <= len(history):
+        missing = lines - cursor_lines
+        return (list(history[-missing:]) if missing else []), False
+    return list(history), True
+
+
+def clue_delta(clues, cursor):
+    """(clues, reset): clues after the cursor, or all of them if it no longer matches"""
+    seen = cursor.get('clues')
+    if seen is not None and seen <= len(clues):
+        if seen == 0 or clue_tag(clues[seen - 1]) == cursor.get('clue_tag'):
+            return list(clues[seen:]), False
+    return list(clues), True
+
+
+def accepts(accept_encoding, coding):
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip().lower() != coding:
+            continue
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def pick_encoding(accept_encoding, size, min_size=1024):
+    """'br', 'gzip' or None for a body of size bytes"""
+    if not min_size or size < min_size:
+        return None
+    if brotli is not None and accepts(accept_encoding, 'br'):
+        return 'br'
+    if accepts(accept_encoding, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=4)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=5)
+    return body
+
+
+def compress(body, accept_encoding, min_size=1024):
+    """(body, encoding): brotli or gzip for bodies of at least min_size bytes, else unchanged"""
+    encoding = pick_encoding(accept_encoding, len(body), min_size)
+    return encode(body, encoding), encoding
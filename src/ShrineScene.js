@@ -1,4 +1,5 @@
 import { tribunalUI } from './ui/tribunal.js';
+import { sessionHeaders } from './ui/session.js';
 
 export default class ShrineScene extends Phaser.Scene {
   constructor() {
@@ -1011,6 +1012,26 @@ export default class ShrineScene extends Phaser.Scene {
       return;
     }
 
+    // The backend serves the pool pre-merged with an ETag, so repeat loads are a 304.
+    fetch('http://localhost:5001/api/clues/pool')
+      .then((res) => {
+        if (!res.ok) throw new Error(`Clue pool request failed: ${res.status}`);
+        return res.json();
+      })
+      .then((data) => data.locations)
+      .catch((error) => {
+        console.warn('Clue pool unavailable, merging the static clue files', error);
+        return this.loadStaticClues();
+      })
+      .then((merged) => {
+        this.cluesData = merged;
+        this.preloadedClueData = merged;
+        window.__GLOBAL_CLUE_DATA = merged;
+        this.placeClues();
+      });
+  }
+
+  loadStaticClues() {
     const basePromise = fetch('clues.json').then((res) => res.json()).catch((error) => {
       console.error('Failed to load clues.json', error);
       return { locations: [] };
@@ -1021,13 +1042,9 @@ export default class ShrineScene extends Phaser.Scene {
       return null;
     });
 
-    Promise.all([basePromise, crimePromise]).then(([baseData, crimeData]) => {
+    return Promise.all([basePromise, crimePromise]).then(([baseData, crimeData]) => {
       const baseLocations = baseData?.locations || [];
-      const merged = this.mergeCrimeSceneClues(baseLocations, crimeData || []);
-      this.cluesData = merged;
-      this.preloadedClueData = merged;
-      window.__GLOBAL_CLUE_DATA = merged;
-      this.placeClues();
+      return this.mergeCrimeSceneClues(baseLocations, crimeData || []);
     });
   }
 
@@ -1177,7 +1194,7 @@ export default class ShrineScene extends Phaser.Scene {
     const payload = { ...entry };
     fetch('http://localhost:5001/api/clues/log', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: sessionHeaders({ 'Content-Type': 'application/json' }),
       body: JSON.stringify(payload)
     }).catch((error) => {
       console.warn('Failed to save clue to backend:', error);
@@ -1300,7 +1317,8 @@ export default class ShrineScene extends Phaser.Scene {
     this.updateMemoryBookUI();
 
     return fetch('http://localhost:5001/api/clues/reset', {
-      method: 'POST'
+      method: 'POST',
+      headers: sessionHeaders()
     }).catch((err) => {
       console.warn('Failed to reset clues log', err);
     });
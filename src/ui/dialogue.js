@@ -1,3 +1,6 @@
+import { postEventStream } from './sse.js';
+import { sessionHeaders } from './session.js';
+
 // Dialogue system handler
 export class DialogueSystem {
   constructor(scene) {
@@ -76,6 +79,13 @@ export class DialogueSystem {
     messageDiv.textContent = text;
     chatHistory.appendChild(messageDiv);
     chatHistory.scrollTop = chatHistory.scrollHeight;
+    return messageDiv;
+  }
+
+  appendToNPCMessage(messageDiv, text) {
+    const chatHistory = document.getElementById('chat-history');
+    messageDiv.textContent += text;
+    chatHistory.scrollTop = chatHistory.scrollHeight;
   }
 
   async getNPCReply(playerMessage) {
@@ -87,38 +97,35 @@ export class DialogueSystem {
     // Show typing indicator
     this.showTypingIndicator();
 
+    let messageDiv = null;
     try {
-      // Call Flask backend API
-      const response = await fetch('http://localhost:5001/api/chat', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          npc_id: currentNPC,
-          message: playerMessage,
-          history: history
-        })
-      });
-
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-
-      const data = await response.json();
-
-      // Remove typing indicator
+      // Stream the reply from the Flask backend so the first words show up early
+      await postEventStream('http://localhost:5001/api/chat/stream', {
+        npc_id: currentNPC,
+        message: playerMessage,
+        history: history
+      }, (name, data) => {
+        if (name === 'token' && data.text) {
+          if (!messageDiv) {
+            this.hideTypingIndicator();
+            messageDiv = this.addNPCMessage('');
+          }
+          this.appendToNPCMessage(messageDiv, data.text);
+        } else if (name === 'done') {
+          this.hideTypingIndicator();
+          if (!messageDiv) {
+            messageDiv = this.addNPCMessage(data.response || '*silence*');
+          } else if (data.response) {
+            messageDiv.textContent = data.response;
+          }
+        }
+      }, sessionHeaders());
       this.hideTypingIndicator();
-
-      if (data.success && data.response) {
-        this.addNPCMessage(data.response);
-      } else {
-        this.addNPCMessage('*silence*');
-      }
     } catch (error) {
       console.error('Error fetching NPC reply:', error);
       // Remove typing indicator
       this.hideTypingIndicator();
+      if (messageDiv) return;
       // Fallback to mock reply if backend is unavailable
       const reply = this.generateMockReply(currentNPC, playerMessage);
       this.addNPCMessage(reply);
@@ -0,0 +1,28 @@
+// Per-tab session id so the backend keeps this player's clues and transcripts apart.
+const STORAGE_KEY = 'moonlit-session-id';
+
+function createSessionId() {
+  if (window.crypto?.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+function loadSessionId() {
+  try {
+    let sessionId = window.sessionStorage.getItem(STORAGE_KEY);
+    if (!sessionId) {
+      sessionId = createSessionId();
+      window.sessionStorage.setItem(STORAGE_KEY, sessionId);
+    }
+    return sessionId;
+  } catch (error) {
+    return createSessionId();
+  }
+}
+
+export const SESSION_ID = loadSessionId();
+
+export function sessionHeaders(headers = {}) {
+  return { ...headers, 'X-Session-Id': SESSION_ID };
+}
@@ -0,0 +1,68 @@
+// POST a JSON payload and consume a Server-Sent Events response.
+// Calls onEvent(name, data) for every frame; resolves with the number of frames
+// when the stream ends. A refused request throws with `status`, the JSON `body`
+// (if any) and, for a 429, `retryAfter` in seconds; a stream cut off later
+// throws with `received` set.
+export async function postEventStream(url, payload, onEvent, headers = {}) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: {
+      ...headers,
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream'
+    },
+    body: JSON.stringify(payload)
+  });
+
+  if (!response.ok || !response.body) {
+    const error = new Error(`HTTP error! status: ${response.status}`);
+    error.status = response.status;
+    error.body = await response.json().catch(() => ({}));
+    if (response.status === 429) {
+      // Retry-After is not exposed cross-origin; the body carries it too.
+      error.retryAfter = Number(response.headers.get('Retry-After')) || Number(error.body.retry_after) || 1;
+    }
+    throw error;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let received = 0;
+
+  const dispatch = (frame) => {
+    let name = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) {
+        name = line.slice(6).trim();
+      } else if (line.startsWith('data:')) {
+        dataLines.push(line.slice(5).trimStart());
+      }
+    });
+    if (!dataLines.length) return;
+    received += 1;
+    onEvent(name, JSON.parse(dataLines.join('\n')));
+  };
+
+  try {
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatch(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+  } catch (error) {
+    error.received = received;
+    throw error;
+  }
+  if (buffer.trim()) {
+    dispatch(buffer);
+  }
+  return received;
+}
@@ -1,4 +1,10 @@
+import { postEventStream } from './sse.js';
+import { sessionHeaders } from './session.js';
+
 const API_BASE = 'http://localhost:5001';
+const TRIAL_KEY_PREFIX = 'moonlit-trial-';
+const PROTOCOL = 2;
+const HISTORY_WINDOW = 30;
 
 const NPC_METADATA = {
   baize: { name: 'Baize', portrait: 'images/Baize.png' },
@@ -31,6 +37,9 @@ class TribunalUI {
     this.latestTextEl = document.getElementById('tribunal-latest-text');
 
     this.event = null;
+    this.trialId = null;
+    this.cursor = null;
+    this.verdict = null;
     this.history = [];
     this.isOpen = false;
     this.closeCallback = null;
@@ -85,14 +94,24 @@ class TribunalUI {
     if (this.event && this.event.id === eventId) {
       return;
     }
-    const res = await fetch(`${API_BASE}/api/tribunal/event/${eventId}`);
+    this.trialId = this.loadTrialId(eventId) || await this.startTrial(eventId);
+    let res = await this.fetchEvent(eventId);
+    if (res.status === 404 && this.trialId) {
+      // The server no longer has this trial's log; open a fresh one.
+      this.trialId = await this.startTrial(eventId);
+      res = await this.fetchEvent(eventId);
+    }
     if (!res.ok) {
       console.error('Failed to load tribunal event');
       return;
     }
     const data = await res.json();
-    this.event = data.event;
-    this.history = this.normalizeHistory(data.history || []);
+    this.event = { ...data.event, p_clues: [] };
+    this.history = [];
+    this.cursor = null;
+    this.verdict = null;
+    this.setLoading(false);
+    this.applyDelta(data);
     this.populateSpeakerSelect();
     this.renderClues();
     this.renderHistory();
@@ -100,6 +119,59 @@ class TribunalUI {
     this.updateHighlight('baize', 'Awaiting testimony...');
   }
 
+  fetchEvent(eventId, cursor = null) {
+    const params = new URLSearchParams({ v: PROTOCOL });
+    if (this.trialId) {
+      params.set('trial_id', this.trialId);
+    }
+    Object.entries(cursor || {}).forEach(([key, value]) => {
+      if (value !== null && value !== undefined) params.set(key, value);
+    });
+    return fetch(`${API_BASE}/api/tribunal/event/${eventId}?${params}`, {
+      headers: sessionHeaders()
+    });
+  }
+
+  loadTrialId(eventId) {
+    try {
+      return window.sessionStorage.getItem(TRIAL_KEY_PREFIX + eventId);
+    } catch (error) {
+      return null;
+    }
+  }
+
+  // Each tab plays one logged trial per event, so a reload resumes it.
+  async startTrial(eventId) {
+    const res = await fetch(`${API_BASE}/api/tribunal/trial`, {
+      method: 'POST',
+      headers: sessionHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify({ event_id: eventId })
+    });
+    if (!res.ok) {
+      console.warn('Could not open a trial log; using the session transcript');
+      return null;
+    }
+    const data = await res.json();
+    try {
+      window.sessionStorage.setItem(TRIAL_KEY_PREFIX + eventId, data.trial_id);
+    } catch (error) {
+      // Storage unavailable: the trial lasts as long as this page.
+    }
+    return data.trial_id;
+  }
+
+  // Replies carry only the lines and clues after our cursor, or everything on a reset.
+  applyDelta(data) {
+    const turns = this.normalizeHistory(data.turns || []);
+    this.history = (data.reset ? turns : this.history.concat(turns)).slice(-HISTORY_WINDOW);
+    const clues = data.clues || [];
+    if (data.clues_reset || clues.length) {
+      this.event.p_clues = data.clues_reset ? clues : this.event.p_clues.concat(clues);
+      this.renderClues();
+    }
+    this.cursor = data.cursor || null;
+  }
+
   populateSpeakerSelect() {
     if (!this.speakerSelect || !this.event) return;
     this.speakerSelect.innerHTML = '';
@@ -176,7 +248,11 @@ class TribunalUI {
   }
 
   async handleAction(action) {
-    if (!this.event || !this.overlay) return;
+    if (!this.event || !this.overlay || this.verdict) return;
+    if (action === 'round') {
+      await this.handleRound();
+      return;
+    }
     if (action === 'player') {
       const text = (this.inputEl?.value || '').trim();
       if (!text) {
@@ -185,11 +261,17 @@ class TribunalUI {
       }
     }
 
+    // The backend keeps the transcript for this trial, so history is not re-sent;
+    // replies carry only the lines and clues after our cursor.
     const payload = {
       event_id: this.event.id,
       action,
-      history: this.history
+      protocol: PROTOCOL,
+      cursor: this.cursor
     };
+    if (this.trialId) {
+      payload.trial_id = this.trialId;
+    }
 
     if (action === 'choose') {
       payload.speaker = this.speakerSelect?.value;
@@ -200,30 +282,203 @@ class TribunalUI {
 
     this.setLoading(true);
     try {
-      const res = await fetch(`${API_BASE}/api/tribunal/act`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload)
-      });
-      if (!res.ok) {
-        console.error('Tribunal action failed');
-        return;
-      }
-      const data = await res.json();
+      const data = await this.playStreamed(
+        (body) => this.streamTurn(body),
+        (body) => this.requestTurn(body),
+        payload
+      );
+      if (!data) return;
       if (!data.success) {
-        console.error('Tribunal action error', data.error);
+        if (data.verdict) {
+          this.renderHistory();  // drop the optimistic Judge line the server refused
+          this.showVerdict(data.verdict);
+        } else {
+          console.error('Tribunal action error', data.error);
+        }
         return;
       }
-      this.history = this.normalizeHistory(data.history || []);
-      if (action === 'player' && this.inputEl) {
+      this.applyDelta(data);
+      // After a resync the Judge line may not have been recorded; keep it to resend.
+      if (action === 'player' && this.inputEl && !data.resynced) {
         this.inputEl.value = '';
       }
       this.renderHistory();
+      this.showVerdict(data.verdict);
+    } finally {
+      this.setLoading(false);
+    }
+  }
+
+  // Every suspect answers once; the server drafts the round concurrently.
+  async handleRound() {
+    const payload = { event_id: this.event.id, mode: 'round', protocol: PROTOCOL, cursor: this.cursor };
+    if (this.trialId) {
+      payload.trial_id = this.trialId;
+    }
+    this.setLoading(true);
+    try {
+      const data = await this.playStreamed(
+        (body) => this.streamBatch(body),
+        (body) => this.requestBatch(body),
+        payload
+      );
+      if (!data) return;
+      if (!data.success) {
+        if (data.verdict) {
+          this.renderHistory();  // drop the optimistic Judge line the server refused
+          this.showVerdict(data.verdict);
+        } else {
+          console.error('Tribunal batch error', data.error);
+        }
+        return;
+      }
+      this.applyDelta(data);
+      this.renderHistory();
+      this.showVerdict(data.verdict);
     } finally {
       this.setLoading(false);
     }
   }
 
+  // The plain request is a fallback only for a stream that failed before any event:
+  // once the server has sent something it may have played the turn, so a cut-off
+  // stream resyncs from our cursor instead of posting again. A 429 is retried
+  // once, after the Retry-After the server asked for.
+  async playStreamed(stream, request, payload) {
+    try {
+      return await stream(payload);
+    } catch (error) {
+      if (error.status === 409) {
+        return error.body;  // the trial is over; the body carries its verdict
+      }
+      if (error.received) {
+        console.warn('Tribunal stream cut off, resyncing from the last cursor', error);
+        return this.resync();
+      }
+      if (error.status === 429) {
+        console.warn(`Tribunal busy, retrying in ${error.retryAfter}s`);
+        this.updateHighlight('baize', 'The court is crowded. Waiting for a quiet moment...');
+        await new Promise((resolve) => setTimeout(resolve, error.retryAfter * 1000));
+      } else {
+        console.warn('Tribunal stream failed, retrying without streaming', error);
+      }
+      return request(payload);
+    }
+  }
+
+  // Lines and clues after our cursor, as the server has recorded them.
+  async resync() {
+    const res = await this.fetchEvent(this.event.id, this.cursor);
+    if (!res.ok) {
+      console.error('Failed to resync the tribunal transcript');
+      return null;
+    }
+    return { ...(await res.json()), resynced: true };
+  }
+
+  async requestBatch(payload) {
+    const res = await fetch(`${API_BASE}/api/tribunal/batch`, {
+      method: 'POST',
+      headers: sessionHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify(payload)
+    });
+    if (res.status === 409) {
+      return res.json();
+    }
+    if (!res.ok) {
+      console.error('Tribunal batch failed');
+      return null;
+    }
+    return res.json();
+  }
+
+  // Append each line as its turn event arrives; resolves with the done payload.
+  async streamBatch(payload) {
+    let result = null;
+    const received = await postEventStream(`${API_BASE}/api/tribunal/batch/stream`, payload, (name, data) => {
+      if (name === 'turn') {
+        this.logEl?.appendChild(this.createLine(data.speaker, data.message));
+        this.updateHighlight(data.speaker, data.message);
+        if (this.logEl) this.logEl.scrollTop = this.logEl.scrollHeight;
+      } else if (name === 'error') {
+        // Later turns were refused; the done event still carries the ones played.
+        console.warn(`Tribunal batch cut short, retry in ${data.retry_after}s`, data.error);
+      } else if (name === 'done') {
+        result = data;
+      }
+    }, sessionHeaders());
+    if (!result) {
+      const error = new Error('Tribunal batch stream ended without a result');
+      error.received = received;
+      throw error;
+    }
+    return result;
+  }
+
+  async requestTurn(payload) {
+    const res = await fetch(`${API_BASE}/api/tribunal/act`, {
+      method: 'POST',
+      headers: sessionHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify(payload)
+    });
+    if (res.status === 409) {
+      return res.json();
+    }
+    if (!res.ok) {
+      console.error('Tribunal action failed');
+      return null;
+    }
+    return res.json();
+  }
+
+  // Render the NPC line as tokens arrive; resolves with the final turn payload.
+  async streamTurn(payload) {
+    let result = null;
+    let row = null;
+    let speaker = null;
+    let text = '';
+    if (payload.player_input && this.logEl) {
+      this.logEl.appendChild(this.createLine('Judge', payload.player_input));
+    }
+    const received = await postEventStream(`${API_BASE}/api/tribunal/act/stream`, payload, (name, data) => {
+      if (name === 'speaker') {
+        speaker = data.speaker;
+        row = this.createLine(speaker, '');
+        this.logEl?.appendChild(row);
+        this.updateHighlight(speaker, '');
+      } else if (name === 'token' && row) {
+        text += data.text;
+        row.querySelector('.line-text').textContent = text;
+        this.updateHighlight(speaker, text);
+        this.logEl.scrollTop = this.logEl.scrollHeight;
+      } else if (name === 'done') {
+        result = data;
+      }
+    }, sessionHeaders());
+    if (!result) {
+      const error = new Error('Tribunal stream ended without a result');
+      error.received = received;
+      throw error;
+    }
+    return result;
+  }
+
+  // A closed verdict ends the trial: announce it and lock the controls.
+  showVerdict(verdict) {
+    if (!verdict?.closed || this.verdict) return;
+    this.verdict = verdict;
+    const names = (ids) => (ids || []).map((id) => NPC_METADATA[id]?.name || id).join(' and ');
+    const text = verdict.status === 'solved'
+      ? `Case closed. The tribunal finds ${names(verdict.killers)} guilty.`
+      : `Wrong verdict. You accused ${names(verdict.accused)}, but the culprit was ${names(verdict.killers)}.`;
+    const row = this.createLine('baize', text);
+    row.classList.add('verdict', verdict.status);
+    this.logEl?.appendChild(row);
+    if (this.logEl) this.logEl.scrollTop = this.logEl.scrollHeight;
+    this.updateHighlight('baize', text);
+    this.setLoading(false);
+  }
+
   flashInput() {
     if (!this.inputEl) return;
     this.inputEl.classList.add('shake');
@@ -231,9 +486,11 @@ class TribunalUI {
   }
 
   setLoading(isLoading) {
-    this.actionButtons.forEach((btn) => (btn.disabled = isLoading));
-    if (this.submitBtn) this.submitBtn.disabled = isLoading;
-    if (this.speakerSelect) this.speakerSelect.disabled = isLoading;
+    const locked = isLoading || Boolean(this.verdict);
+    this.actionButtons.forEach((btn) => (btn.disabled = locked));
+    if (this.submitBtn) this.submitBtn.disabled = locked;
+    if (this.speakerSelect) this.speakerSelect.disabled = locked;
+    if (this.inputEl) this.inputEl.disabled = Boolean(this.verdict);
   }
 
   normalizeHistory(entries) {